@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""
+Checkpoints for long builds (rominfo.py build --checkpoint-interval, --resume).
+
+Rather than saving the whole merged DatData, which would briefly need as much memory again, a checkpoint is an
+append-only file of the DatData merged so far, one record per DAT, as zlib-compressed pickles with a length
+prefix. Records are appended by a background thread as DATs are merged, and every `interval` seconds the file is
+synced and a manifest is replaced, giving the file's committed length, the DATs whose records are all before it,
+and for delta builds the last DAT's game fingerprints. Anything after the committed length, such as a record cut
+short by the build being killed, is discarded on resume.
+
+merge_dat_data lets a record's later version win, so replaying the records in order rebuilds the merged DatData as
+it was when the checkpoint was committed. In a parallel build, the parts of a split DAT which completed before the
+checkpoint are replayed, then the DAT is processed again, giving the same records.
+"""
+
+from typing import Any, Iterator, Optional
+import os
+import json
+import time
+import zlib
+import pickle
+import queue
+import shutil
+import struct
+import threading
+
+DatData = dict[str, dict[str, dict[str, Any]]]
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_SUFFIX = ".checkpoint"
+MANIFEST_NAME = "manifest.json"
+RECORDS_NAME = "records.bin"
+DEFAULT_INTERVAL = 300
+# Records waiting to be written, beyond which merging waits for the writer, bounding the memory they hold
+QUEUE_SIZE = 8
+COMPRESSION_LEVEL = 1
+
+RECORD_LENGTH = struct.Struct("<Q")
+
+
+def get_checkpoint_dir(out_dir: str) -> str:
+    """Checkpoints are kept beside out_dir, which is replaced when the database is written."""
+    return os.path.normpath(out_dir) + CHECKPOINT_SUFFIX
+
+
+def dump(value: Any) -> bytes:
+    return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), COMPRESSION_LEVEL)
+
+
+def load(data: bytes) -> Any:
+    return pickle.loads(zlib.decompress(data))
+
+
+def load_manifest(checkpoint_dir: str) -> Optional[dict[str, Any]]:
+    path = os.path.join(checkpoint_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as manifest_file:
+        return json.load(manifest_file)
+
+
+def check_manifest(manifest: dict[str, Any], checkpoint_dir: str, dats: list[str]) -> None:
+    if manifest.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Checkpoint in {checkpoint_dir} is from another version, remove it to build from scratch")
+    if manifest["dats"] != [os.path.basename(dat_file) for dat_file in dats]:
+        raise ValueError(f"Checkpoint in {checkpoint_dir} is for different DATs, remove it to build from scratch")
+
+
+def iter_records(checkpoint_dir: str, length: int) -> Iterator[DatData]:
+    """Yield the DatData records in the first `length` bytes of a checkpoint's records file, in order."""
+    with open(os.path.join(checkpoint_dir, RECORDS_NAME), "rb") as records_file:
+        while records_file.tell() < length:
+            (size,) = RECORD_LENGTH.unpack(records_file.read(RECORD_LENGTH.size))
+            yield load(records_file.read(size))
+
+
+def get_fingerprints_name(length: int) -> str:
+    """Fingerprints are named for the commit they were written with, so they always match the manifest."""
+    return f"fingerprints-{length}.bin"
+
+
+class Checkpointer:
+    """
+    Writes a build's checkpoints in a background thread. DatData given to add must not be changed afterwards, as
+    it may not have been written yet. Errors in the thread are raised by the next call.
+    """
+
+    def __init__(self, checkpoint_dir: str, dats: list[str], interval: float = DEFAULT_INTERVAL, resume: bool = False):
+        self.checkpoint_dir = checkpoint_dir
+        self.dats = dats
+        self.interval = interval
+        self.manifest: dict[str, Any] = {
+            "version": CHECKPOINT_VERSION,
+            "dats": [os.path.basename(dat_file) for dat_file in dats],
+            "done": [],
+            "length": 0,
+            "fingerprints": None,
+        }
+        if resume and (manifest := load_manifest(checkpoint_dir)) is not None:
+            check_manifest(manifest, checkpoint_dir, dats)
+            self.manifest = manifest
+            print(f"Resuming from {checkpoint_dir}, with {len(manifest['done'])} of {len(dats)} DATs done")
+        else:
+            if resume:
+                print(f"No checkpoint in {checkpoint_dir}, starting from the first DAT")
+            if os.path.exists(checkpoint_dir):
+                shutil.rmtree(checkpoint_dir)
+            os.makedirs(checkpoint_dir)
+        records_path = os.path.join(checkpoint_dir, RECORDS_NAME)
+        open(records_path, "ab").close()
+        self.records_file = open(records_path, "r+b")
+        # Drop anything written after the last commit
+        self.records_file.truncate(self.manifest["length"])
+        self.records_file.seek(self.manifest["length"])
+        self.done = list(self.manifest["done"])
+        self.fingerprints: Optional[dict[bytes, str]] = None
+        self.changed = False
+        if self.manifest["length"] == 0:
+            # A new checkpoint, which can be resumed with nothing done
+            self.commit()
+        self.queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def get_done(self) -> set[str]:
+        """Return the DATs done as of the last commit, which are all those to be skipped when resuming."""
+        done = set(self.manifest["done"])
+        return set(dat_file for dat_file in self.dats if os.path.basename(dat_file) in done)
+
+    def iter_records(self) -> Iterator[DatData]:
+        return iter_records(self.checkpoint_dir, self.manifest["length"])
+
+    def load_fingerprints(self) -> Optional[dict[bytes, str]]:
+        """Return the game fingerprints of the last DAT done in a delta build, as of the last commit."""
+        if self.manifest["fingerprints"] is None:
+            return None
+        with open(os.path.join(self.checkpoint_dir, self.manifest["fingerprints"]), "rb") as fingerprints_file:
+            return load(fingerprints_file.read())
+
+    def put(self, item: tuple[str, Any]) -> None:
+        if self.error is not None:
+            raise self.error
+        self.queue.put(item)
+
+    def add(self, dat_data: DatData) -> None:
+        self.put(("data", dat_data))
+
+    def set_done(self, dat_file: str) -> None:
+        """Record that all of a DAT's records have been added."""
+        self.put(("done", os.path.basename(dat_file)))
+
+    def set_fingerprints(self, fingerprints: dict[bytes, str]) -> None:
+        self.put(("fingerprints", fingerprints))
+
+    def run(self) -> None:
+        last_commit = time.monotonic()
+        try:
+            while True:
+                # With nothing to commit, wait for the next item however long it takes
+                timeout = max(last_commit + self.interval - time.monotonic(), 0) if self.changed else None
+                try:
+                    kind, value = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    kind, value = "commit", None
+                if kind == "data":
+                    record = dump({key: table for key, table in value.items() if not key.startswith("_")})
+                    self.records_file.write(RECORD_LENGTH.pack(len(record)))
+                    self.records_file.write(record)
+                elif kind == "done":
+                    self.done.append(value)
+                elif kind == "fingerprints":
+                    self.fingerprints = value
+                self.changed = self.changed or kind in ("data", "done", "fingerprints")
+                if kind in ("commit", "close") or time.monotonic() - last_commit >= self.interval:
+                    if self.changed:
+                        self.commit()
+                    last_commit = time.monotonic()
+                if kind == "close":
+                    return
+        except BaseException as error:
+            self.error = error
+            # Unblock a put waiting for room in the queue
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+    def commit(self) -> None:
+        self.records_file.flush()
+        os.fsync(self.records_file.fileno())
+        manifest = dict(self.manifest, done=list(self.done), length=self.records_file.tell())
+        if self.fingerprints is not None:
+            manifest["fingerprints"] = get_fingerprints_name(manifest["length"])
+            with open(os.path.join(self.checkpoint_dir, manifest["fingerprints"]), "wb") as fingerprints_file:
+                fingerprints_file.write(dump(self.fingerprints))
+                fingerprints_file.flush()
+                os.fsync(fingerprints_file.fileno())
+            self.fingerprints = None
+        manifest_path = os.path.join(self.checkpoint_dir, MANIFEST_NAME)
+        with open(f"{manifest_path}.part", "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(f"{manifest_path}.part", manifest_path)
+        if self.manifest["fingerprints"] not in (None, manifest["fingerprints"]):
+            os.remove(os.path.join(self.checkpoint_dir, self.manifest["fingerprints"]))
+        self.manifest = manifest
+        self.changed = False
+        print(f"Checkpointed {len(self.done)} DATs to {self.checkpoint_dir}")
+
+    def close(self) -> None:
+        """Write everything added and commit it, so a build which fails while writing can resume from here."""
+        self.put(("close", None))
+        self.thread.join()
+        self.records_file.close()
+        if self.error is not None:
+            raise self.error
+
+    def remove(self) -> None:
+        shutil.rmtree(self.checkpoint_dir)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""
+Precomputed emulator compatibility, an optional stage of create_db.write.
+
+The versions of each emulator (MAME, FBA...) are ordered using sources.extract_mame_version and each game's
+supported versions stored as a bitmap over that order, along with the first and last supporting version. The
+inverse, a bitmap of the games each version supports, is stored too, so that finding the games common to several
+versions is a bitwise and. Game ids are too sparse to use as bit positions, so games are numbered in id order.
+
+CompatibilityIndex loads the bitmaps into Python integers and answers queries without touching the database.
+"""
+
+from typing import Any, Iterable, Iterator, Optional
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from .shared import db, sources
+
+DatTable = dict[str, dict[str, Any]]
+
+
+def to_bytes(bitmap: int) -> bytes:
+    return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+
+
+def from_bytes(value: bytes) -> int:
+    return int.from_bytes(value, "little")
+
+
+def iter_bits(bitmap: int) -> Iterator[int]:
+    """Yield the positions of the set bits in a bitmap, lowest first."""
+    while bitmap:
+        lowest = bitmap & -bitmap
+        yield lowest.bit_length() - 1
+        bitmap ^= lowest
+
+
+def get_version_order(emulators: DatTable) -> dict[str, list[int]]:
+    """Return emulator ids for each emulator name, ordered by version."""
+    order: dict[str, list[int]] = {}
+    for emulator in sorted(emulators.values(), key=lambda emulator: sources.extract_mame_version(emulator["version"])):
+        order.setdefault(emulator["name"], []).append(emulator["id"])
+    return order
+
+
+def get_compatibility(dat_data: dict[str, DatTable]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Build the emulator_compatibility and game_compatibility tables from DatData.
+    """
+    emulators = {emulator["id"]: emulator for emulator in dat_data["emulators"].values()}
+    order = get_version_order(dat_data["emulators"])
+    positions = {emulator_id: position for ids in order.values() for position, emulator_id in enumerate(ids)}
+    game_ids = sorted(set(game_emulator["game_id"] for game_emulator in dat_data["game_emulator"].values()))
+    game_positions = {game_id: position for position, game_id in enumerate(game_ids)}
+
+    emulator_games: dict[int, int] = {}
+    game_versions: dict[tuple[int, str], int] = {}
+    for game_emulator in dat_data["game_emulator"].values():
+        game_id, emulator_id = game_emulator["game_id"], game_emulator["emulator_id"]
+        emulator_games[emulator_id] = emulator_games.get(emulator_id, 0) | (1 << game_positions[game_id])
+        key = (game_id, emulators[emulator_id]["name"])
+        game_versions[key] = game_versions.get(key, 0) | (1 << positions[emulator_id])
+
+    emulator_rows = [
+        {
+            "emulator_id": emulator_id,
+            "name": name,
+            "version": emulators[emulator_id]["version"],
+            "position": position,
+            "games": to_bytes(emulator_games.get(emulator_id, 0)),
+        }
+        for name, ids in order.items()
+        for position, emulator_id in enumerate(ids)
+    ]
+    game_rows = [
+        {
+            "game_id": game_id,
+            "name": name,
+            "position": game_positions[game_id],
+            "versions": to_bytes(versions),
+            "first_emulator_id": order[name][(versions & -versions).bit_length() - 1],
+            "last_emulator_id": order[name][versions.bit_length() - 1],
+        }
+        for (game_id, name), versions in sorted(game_versions.items())
+    ]
+    return pd.DataFrame(emulator_rows), pd.DataFrame(game_rows)
+
+
+def write_compatibility(dat_data: dict[str, DatTable], engine: Any) -> None:
+    print("Writing emulator compatibility...")
+    emulator_df, game_df = get_compatibility(dat_data)
+    if emulator_df.empty:
+        print("  Skipping empty compatibility tables...")
+        return
+    emulator_df.to_sql(db.EmulatorCompatibility.__tablename__, con=engine, if_exists="replace", index=False)
+    game_df.to_sql(db.GameCompatibility.__tablename__, con=engine, if_exists="replace", index=False)
+
+
+class CompatibilityIndex:
+    """In-memory view of the compatibility tables of a built database."""
+
+    def __init__(self, session: Session):
+        self.versions: dict[str, list[str]] = {}
+        self.emulator_ids: dict[str, list[int]] = {}
+        self.emulator_games: dict[int, int] = {}
+        self.game_versions: dict[tuple[int, str], int] = {}
+        self.game_positions: dict[int, int] = {}
+        emulators = session.query(db.EmulatorCompatibility).order_by(
+            db.EmulatorCompatibility.name, db.EmulatorCompatibility.position
+        )
+        for emulator in emulators:
+            self.versions.setdefault(str(emulator.name), []).append(str(emulator.version))
+            self.emulator_ids.setdefault(str(emulator.name), []).append(int(emulator.emulator_id))  # type: ignore
+            self.emulator_games[int(emulator.emulator_id)] = from_bytes(emulator.games)  # type: ignore
+        for game in session.query(db.GameCompatibility):
+            self.game_versions[(int(game.game_id), str(game.name))] = from_bytes(game.versions)  # type: ignore
+            self.game_positions[int(game.game_id)] = int(game.position)  # type: ignore
+        self.game_ids = sorted(self.game_positions, key=self.game_positions.__getitem__)
+
+    def get_versions(self, game_id: int, name: str = "MAME") -> list[str]:
+        """Return the versions of an emulator supporting a game, in version order."""
+        versions = self.game_versions.get((game_id, name), 0)
+        return [self.versions[name][position] for position in iter_bits(versions)]
+
+    def get_first_version(self, game_id: int, name: str = "MAME") -> Optional[str]:
+        versions = self.game_versions.get((game_id, name), 0)
+        return self.versions[name][(versions & -versions).bit_length() - 1] if versions else None
+
+    def get_last_version(self, game_id: int, name: str = "MAME") -> Optional[str]:
+        versions = self.game_versions.get((game_id, name), 0)
+        return self.versions[name][versions.bit_length() - 1] if versions else None
+
+    def get_emulator_id(self, version: str, name: str = "MAME") -> int:
+        return self.emulator_ids[name][self.versions[name].index(version)]
+
+    def supports(self, game_id: int, emulator_id: int) -> bool:
+        if (position := self.game_positions.get(game_id)) is None:
+            return False
+        return bool(self.emulator_games.get(emulator_id, 0) >> position & 1)
+
+    def get_common_games(self, emulator_ids: Iterable[int]) -> list[int]:
+        """Return the ids of the games supported by every one of the given emulators."""
+        common = -1
+        for emulator_id in emulator_ids:
+            common &= self.emulator_games.get(emulator_id, 0)
+        return [self.game_ids[position] for position in iter_bits(common)] if common > 0 else []
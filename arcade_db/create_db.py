@@ -20,25 +20,32 @@ types.
 # TODO: Investigate and implement the use of the 'merge' attribute in Rom elements. Validate parameters for merge attributes.
 # TODO: Change calls to .first to .one_or_none or .one
 
-from typing import Optional, Any, Union
+from typing import Optional, Any, Union, Iterable, Iterator, Callable
 import os
+import re
+import sys
+import hashlib
+import time
 from pathlib import Path
 
 # from concurrent.futures import ProcessPoolExecutor, as_completed
 import multiprocessing
 import shutil
+import tempfile
 from copy import deepcopy
+from itertools import islice
 
 from lxml import etree as ET
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import inspect
 from sqlalchemy.sql.schema import Table
 
-from .shared import sources, utils, indexing
+from .shared import catalogue, sources, utils, indexing, db, progress
+from . import export, compatibility, search, shards, snapshot, scheduling, checkpoints, profiling
 
 SqlAlchemyTable = Union[Table, Any]
 
-DatData = dict[str, dict[str, dict[str, str]]]
+DatData = dict[str, dict[str, dict[str, Any]]]
 
 
 def create_dataframe_from_table(table: SqlAlchemyTable) -> pd.DataFrame:
@@ -49,6 +56,18 @@ def create_dataframe_from_table(table: SqlAlchemyTable) -> pd.DataFrame:
     return pd.DataFrame(columns=column_names)
 
 
+def create_dataframe(key: str, records: list[dict[str, Any]], columns: Optional[list[str]] = None) -> pd.DataFrame:
+    """
+    Integer columns with missing values, like game_emulator.driver_id, would otherwise be floats, which can't hold
+    63 bit ids, so these are nullable integers instead.
+    """
+    df = pd.DataFrame(records, columns=columns)
+    for name, is_integer in export.get_table_columns(key):
+        if is_integer and name in df and df[name].dtype != "int64":
+            df[name] = pd.array([record.get(name) for record in records], dtype="Int64")
+    return df
+
+
 def strip_keys(dict_: dict[str, Any]) -> list[str]:
     return [key for key in dict_.keys() if not key.startswith("_")]
 
@@ -68,14 +87,38 @@ def get_inner_element_text(outer_element: ET._Element, inner_element_name: str)
     return None
 
 
-def add_roms(rom_elements: list[ET._Element], dat_data: DatData, game_id: str) -> None:
+class HashTape:
+    """
+    The identity hashes computed while processing a game element, in order. Processing an identical element asks
+    for the same hashes in the same order, so a tape recorded for one can be replayed for the other rather than
+    hashing everything again. Hashes which depend on the emulator (game_emulator and its associations) aren't
+    recorded.
+    """
+
+    def __init__(self, hashes: Optional[list[str]] = None):
+        self.replaying = hashes is not None
+        self.hashes: list[str] = hashes if hashes is not None else []
+        self.position = 0
+
+    def get(self, compute: Callable[..., str], *args: Any) -> str:
+        if self.replaying:
+            value = self.hashes[self.position]
+            self.position += 1
+        else:
+            value = compute(*args)
+            self.hashes.append(value)
+        return value
+
+
+def add_roms(rom_elements: list[ET._Element], dat_data: DatData, game_id: str, tape: HashTape) -> None:
     for rom_element in rom_elements:
         name = rom_element.get("name", "")
         size = get_rom_size(rom_element)
         crc = rom_element.get("crc", "")
         sha1 = rom_element.get("sha1", None)
-        rom_hash = indexing.get_rom_index_hash(name, size, crc)
+        rom_hash = tape.get(indexing.get_rom_index_hash, name, size, crc)
         rom_attrs = {
+            "id": indexing.get_stable_id(rom_hash),
             "hash": rom_hash,
             "name": name,
             "size": size,
@@ -83,15 +126,22 @@ def add_roms(rom_elements: list[ET._Element], dat_data: DatData, game_id: str) -
             "sha1": sha1,
         }
         dat_data["roms"][rom_hash] = rom_attrs
-        composite_key = indexing.get_attributes_md5({"game_id": game_id, "rom_id": rom_hash})
-        dat_data["game_rom"][composite_key] = {"game_id": game_id, "rom_id": rom_hash}
+        composite_key = tape.get(indexing.get_attributes_md5, {"game_id": game_id, "rom_id": rom_hash})
+        dat_data["game_rom"][composite_key] = {
+            "game_id": indexing.get_stable_id(game_id),
+            "rom_id": rom_attrs["id"],
+        }
 
 
-def process_game(game_element: ET._Element, dat_data: DatData) -> Optional[dict[str, str]]:
+def process_game(
+    game_element: ET._Element, dat_data: DatData, tape: Optional[HashTape] = None
+) -> Optional[dict[str, Any]]:
+    tape = tape if tape is not None else HashTape()
     if rom_elements := utils.get_sub_elements(game_element, "rom"):
         name = game_element.get("name", "")
-        game_hash = indexing.get_game_index_from_elements(name, rom_elements)
+        game_hash = tape.get(indexing.get_game_index_from_elements, name, rom_elements)
         game_attrs = {
+            "id": indexing.get_stable_id(game_hash),
             "hash": game_hash,
             "name": name,
             "description": get_inner_element_text(game_element, "description"),
@@ -104,7 +154,7 @@ def process_game(game_element: ET._Element, dat_data: DatData) -> Optional[dict[
             "romof": game_element.get("romof"),
             "cloneof": game_element.get("cloneof"),
         }
-        add_roms(rom_elements, dat_data, game_hash)
+        add_roms(rom_elements, dat_data, game_hash, tape)
         return game_attrs
     return None
 
@@ -117,18 +167,19 @@ def get_feature_element_attributes(feature_element: ET._Element) -> dict[str, st
     }
 
 
-def add_features(game_emulator_attrs: dict[str, str], game_element: ET._Element, dat_data: DatData) -> None:
+def add_features(game_emulator_hash: str, game_element: ET._Element, dat_data: DatData, tape: HashTape) -> None:
     for feature_element in game_element.findall("feature"):
-        feature_attrs = get_feature_element_attributes(feature_element)
-        feature_hash = indexing.get_attributes_md5(feature_attrs)
+        feature_attrs: dict[str, Any] = get_feature_element_attributes(feature_element)
+        feature_hash = tape.get(indexing.get_attributes_md5, feature_attrs)
+        feature_attrs["id"] = indexing.get_stable_id(feature_hash)
         feature_attrs["hash"] = feature_hash
         dat_data["features"][feature_hash] = feature_attrs
         composite_key = indexing.get_attributes_md5(
-            {"game_emulator_id": game_emulator_attrs["hash"], "feature_id": feature_hash}
+            {"game_emulator_id": game_emulator_hash, "feature_id": feature_hash}
         )
         dat_data["game_emulator_feature"][composite_key] = {
-            "game_emulator_id": game_emulator_attrs["hash"],
-            "feature_id": feature_hash,
+            "game_emulator_id": indexing.get_stable_id(game_emulator_hash),
+            "feature_id": feature_attrs["id"],
         }
 
 
@@ -154,13 +205,16 @@ def get_driver_element_attributes(driver_element: ET._Element) -> dict[str, str]
 
 
 # TODO: Check for orphaned drivers after db build.
-def add_driver(game_emulator_attrs: dict[str, str], game_element: ET._Element, dat_data: DatData) -> None:
+def add_driver(
+    game_emulator_attrs: dict[str, Any], game_element: ET._Element, dat_data: DatData, tape: HashTape
+) -> None:
     if (driver_element := game_element.find("driver")) is not None:
-        driver_attrs = get_driver_element_attributes(driver_element)
-        driver_hash = indexing.get_attributes_md5(driver_attrs)
+        driver_attrs: dict[str, Any] = get_driver_element_attributes(driver_element)
+        driver_hash = tape.get(indexing.get_attributes_md5, driver_attrs)
+        driver_attrs["id"] = indexing.get_stable_id(driver_hash)
         driver_attrs["hash"] = driver_hash
         dat_data["drivers"][driver_hash] = driver_attrs
-        game_emulator_attrs["driver_id"] = driver_hash
+        game_emulator_attrs["driver_id"] = driver_attrs["id"]
 
 
 def get_disk_attributes(disk_element: ET._Element) -> dict[str, str]:
@@ -173,50 +227,156 @@ def get_disk_attributes(disk_element: ET._Element) -> dict[str, str]:
 
 # TODO: Can probably avoid using get_sub_elements.
 # TODO: Need a second index for sha1
-def add_disks(game_emulator_attrs: dict[str, str], game_element: ET._Element, dat_data: DatData):
+def add_disks(game_emulator_hash: str, game_element: ET._Element, dat_data: DatData, tape: HashTape):
     if disk_elements := utils.get_sub_elements(game_element, "disk"):
         for disk_element in disk_elements:
-            disk_attrs = get_disk_attributes(disk_element)
-            disk_hash = indexing.get_attributes_md5(disk_attrs)
+            disk_attrs: dict[str, Any] = get_disk_attributes(disk_element)
+            disk_hash = tape.get(indexing.get_attributes_md5, disk_attrs)
+            disk_attrs["id"] = indexing.get_stable_id(disk_hash)
             disk_attrs["hash"] = disk_hash
             dat_data["disks"][disk_hash] = disk_attrs
-            composite_key = indexing.get_attributes_md5(
-                {"game_emulator_id": game_emulator_attrs["hash"], "disk_id": disk_hash}
-            )
+            composite_key = indexing.get_attributes_md5({"game_emulator_id": game_emulator_hash, "disk_id": disk_hash})
             dat_data["game_emulator_disk"][composite_key] = {
-                "game_emulator_id": game_emulator_attrs["hash"],
-                "disk_id": disk_hash,
+                "game_emulator_id": indexing.get_stable_id(game_emulator_hash),
+                "disk_id": disk_attrs["id"],
             }
 
 
 def add_game_emulator_relationship(
-    game_element: ET._Element, game_attrs: dict[str, str], emulator_hash: str, dat_data: DatData
+    game_element: ET._Element,
+    game_attrs: dict[str, Any],
+    emulator_hash: str,
+    dat_data: DatData,
+    tape: Optional[HashTape] = None,
 ):
-    game_emulator_attrs = {"game_id": game_attrs["hash"], "emulator_id": emulator_hash}
     # We don't use the driver id as part of the primary key because we only want one game_emulator record per game/emulator
     # relationship. There is a risk here of orphaning driver records, which we need to check for elsewhere.
-    game_emulator_attrs["hash"] = indexing.get_attributes_md5(
-        {key: game_emulator_attrs[key] for key in ("game_id", "emulator_id")}
-    )
-    add_features(game_emulator_attrs, game_element, dat_data)
-    add_driver(game_emulator_attrs, game_element, dat_data)
-    add_disks(game_emulator_attrs, game_element, dat_data)
-    dat_data["game_emulator"][game_emulator_attrs["hash"]] = game_emulator_attrs
+    game_emulator_hash = indexing.get_attributes_md5({"game_id": game_attrs["hash"], "emulator_id": emulator_hash})
+    game_emulator_attrs = {
+        "id": indexing.get_stable_id(game_emulator_hash),
+        "game_id": game_attrs["id"],
+        "emulator_id": indexing.get_stable_id(emulator_hash),
+    }
+    tape = tape if tape is not None else HashTape()
+    add_features(game_emulator_hash, game_element, dat_data, tape)
+    add_driver(game_emulator_attrs, game_element, dat_data, tape)
+    add_disks(game_emulator_hash, game_element, dat_data, tape)
+    dat_data["game_emulator"][game_emulator_hash] = game_emulator_attrs
+
+
+def get_game_fingerprint(game_element: ET._Element) -> bytes:
+    """
+    A cheap digest of a game element's serialised XML (or of a sources.GameRecord's contents), identifying games
+    unchanged since an earlier DAT.
+    """
+    if isinstance(game_element, sources.GameRecord):
+        serialised = game_element.serialise()
+    else:
+        serialised = ET.tostring(game_element, with_tail=False)
+    return hashlib.blake2b(serialised, digest_size=16).digest()
+
+
+# Bytes per entry of a dict, beyond its key and value, allowing for the table being at most two-thirds full
+DICT_ENTRY_SIZE = 100
+
+
+class GameCache:
+    """
+    Hash tapes (see HashTape) for game elements already processed, by fingerprint: one recorded by process_game and
+    one by add_game_emulator_relationship, so a game seen in an earlier DAT processed by the same process isn't
+    hashed again. A MAME game's entry takes a few KB, so the cache is bounded by max_bytes (as estimated by
+    get_size), and is emptied when adding an entry would exceed them.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries: dict[bytes, tuple[list[str], list[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def get_size(fingerprint: bytes, game_hashes: list[str], link_hashes: list[str]) -> int:
+        """Estimate the bytes held by an entry, counting its hashes, which outlive the DatData they were made for."""
+        size = DICT_ENTRY_SIZE + sys.getsizeof(fingerprint) + sys.getsizeof((game_hashes, link_hashes))
+        for hashes in (game_hashes, link_hashes):
+            size += sys.getsizeof(hashes) + sum(sys.getsizeof(value) for value in hashes)
+        return size
+
+    def get(self, fingerprint: bytes) -> tuple[Optional[list[str]], Optional[list[str]]]:
+        return self.entries.get(fingerprint, (None, None))
+
+    def add(self, fingerprint: bytes, game_hashes: list[str], link_hashes: list[str]) -> None:
+        size = self.get_size(fingerprint, game_hashes, link_hashes)
+        if self.bytes + size > self.max_bytes:
+            self.entries.clear()
+            self.bytes = 0
+        if size <= self.max_bytes:
+            self.entries[fingerprint] = (game_hashes, link_hashes)
+            self.bytes += size
+
+
+def get_game_cache(game_cache_mb: Optional[float]) -> Optional[GameCache]:
+    return GameCache(int(game_cache_mb * 1024 * 1024)) if game_cache_mb is not None else None
+
 
+# A parallel build's workers each keep a cache across the jobs they run (see init_worker)
+GAME_CACHE: Optional[GameCache] = None
 
-def process_games(root: ET._Element, emulator_attrs: dict[str, str]) -> DatData:
+
+@profiling.profile_stage("process_games")
+def process_games(
+    game_elements: Iterable[ET._Element],
+    emulator_attrs: dict[str, str],
+    previous_fingerprints: Optional[dict[bytes, str]] = None,
+    game_cache: Optional[GameCache] = None,
+) -> DatData:
+    """
+    Process the game elements from a DAT root or sources.DatReader.iter_games.
+
+    With previous_fingerprints (game fingerprint to game hash, as left in "_fingerprints" by the previous DAT),
+    only games which are new or changed since then are fully processed. Unchanged games only get a game_emulator
+    link (with its features, driver and disks), since their game, rom and game_rom records are already in the
+    data being merged into.
+
+    With game_cache, games found in the cache have their records built from the cached hashes.
+    """
     dat_data = get_empty_dat_data()
     emulator_hash = emulator_attrs["id"]
-    emulator_attrs["hash"] = emulator_hash
-    dat_data["emulators"][emulator_hash] = emulator_attrs
+    dat_data["emulators"][emulator_hash] = dict(
+        emulator_attrs, id=indexing.get_stable_id(emulator_hash), hash=emulator_hash
+    )
+    fingerprints: Optional[dict[bytes, str]] = None
+    if previous_fingerprints is not None:
+        fingerprints = dat_data["_fingerprints"] = {}  # type: ignore
 
-    for game_element in root:
+    for game_element in game_elements:
         rom_elements = utils.get_sub_elements(game_element, "rom")
         if rom_elements:
-            game_attrs = process_game(game_element, dat_data)
+            fingerprint = b""
+            game_hashes, link_hashes = None, None
+            if fingerprints is not None or game_cache is not None:
+                fingerprint = get_game_fingerprint(game_element)
+            if game_cache is not None:
+                game_hashes, link_hashes = game_cache.get(fingerprint)
+            if fingerprints is not None and previous_fingerprints is not None:
+                if (game_hash := previous_fingerprints.get(fingerprint)) is not None:
+                    fingerprints[fingerprint] = game_hash
+                    game_ids = {"hash": game_hash, "id": indexing.get_stable_id(game_hash)}
+                    add_game_emulator_relationship(
+                        game_element, game_ids, emulator_hash, dat_data, HashTape(link_hashes)
+                    )
+                    continue
+            game_tape, link_tape = HashTape(game_hashes), HashTape(link_hashes)
+            game_attrs = process_game(game_element, dat_data, game_tape)
             if game_attrs is not None:
-                add_game_emulator_relationship(game_element, game_attrs, emulator_hash, dat_data)
+                add_game_emulator_relationship(game_element, game_attrs, emulator_hash, dat_data, link_tape)
                 dat_data["games"][game_attrs["hash"]] = game_attrs
+                if fingerprints is not None:
+                    fingerprints[fingerprint] = game_attrs["hash"]
+                if game_cache is not None and game_hashes is None:
+                    game_cache.add(fingerprint, game_tape.hashes, link_tape.hashes)
     return dat_data
 
 
@@ -224,14 +384,15 @@ def get_mame_emulator_details(dat_file: str) -> list[str]:
     emulator = os.path.basename(dat_file)
     for substring in (".dat", ".xml", ".bz2"):
         emulator = emulator.replace(substring, "")
-    return emulator.split()
+    # Original FBA DATs are named e.g. fba_029523.xml rather than FBA 029523.xml.bz2
+    return re.split(r"[\s_]", emulator, maxsplit=1)
 
 
 # Check emulator name as expected and that version matches expected format
 def get_emulator_attrs(dat_file: str) -> dict[str, str]:
     emulator_name, emulator_version = get_mame_emulator_details(dat_file)
     id = f"{emulator_name.lower()}{emulator_version}".replace(" ", "").replace(".", "_")
-    return {"id": id, "name": emulator_name, "version": str(emulator_version)}
+    return {"id": id, "name": emulator_name.upper(), "version": str(emulator_version)}
 
 
 def get_empty_dat_data() -> DatData:
@@ -249,137 +410,669 @@ def get_empty_dat_data() -> DatData:
     }
 
 
-def convert_hashes_to_ids(dat_data: DatData) -> DatData:
-    """
-    Convert hash-based keys to numeric auto-increment IDs before writing to database.
-    This is done at write time to minimize memory usage during processing.
-    """
-    print("Converting hash keys to numeric IDs...")
-    hash_to_id = {}  # type: ignore
-    next_id = {}
-
-    entity_tables = ["games", "roms", "emulators", "disks", "features", "drivers"]
-    for table in entity_tables:
-        hash_to_id[table] = {}
-        next_id[table] = 1
-        for hash_key, attrs in dat_data[table].items():
-            new_id = next_id[table]
-            hash_to_id[table][hash_key] = new_id
-            attrs["id"] = new_id  # type: ignore
-            next_id[table] += 1
-
-    hash_to_id["game_emulator"] = {}
-    next_id["game_emulator"] = 1
-    for hash_key, attrs in dat_data["game_emulator"].items():
-        new_id = next_id["game_emulator"]
-        hash_to_id["game_emulator"][hash_key] = new_id
-        attrs["id"] = new_id  # type: ignore
-        attrs["game_id"] = hash_to_id["games"][attrs["game_id"]]
-        attrs["emulator_id"] = hash_to_id["emulators"][attrs["emulator_id"]]
-        if "driver_id" in attrs:
-            attrs["driver_id"] = hash_to_id["drivers"][attrs["driver_id"]]
-        if "hash" in attrs:
-            del attrs["hash"]
-        next_id["game_emulator"] += 1
-
-    for attrs in dat_data["game_rom"].values():
-        attrs["game_id"] = hash_to_id["games"][attrs["game_id"]]
-        attrs["rom_id"] = hash_to_id["roms"][attrs["rom_id"]]
-
-    for attrs in dat_data["game_emulator_feature"].values():
-        attrs["game_emulator_id"] = hash_to_id["game_emulator"][attrs["game_emulator_id"]]
-        attrs["feature_id"] = hash_to_id["features"][attrs["feature_id"]]
-
-    for attrs in dat_data["game_emulator_disk"].values():
-        attrs["game_emulator_id"] = hash_to_id["game_emulator"][attrs["game_emulator_id"]]
-        attrs["disk_id"] = hash_to_id["disks"][attrs["disk_id"]]
-
-    for game_attrs in dat_data["games"].values():
-        if "cloneof_id" in game_attrs and game_attrs["cloneof_id"]:
-            game_attrs["cloneof_id"] = hash_to_id["games"].get(game_attrs["cloneof_id"])
-        if "romof_id" in game_attrs and game_attrs["romof_id"]:
-            game_attrs["romof_id"] = hash_to_id["games"].get(game_attrs["romof_id"])
-
-    print("Conversion complete.")
+ID_TABLES = ("games", "roms", "emulators", "disks", "features", "drivers", "game_emulator")
+
+
+@profiling.profile_stage("check_ids", snapshots=False)
+def check_ids(dat_data: DatData) -> None:
+    """
+    Check that no two records in a table share an id (see indexing.get_stable_id). With 63 bit ids this is
+    vanishingly unlikely, but it would silently merge records.
+    """
+    for key in ID_TABLES:
+        ids: dict[int, str] = {}
+        for hash_key, attrs in dat_data[key].items():
+            if (other_key := ids.setdefault(attrs["id"], hash_key)) != hash_key:
+                raise ValueError(f"{key} {hash_key} and {other_key} share id {attrs['id']}")
+
+
+HASH_COLUMNS = ("hash", "sha1", "md5")
+
+# Records per insert when writing from shards
+SPILL_BATCH_SIZE = 50_000
+
+
+@profiling.profile_stage("convert_to_binary_hashes")
+def convert_to_binary_hashes(dat_data: DatData) -> DatData:
+    """
+    Convert CRCs to integers and sha1s, md5s and identity hashes to raw digests. This roughly halves the size of
+    the roms table and its indexes, and lets lookups use ZipInfo.CRC as it is.
+    """
+    print("Converting hashes to binary...")
+    for key in strip_keys(dat_data):
+        for attrs in dat_data[key].values():
+            convert_record_hashes(key, attrs)
     return dat_data
 
 
-def write(dat_data: DatData, out_dir: str, csv: bool = False) -> None:
-    dat_data = convert_hashes_to_ids(dat_data)
+def convert_record_hashes(key: str, attrs: dict[str, Any]) -> None:
+    for column in HASH_COLUMNS:
+        if column in attrs:
+            attrs[column] = indexing.hex_to_bytes(attrs[column])
+    if key == "roms":
+        attrs["crc"] = indexing.crc_to_int(attrs["crc"])
+
+
+def write_build_info(engine: Any, hash_format: str) -> None:
+    build_info = pd.DataFrame([{"key": "hash_format", "value": hash_format}])
+    build_info.to_sql(db.BuildInfo.__tablename__, con=engine, if_exists="replace", index=False)
+    # A build with no dumped roms has no roms table to index (see write)
+    if hash_format == "binary" and inspect(engine).has_table("roms"):
+        crc_index = next(index for index in db.Base.metadata.tables["roms"].indexes if index.name == "idx_rom_crc_size")
+        crc_index.create(engine)
+
+
+# Optional stages adding derived tables to the database once the DAT tables are written
+STAGES: dict[str, Callable[[DatData, Any], None]] = {
+    "compatibility": compatibility.write_compatibility,
+    "snapshot": snapshot.write_snapshot,
+    "search": search.write_search_index,
+}
+
+
+@profiling.profile_stage("write", snapshots=False)
+def write(
+    dat_data: DatData,
+    out_dir: str,
+    exports: tuple[str, ...] = (),
+    hash_format: str = "hex",
+    stages: tuple[str, ...] = (),
+) -> None:
+    """
+    Write the database to out_dir/arcade.db, along with any optional exports (see export.EXPORTERS) and stages
+    (see STAGES). hash_format is "hex" or "binary" (see convert_to_binary_hashes). Exports always use hex.
+    """
+    check_ids(dat_data)
     if os.path.exists(out_dir):
         shutil.rmtree(out_dir)
     os.mkdir(out_dir)
-    engine = create_engine(f"sqlite:///{Path(out_dir, 'arcade.db')}")  # noqa: E231
+    export.export(dat_data, out_dir, exports)
+    if hash_format == "binary":
+        dat_data = convert_to_binary_hashes(dat_data)
+    engine = db.get_build_engine(str(Path(out_dir, "arcade.db")))
     for key in strip_keys(dat_data):
         print(f"Creating {key} dataframe...")
-        df = pd.DataFrame(list(dat_data[key].values()))
+        df = create_dataframe(key, list(dat_data[key].values()))
 
         # Skip empty dataframes - they would create invalid SQL
         if df.empty:
             print(f"  Skipping empty {key} dataframe...")
             continue
 
-        if csv:
-            print(f"Writing {key} dataframe to CSV...")
-            df.to_csv(Path(out_dir, f"{key}.csv"), index=False)
+        # Undumped roms have no CRC, which would otherwise turn the column into floats
+        if hash_format == "binary" and "crc" in df:
+            df["crc"] = df["crc"].astype("Int64")
+
         print(f"Writing {key} dataframe to sqlite...")
         df.to_sql(key, con=engine, if_exists="replace", index=False)
+        del df
+
+    write_build_info(engine, hash_format)
+    for stage in stages:
+        STAGES[stage](dat_data, engine)
+
 
+def check_table_ids(engine: Any, key: str) -> None:
+    """As check_ids, for a table already written to the database. SQLite groups on disk rather than in memory."""
+    with engine.connect() as connection:
+        duplicate = connection.exec_driver_sql(f"SELECT id FROM {key} GROUP BY id HAVING COUNT(*) > 1 LIMIT 1").first()
+    if duplicate is not None:
+        raise ValueError(f"{key} records share id {duplicate[0]}")
 
+
+def write_from_shards(
+    shard_dirs: list[str], out_dir: str, hash_format: str = "hex", batch_size: int = SPILL_BATCH_SIZE
+) -> None:
+    """
+    Write the database from shards or runs (see shards.write_shard), given in DAT order, with bounded memory. Each
+    table is k-way merged from the shards' sorted files and written batch_size records at a time, so however many
+    DATs there are, no more than a batch per table is held in memory. Exports and stages need the whole DatData so
+    aren't available here.
+    """
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.mkdir(out_dir)
+    engine = db.get_build_engine(str(Path(out_dir, "arcade.db")))
+    for key in shards.get_tables(shard_dirs):
+        print(f"Writing {key} from {len(shard_dirs)} shards to sqlite...")
+        columns = [column.name for column in db.Base.metadata.tables[key].columns]
+        records = (attrs for _, attrs in shards.iter_merged_table(shard_dirs, key))
+        if_exists = "replace"
+        while batch := list(islice(records, batch_size)):
+            if hash_format == "binary":
+                for attrs in batch:
+                    convert_record_hashes(key, attrs)
+            df = create_dataframe(key, batch, columns)
+            if hash_format == "binary" and "crc" in df:
+                df["crc"] = df["crc"].astype("Int64")
+            df.to_sql(key, con=engine, if_exists=if_exists, index=False)
+            if_exists = "append"
+            del df
+        # As in write, a table with no records isn't created
+        if key in ID_TABLES and if_exists == "append":
+            check_table_ids(engine, key)
+    write_build_info(engine, hash_format)
+
+
+def write_output(
+    dat_data: DatData,
+    out_dir: str,
+    dats: list[str],
+    exports: tuple[str, ...] = (),
+    hash_format: str = "hex",
+    stages: tuple[str, ...] = (),
+    shard: bool = False,
+) -> None:
+    """
+    Write the database, or with shard, a shard to be merged with others (see shards.merge_shards). Shards only
+    hold the DAT tables, so exports, hash_format and stages are for the merge, and are ignored with shard.
+    """
+    if shard:
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        shards.write_shard(dat_data, out_dir, dats)
+    else:
+        write(dat_data, out_dir, exports, hash_format, stages)
+
+
+def write_with_progress(
+    tracker: progress.BuildProgress,
+    dat_data: DatData,
+    out_dir: str,
+    dats: list[str],
+    exports: tuple[str, ...] = (),
+    hash_format: str = "hex",
+    stages: tuple[str, ...] = (),
+    shard: bool = False,
+) -> None:
+    """Call write_output, logging the time taken to tracker's event log."""
+    print("Writing output...")
+    start_time = time.perf_counter()
+    write_output(dat_data, out_dir, dats, exports=exports, hash_format=hash_format, stages=stages, shard=shard)
+    tracker.log_event("write", seconds=round(time.perf_counter() - start_time, 3))
+
+
+@profiling.profile_stage("merge_dat_data")
 def merge_dat_data(master_dat_data: DatData, dat_data: DatData) -> None:
     for key in strip_keys(dat_data):
         master_dat_data[key].update(deepcopy(dat_data[key]))
 
 
-def process_dats_consecutively(dats: list[str], out_dir: str):
+def get_duplicate_dats(dats: list[str], catalogue_path: Optional[str] = None) -> dict[str, list[str]]:
+    """
+    Return the DATs whose games (see catalogue.scan_dat) are identical to those of the DAT before them, grouped by
+    the first DAT of each run, which represents them. Only runs of consecutive DATs are collapsed, so merging
+    the duplicates' records at their representative's position gives the same result as processing them.
+    """
+    entries = catalogue.update_catalogue(dats, catalogue_path or catalogue.CATALOGUE_PATH)
+    duplicates: dict[str, list[str]] = {}
+    representative = ""
+    for i, dat_file in enumerate(dats):
+        if i and entries[dat_file]["games_digest"] == entries[dats[i - 1]]["games_digest"]:
+            duplicates.setdefault(representative, []).append(dat_file)
+        else:
+            representative = dat_file
+    return duplicates
+
+
+def link_duplicate_dat(dat_data: DatData, emulator_attrs: dict[str, str], records: Optional[DatData] = None) -> DatData:
+    """
+    Return DatData for a DAT whose games are identical to those of the DAT which dat_data was processed from. The
+    games, roms, features, drivers and disks are the same, so it only needs its emulator and game_emulator links
+    (with their features and disks), which are built from dat_data's. Identity hashes are looked up in records,
+    which defaults to dat_data but must include games which dat_data only links (see process_games).
+    """
+    records = records if records is not None else dat_data
+    linked = get_empty_dat_data()
+    emulator_hash = emulator_attrs["id"]
+    emulator_id = indexing.get_stable_id(emulator_hash)
+    linked["emulators"][emulator_hash] = dict(emulator_attrs, id=emulator_id, hash=emulator_hash)
+    hashes = {
+        key: {attrs["id"]: hash_key for hash_key, attrs in records[key].items()}
+        for key in ("games", "features", "disks")
+    }
+    game_emulator_hashes = {}
+    for game_emulator_attrs in dat_data["game_emulator"].values():
+        game_hash = hashes["games"][game_emulator_attrs["game_id"]]
+        game_emulator_hash = indexing.get_attributes_md5({"game_id": game_hash, "emulator_id": emulator_hash})
+        game_emulator_hashes[game_emulator_attrs["id"]] = game_emulator_hash
+        linked["game_emulator"][game_emulator_hash] = dict(
+            game_emulator_attrs, id=indexing.get_stable_id(game_emulator_hash), emulator_id=emulator_id
+        )
+    for key, table, column in (
+        ("game_emulator_feature", "features", "feature_id"),
+        ("game_emulator_disk", "disks", "disk_id"),
+    ):
+        for link in dat_data[key].values():
+            game_emulator_hash = game_emulator_hashes[link["game_emulator_id"]]
+            composite_key = indexing.get_attributes_md5(
+                {"game_emulator_id": game_emulator_hash, column: hashes[table][link[column]]}
+            )
+            linked[key][composite_key] = {
+                "game_emulator_id": indexing.get_stable_id(game_emulator_hash),
+                column: link[column],
+            }
+    return linked
+
+
+def report_duplicates(collapsed: list[tuple[str, str, float]]) -> None:
+    """Print the (duplicate, representative, seconds saved) DATs collapsed by get_duplicate_dats."""
+    if not collapsed:
+        return
+    print(f"Collapsed {len(collapsed)} duplicate DATs, saving about {sum(saved for *_, saved in collapsed):.1f}s:")
+    for dat_file, representative, saved in collapsed:
+        print(f"  {os.path.basename(dat_file)} -> {os.path.basename(representative)} ({saved:.1f}s)")
+
+
+def process_dats_consecutively(
+    dats: list[str],
+    out_dir: str,
+    *,
+    exports: tuple[str, ...] = (),
+    hash_format: str = "hex",
+    stages: tuple[str, ...] = (),
+    shard: bool = False,
+    delta: bool = False,
+    skip_duplicates: bool = False,
+    progress_log: Optional[str] = None,
+    checkpoint_interval: Optional[float] = None,
+    resume: bool = False,
+    game_cache_mb: Optional[float] = None,
+):
+    """
+    With delta, each DAT is compared with the one before it, game by game, and only new or changed games are
+    fully processed (see process_games). Consecutive versions of an emulator share most of their games, so DATs
+    should be in version order, as in sources.BUILD_DATS.
+
+    With skip_duplicates, DATs with the same games as the DAT before them aren't read at all, but linked to its
+    games (see get_duplicate_dats).
+
+    With checkpoint_interval (seconds) or resume, see start_checkpoints.
+
+    With game_cache_mb, games seen in earlier DATs have their hashes replayed from a cache of up to that size (see
+    GameCache).
+    """
     master_dat_data = get_empty_dat_data()
+    game_cache = get_game_cache(game_cache_mb)
+    fingerprints: Optional[dict[bytes, str]] = {} if delta else None
+    checkpointer, done = start_checkpoints(master_dat_data, out_dir, dats, checkpoint_interval, resume)
+    if delta and checkpointer is not None:
+        fingerprints = checkpointer.load_fingerprints() or {}
+    duplicates = get_duplicate_dats(dats) if skip_duplicates else {}
+    duplicates = {dat_file: dat_files for dat_file, dat_files in duplicates.items() if dat_file not in done}
+    skipped = done | set(dat_file for dat_files in duplicates.values() for dat_file in dat_files)
+    collapsed = []
+    tracker = progress.BuildProgress([dat_file for dat_file in dats if dat_file not in skipped], progress_log)
 
     for i, dat_file in enumerate(dats):
+        if dat_file in skipped:
+            continue
+        start_time = time.perf_counter()
         emulator_attrs = get_emulator_attrs(dat_file)
-        root = sources.get_dat_root(dat_file)
-        if root is not None:
-            dat_data = process_games(root, emulator_attrs)
-            root.clear()
-            merge_dat_data(master_dat_data, dat_data)
+        reader = sources.get_dat_reader(dat_file)
+        dat_data = process_games(reader.iter_games(), emulator_attrs, fingerprints, game_cache)
+        if delta:
+            fingerprints = dat_data.pop("_fingerprints")  # type: ignore
+            print(f"{len(dat_data['games'])} of {len(dat_data['game_emulator'])} games new or changed in {dat_file}")
+        merge_dat_data(master_dat_data, dat_data)
+        seconds = time.perf_counter() - start_time
+        tracker.update(dat_file, get_progress_stats(dat_data, reader.bytes_read, seconds))
+        linked_dat_data = []
+        for duplicate in duplicates.get(dat_file, []):
+            start_time = time.perf_counter()
+            linked_dat_data.append(link_duplicate_dat(dat_data, get_emulator_attrs(duplicate), master_dat_data))
+            merge_dat_data(master_dat_data, linked_dat_data[-1])
+            collapsed.append((duplicate, dat_file, seconds - (time.perf_counter() - start_time)))
+        if checkpointer is not None:
+            # The checkpointer writes the DatData in the background, so it's left to be freed once written
+            for checkpoint_dat_data in (dat_data, *linked_dat_data):
+                checkpointer.add(checkpoint_dat_data)
+            if fingerprints is not None:
+                checkpointer.set_fingerprints(fingerprints)
+            for done_file in (dat_file, *duplicates.get(dat_file, [])):
+                checkpointer.set_done(done_file)
+        else:
             for key in dat_data:
                 dat_data[key].clear()
             dat_data.clear()
-            dat_data = {}
+        dat_data = {}
         utils.log_memory(f"Processed game {dat_file} - ")
-    write(master_dat_data, out_dir, csv=True)
+    tracker.finish()
+    report_duplicates(collapsed)
+    write_checkpointed(
+        checkpointer,
+        tracker,
+        master_dat_data,
+        out_dir,
+        dats,
+        exports=exports,
+        hash_format=hash_format,
+        stages=stages,
+        shard=shard,
+    )
+    if profiling.is_enabled():
+        profiling.report({"parent": profiling.take_profile()}, out_dir)
+
+
+def start_checkpoints(
+    master_dat_data: DatData, out_dir: str, dats: list[str], interval: Optional[float], resume: bool
+) -> tuple[Optional[checkpoints.Checkpointer], set[str]]:
+    """
+    With an interval (seconds), start checkpointing the build to a directory beside out_dir (see
+    checkpoints.Checkpointer). With resume, the DatData merged as of the last checkpoint is merged into
+    master_dat_data, and checkpointing continues, by default every checkpoints.DEFAULT_INTERVAL seconds. Return
+    the checkpointer, if any, and the DATs done, which are to be skipped.
+    """
+    if interval is None and not resume:
+        return None, set()
+    checkpoint_dir = checkpoints.get_checkpoint_dir(out_dir)
+    checkpointer = checkpoints.Checkpointer(checkpoint_dir, dats, interval or checkpoints.DEFAULT_INTERVAL, resume)
+    for dat_data in checkpointer.iter_records():
+        # Records are already copies, so they are merged as they are
+        for key in strip_keys(dat_data):
+            master_dat_data[key].update(dat_data[key])
+    return checkpointer, checkpointer.get_done()
+
+
+def write_checkpointed(
+    checkpointer: Optional[checkpoints.Checkpointer],
+    tracker: progress.BuildProgress,
+    dat_data: DatData,
+    out_dir: str,
+    dats: list[str],
+    exports: tuple[str, ...] = (),
+    hash_format: str = "hex",
+    stages: tuple[str, ...] = (),
+    shard: bool = False,
+) -> None:
+    """
+    Call write_with_progress, first committing any checkpoint, so a build which fails while writing can resume
+    with every DAT done. The checkpoint is removed once the output is written.
+    """
+    if checkpointer is not None:
+        checkpointer.close()
+    write_with_progress(
+        tracker, dat_data, out_dir, dats, exports=exports, hash_format=hash_format, stages=stages, shard=shard
+    )
+    if checkpointer is not None:
+        checkpointer.remove()
+
 
+def get_progress_stats(dat_data: DatData, bytes_read: int, seconds: float) -> progress.ProgressStats:
+    """Return the stats for progress.BuildProgress.update of processing a DAT, or part of one, in this process."""
+    return {"games": len(dat_data["game_emulator"]), "bytes": bytes_read, "seconds": seconds, "worker": os.getpid()}
 
-def dat_worker(dat_file):
-    emulator_attrs = get_emulator_attrs(dat_file)
-    root = sources.get_dat_root(dat_file)
-    if root is not None:
-        utils.log_memory(f"Before process_games - {dat_file}")
-        dat_data = process_games(root, emulator_attrs)
-        root.clear()
-        return dat_data
-    return get_empty_dat_data()
 
+def dat_part_worker(job: tuple[str, Optional[bytes]]) -> DatData:
+    """Process a job from iter_dat_jobs in a parallel build's worker, with the worker's game cache, if any."""
+    dat_file, part = job
+    return process_dat_part(dat_file, part, GAME_CACHE)
 
-def process_dats_parallel(dats: list[str], out_dir: str, num_processes: int = 4):
-    """Process DAT files in parallel using multiprocessing."""
+
+def process_dat_part(dat_file: str, part: Optional[bytes], game_cache: Optional[GameCache] = None) -> DatData:
+    """
+    Process a whole DAT, or with a part (see sources.split_xml_dat), just that part of it. The progress stats (see
+    get_progress_stats), and for a whole DAT the worker's peak memory (for scheduling.record_peak), are returned in
+    the "_stats" key.
+    """
+    start_time = time.perf_counter()
+    if part is None:
+        start_memory = utils.log_memory(f"Before process_games - {dat_file}")
+        reader = sources.get_dat_reader(dat_file)
+        dat_data = process_games(reader.iter_games(), get_emulator_attrs(dat_file), game_cache=game_cache)
+        # The peak is the process's, so after a larger DAT this overestimates, which is the safe direction
+        stats = {"peak_mb": utils.get_peak_memory() - start_memory}
+        bytes_read = reader.bytes_read
+    else:
+        dat_data = process_games(sources.iter_part_games(part), get_emulator_attrs(dat_file), game_cache=game_cache)
+        stats = {}
+        bytes_read = len(part)
+    stats.update(get_progress_stats(dat_data, bytes_read, time.perf_counter() - start_time))
+    dat_data["_stats"] = {dat_file: stats}
+    if profiling.is_enabled():
+        dat_data["_allocations"] = profiling.take_profile()
+    return dat_data
+
+
+def init_worker(
+    parse_engine: str, profile_snapshot_every: Optional[int] = None, game_cache_mb: Optional[float] = None
+) -> None:
+    """
+    Initialise a pool worker with the parent's parse engine, if the parent is profiling, profiling, and with
+    game_cache_mb, a game cache of that size.
+    """
+    global GAME_CACHE
+    sources.set_parse_engine(parse_engine)
+    GAME_CACHE = get_game_cache(game_cache_mb)
+    if profile_snapshot_every is not None:
+        profiling.enable(profile_snapshot_every)
+
+
+def iter_dat_jobs(
+    dats: list[str], split_size: Optional[int], parts: int, tracker: Optional[progress.BuildProgress] = None
+) -> Iterator[tuple[str, Optional[bytes]]]:
+    """
+    Yield a job per DAT for dat_part_worker, except that XML DATs of at least split_size bytes (as stored) are
+    decompressed and split into `parts` jobs. These are the DATs which would otherwise set a parallel build's
+    minimum time. The parts of a DAT are partial DatData for the same emulator, so they can be merged like DATs.
+    Splits are recorded in tracker, which counts a DAT done once all its parts are.
+    """
+    for dat_file in dats:
+        if split_size is None or os.path.getsize(dat_file) < split_size or sources.get_dat_format(dat_file) != "xml":
+            yield dat_file, None
+            continue
+        dat_parts = sources.split_xml_dat(sources.get_xml_contents(dat_file), parts)
+        print(f"Split {dat_file} into {len(dat_parts)} parts")
+        if tracker is not None:
+            tracker.split(dat_file, len(dat_parts))
+        for part in dat_parts:
+            yield dat_file, part
+
+
+def record_result_stats(
+    dat_data: DatData,
+    tracker: progress.BuildProgress,
+    history: scheduling.MemoryHistory,
+    seconds: dict[str, float],
+    worker_profile: profiling.Profile,
+) -> list[str]:
+    """
+    Remove a parallel build result's stats and allocation profile, recording its progress, peak memory, the time
+    taken for its DAT and its allocations. Return the DATs it completed (the last part, for a split DAT).
+    """
+    completed = []
+    profiling.merge_profiles(worker_profile, dat_data.pop("_allocations", {}))  # type: ignore
+    for dat_file, stats in dat_data.pop("_stats", {}).items():
+        seconds[dat_file] = seconds.get(dat_file, 0) + stats["seconds"]
+        if "peak_mb" in stats:
+            scheduling.record_peak(history, dat_file, stats["peak_mb"])
+        tracker.update(dat_file, stats)
+        if tracker.is_done(dat_file):
+            completed.append(dat_file)
+    return completed
+
+
+def merge_result(
+    master_dat_data: DatData, dat_data: DatData, duplicates: list[str], linking_seconds: dict[str, float]
+) -> list[DatData]:
+    """
+    Merge a parallel build's result, followed by DatData linking any duplicates of its DAT to its games (see
+    link_duplicate_dat), adding the time taken linking each to linking_seconds. Return all the DatData merged.
+    """
+    merge_dat_data(master_dat_data, dat_data)
+    merged = [dat_data]
+    for duplicate in duplicates:
+        start_time = time.perf_counter()
+        merged.append(link_duplicate_dat(dat_data, get_emulator_attrs(duplicate)))
+        merge_dat_data(master_dat_data, merged[-1])
+        linking_seconds[duplicate] = linking_seconds.get(duplicate, 0) + time.perf_counter() - start_time
+    return merged
+
+
+def process_dats_parallel(
+    dats: list[str],
+    out_dir: str,
+    num_processes: int = 4,
+    *,
+    exports: tuple[str, ...] = (),
+    hash_format: str = "hex",
+    stages: tuple[str, ...] = (),
+    shard: bool = False,
+    split_size: Optional[int] = None,
+    memory_budget: Optional[float] = None,
+    max_tasks_per_child: Optional[int] = None,
+    skip_duplicates: bool = False,
+    progress_log: Optional[str] = None,
+    checkpoint_interval: Optional[float] = None,
+    resume: bool = False,
+    game_cache_mb: Optional[float] = None,
+):
+    """
+    Process DAT files in parallel using multiprocessing. DATs of at least split_size bytes are split into a part
+    per process (see iter_dat_jobs).
+
+    With a memory_budget (MB), jobs are only started while the estimated peaks of the running jobs fit in it (see
+    scheduling.imap_budgeted). Each DAT's measured peak is kept in out_dir for the next build's estimates. Workers
+    are replaced after max_tasks_per_child jobs, which returns their fragmented heaps to the OS, at the cost of
+    their game caches.
+
+    With game_cache_mb, each worker keeps a game cache of up to that size across the DATs it processes (see
+    GameCache).
+
+    With skip_duplicates, DATs with the same games as the DAT before them are linked to its games rather than
+    processed (see get_duplicate_dats).
+
+    With checkpoint_interval (seconds) or resume, see start_checkpoints. The parts of a split DAT are checkpointed
+    as they are merged, but the DAT is only done, and skipped when resuming, once all its parts are.
+    """
     master_dat_data = get_empty_dat_data()
     print(f"Processing {len(dats)} DAT files using {num_processes} processes...")
     initial_memory = utils.log_memory("Initial memory (parallel processing):")
-
-    with multiprocessing.Pool(processes=num_processes) as pool:
-        # Use imap_unordered to consume results as they complete
-        for i, dat_data in enumerate(pool.imap_unordered(dat_worker, dats)):
+    history_path = scheduling.get_history_path(out_dir)
+    history = scheduling.load_memory_history(history_path)
+    checkpointer, done = start_checkpoints(master_dat_data, out_dir, dats, checkpoint_interval, resume)
+    duplicates = get_duplicate_dats(dats) if skip_duplicates else {}
+    duplicates = {dat_file: dat_files for dat_file, dat_files in duplicates.items() if dat_file not in done}
+    skipped = done | set(dat_file for dat_files in duplicates.values() for dat_file in dat_files)
+    # Results carry their emulator rather than their DAT, and the parts of a split DAT each link their own games
+    representatives = {get_emulator_attrs(dat_file)["id"]: dat_file for dat_file in duplicates}
+    seconds: dict[str, float] = {}
+    linking_seconds: dict[str, float] = {}
+    worker_profile: profiling.Profile = {}
+    processed = [dat_file for dat_file in dats if dat_file not in skipped]
+    tracker = progress.BuildProgress(processed, progress_log)
+
+    # Workers forked from this process later in the build would share, and then copy, the merged DatData
+    context = multiprocessing.get_context("forkserver" if max_tasks_per_child else None)
+    worker_init = (
+        sources.PARSE_ENGINE,
+        profiling.SNAPSHOT_EVERY_CALLS if profiling.is_enabled() else None,
+        game_cache_mb,
+    )
+    with context.Pool(num_processes, init_worker, worker_init, max_tasks_per_child) as pool:
+        jobs = iter_dat_jobs(processed, split_size, num_processes, tracker)
+        if memory_budget is None:
+            # Use imap_unordered to consume results as they complete
+            results: Iterator[DatData] = pool.imap_unordered(dat_part_worker, jobs)
+        else:
+            print(f"Scheduling DATs within a memory budget of {memory_budget}MB")
+            estimated_jobs = (
+                ((dat_file, part), scheduling.estimate_memory(dat_file, history, part)) for dat_file, part in jobs
+            )
+            results = scheduling.imap_budgeted(pool, dat_part_worker, estimated_jobs, num_processes, memory_budget)
+        for i, dat_data in enumerate(results):
+            completed = record_result_stats(dat_data, tracker, history, seconds, worker_profile)
             if dat_data:
-                print(f"Merging result {i+1}/{len(dats)}...")
-                merge_dat_data(master_dat_data, dat_data)
-                for key in dat_data:
-                    dat_data[key].clear()
-                dat_data.clear()
-                del dat_data
+                print(f"Merging result {i+1} ({len(dats)} DATs)...")
+                (emulator_hash,) = dat_data["emulators"]
+                dat_duplicates = duplicates.get(representatives.get(emulator_hash, ""), [])
+                merged = merge_result(master_dat_data, dat_data, dat_duplicates, linking_seconds)
+                if checkpointer is not None:
+                    # The checkpointer writes the DatData in the background, so it's left to be freed once written
+                    for merged_dat_data in merged:
+                        checkpointer.add(merged_dat_data)
+                else:
+                    for key in dat_data:
+                        dat_data[key].clear()
+                    dat_data.clear()
+                del dat_data, merged
                 if (i + 1) % 10 == 0:
-                    utils.log_memory(f"Processed {i+1}/{len(dats)} files - ")
+                    utils.log_memory(f"Processed {i+1} results - ")
+            if checkpointer is not None:
+                for dat_file in completed:
+                    for done_file in (dat_file, *duplicates.get(dat_file, [])):
+                        checkpointer.set_done(done_file)
 
+    tracker.finish()
     final_memory = utils.log_memory("Final memory:")
     print(f"Total memory growth: {final_memory - initial_memory:.2f} MB")  # noqa: E231
+    # Each duplicate saved its representative's processing time (over all its parts), less the time linking it
+    report_duplicates(
+        [
+            (duplicate, representative, seconds[representative] - linking_seconds[duplicate])
+            for representative, dat_files in duplicates.items()
+            for duplicate in dat_files
+        ]
+    )
 
-    write(master_dat_data, out_dir, csv=True)
+    write_checkpointed(
+        checkpointer,
+        tracker,
+        master_dat_data,
+        out_dir,
+        dats,
+        exports=exports,
+        hash_format=hash_format,
+        stages=stages,
+        shard=shard,
+    )
+    # write_output replaces out_dir
+    scheduling.save_memory_history(history_path, history)
+    if profiling.is_enabled():
+        profiling.report({"parent": profiling.take_profile(), "workers": worker_profile}, out_dir)
+
+
+def spill_worker(job: tuple[str, str]) -> dict[str, progress.ProgressStats]:
+    dat_file, run_dir = job
+    # Without a game cache, as memory is bounded by the largest DAT
+    dat_data = process_dat_part(dat_file, None)
+    stats = dat_data.pop("_stats")
+    shards.write_shard(dat_data, run_dir, [dat_file])
+    return stats
+
+
+def process_dats_spilled(
+    dats: list[str],
+    out_dir: str,
+    num_processes: int = 1,
+    *,
+    hash_format: str = "hex",
+    progress_log: Optional[str] = None,
+):
+    """
+    Build with memory bounded by the largest DAT rather than the whole collection. Each DAT's records are written
+    to a sorted run on disk as soon as they are processed (see shards.write_shard), rather than merged in memory,
+    and the database is written from the runs by write_from_shards. Runs go in a temporary directory, which can
+    be moved with the TMPDIR environment variable.
+    """
+    with tempfile.TemporaryDirectory(prefix="arcade-runs-") as runs_dir:
+        run_dirs = [os.path.join(runs_dir, f"{i:05d}") for i in range(len(dats))]
+        jobs = list(zip(dats, run_dirs))
+        print(f"Spilling {len(dats)} DAT files to {runs_dir} using {num_processes} processes...")
+        tracker = progress.BuildProgress(dats, progress_log)
+        if num_processes > 1:
+            with multiprocessing.Pool(num_processes, sources.set_parse_engine, (sources.PARSE_ENGINE,)) as pool:
+                results: Iterator[dict[str, progress.ProgressStats]] = pool.imap_unordered(spill_worker, jobs)
+                for i, stats in enumerate(results):
+                    for dat_file, dat_stats in stats.items():
+                        tracker.update(dat_file, dat_stats)
+                    utils.log_memory(f"Spilled {i+1}/{len(dats)} {dat_file} - ")
+        else:
+            for i, job in enumerate(jobs):
+                for dat_file, dat_stats in spill_worker(job).items():
+                    tracker.update(dat_file, dat_stats)
+                utils.log_memory(f"Spilled {i+1}/{len(dats)} {job[0]} - ")
+        tracker.finish()
+        start_time = time.perf_counter()
+        write_from_shards(run_dirs, out_dir, hash_format)
+        tracker.log_event("write", seconds=round(time.perf_counter() - start_time, 3))
@@ -13,7 +13,7 @@ parser.add_argument("divisor", type=int, help="Divisor")
 parser.add_argument("dat_type", type=str, help="Dat Type")
 args = parser.parse_args()
 
-total_dats = len(sources.SORTED_DATS[args.dat_type])
+total_dats = len(sources.BUILD_DATS[args.dat_type])
 
 total_jobs = math.ceil(total_dats / args.divisor)
 
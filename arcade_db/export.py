@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+"""
+Optional export stages run by create_db.write after the SQLite database is written.
+
+The columnar formats (Parquet and Arrow IPC) are typed using the SQLAlchemy models in shared.db, so CRCs stay
+strings and ids stay integers, and are streamed from DatData in row groups. Repeated string values (names,
+manufacturers, driver statuses...) are dictionary-encoded. These need pyarrow, which isn't needed for a normal
+build.
+"""
+
+from typing import Any, Callable, Iterator, Optional
+import os
+from itertools import islice
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import Integer
+
+from .shared import db
+
+DatTable = dict[str, dict[str, Any]]
+
+ROW_GROUP_SIZE = 100_000
+
+# Unique per row, so a dictionary would be as large as the column itself
+UNDICTIONARIED_COLUMNS = set(["hash", "sha1", "md5"])
+
+# Years in DATs include values like '19??', despite the model's Integer type
+STRING_COLUMNS = set(["year"])
+
+
+def get_table_columns(key: str) -> list[tuple[str, bool]]:
+    """Return (column name, is integer) pairs for a table, from its SQLAlchemy model."""
+    table = db.Base.metadata.tables[key]
+    return [
+        (column.name, isinstance(column.type, Integer) and column.name not in STRING_COLUMNS)
+        for column in table.columns
+    ]
+
+
+def iter_row_groups(rows: DatTable, row_group_size: int) -> Iterator[list[dict[str, Any]]]:
+    values = iter(rows.values())
+    while row_group := list(islice(values, row_group_size)):
+        yield row_group
+
+
+class DictionaryEncoder:
+    """
+    Encodes a string column against a dictionary which only grows, so each row group's dictionary is a prefix of
+    the next. Arrow IPC files only allow dictionary deltas, not replacements, between batches.
+
+    The dictionary starts with an empty string because growing an empty dictionary (from a row group where a
+    column is entirely null) also counts as a replacement.
+    """
+
+    def __init__(self):
+        self.indices: dict[str, int] = {"": 0}
+        self.values: list[str] = [""]
+
+    def encode(self, values: list[Any]) -> tuple[list[Optional[int]], list[str]]:
+        encoded: list[Optional[int]] = []
+        for value in values:
+            if value is None:
+                encoded.append(None)
+                continue
+            value = str(value)
+            if (index := self.indices.get(value)) is None:
+                index = self.indices[value] = len(self.values)
+                self.values.append(value)
+            encoded.append(index)
+        return encoded, self.values
+
+
+def get_arrow_schema(key: str):
+    import pyarrow as pa
+
+    fields = []
+    for name, is_integer in get_table_columns(key):
+        if is_integer:
+            fields.append(pa.field(name, pa.int64()))
+        elif name in UNDICTIONARIED_COLUMNS:
+            fields.append(pa.field(name, pa.string()))
+        else:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+    return pa.schema(fields)
+
+
+def iter_record_batches(key: str, rows: DatTable, row_group_size: int) -> Iterator:
+    import pyarrow as pa
+
+    schema = get_arrow_schema(key)
+    encoders = {field.name: DictionaryEncoder() for field in schema if pa.types.is_dictionary(field.type)}
+    for row_group in iter_row_groups(rows, row_group_size):
+        arrays = []
+        for field in schema:
+            values = [row.get(field.name) for row in row_group]
+            if field.name in encoders:
+                indices, dictionary = encoders[field.name].encode(values)
+                arrays.append(
+                    pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(dictionary, pa.string()))
+                )
+            elif pa.types.is_integer(field.type):
+                arrays.append(pa.array([None if value is None else int(value) for value in values], field.type))
+            else:
+                arrays.append(pa.array([None if value is None else str(value) for value in values], field.type))
+        yield pa.record_batch(arrays, schema=schema)
+
+
+def export_parquet(key: str, rows: DatTable, out_dir: str, row_group_size: int = ROW_GROUP_SIZE) -> None:
+    import pyarrow.parquet as pq
+
+    with pq.ParquetWriter(Path(out_dir, f"{key}.parquet"), get_arrow_schema(key), compression="zstd") as writer:
+        for batch in iter_record_batches(key, rows, row_group_size):
+            writer.write_batch(batch, row_group_size=row_group_size)
+
+
+def export_arrow(key: str, rows: DatTable, out_dir: str, row_group_size: int = ROW_GROUP_SIZE) -> None:
+    import pyarrow.ipc as ipc
+
+    options = ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+    with ipc.new_file(str(Path(out_dir, f"{key}.arrow")), get_arrow_schema(key), options=options) as writer:
+        for batch in iter_record_batches(key, rows, row_group_size):
+            writer.write_batch(batch)
+
+
+def export_csv(key: str, rows: DatTable, out_dir: str, row_group_size: int = ROW_GROUP_SIZE) -> None:
+    """
+    Be careful opening these in a spreadsheet: CRCs consisting only of digits are interpreted as numbers.
+    """
+    path = Path(out_dir, f"{key}.csv")
+    columns = [name for name, _ in get_table_columns(key)]
+    for i, row_group in enumerate(iter_row_groups(rows, row_group_size)):
+        pd.DataFrame(row_group, columns=columns).to_csv(path, index=False, mode="a" if i else "w", header=not i)
+
+
+EXPORTERS: dict[str, Callable[..., None]] = {
+    "csv": export_csv,
+    "parquet": export_parquet,
+    "arrow": export_arrow,
+}
+
+
+def export(dat_data: dict[str, DatTable], out_dir: str, formats: tuple[str, ...], row_group_size: int = ROW_GROUP_SIZE):
+    for export_format in formats:
+        exporter = EXPORTERS[export_format]
+        format_dir = os.path.join(out_dir, export_format)
+        os.makedirs(format_dir, exist_ok=True)
+        for key, rows in dat_data.items():
+            if key.startswith("_") or not rows:
+                continue
+            print(f"Exporting {key} to {export_format}...")
+            exporter(key, rows, format_dir, row_group_size)
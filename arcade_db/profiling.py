@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""
+Opt-in allocation profiling of builds with tracemalloc (rominfo.py build --profile-allocations).
+
+Stages of the build (process_games, merge_dat_data, check_ids, convert_to_binary_hashes and write) are decorated
+with profile_stage. While profiling is enabled, each call of a stage records the memory it retained (traced
+memory after less before, which is negative where it frees more than it allocates, as merge_dat_data does in
+replacing records merged from earlier DATs) and its peak above the memory at its start. On the first call of a
+stage and every `snapshot_every` calls after, tracemalloc snapshots are taken either side of the call, and the
+difference is added to the stage's allocations by line. Snapshots take time in proportion to the number of live
+allocations, about a minute each once a MAME build has merged a dozen DATs, so they are only taken for some calls,
+and not at all for the stages which run once with all the merged records live (write and check_ids), where what's
+retained is small and the peak is what matters.
+
+Stages nest (write calls check_ids), and an outer stage's figures include those of the stages within it.
+
+Workers profile the jobs they run, returning the profile of each with its results (see take_profile), so the
+parent can report allocations in workers separately from its own. A worker's profile starts again with each job,
+so the first call of each stage in every job is snapshotted, which is cheap with only one DAT's records live.
+"""
+
+from typing import Any, Callable, Iterator, Optional, TypeVar, cast
+import os
+import json
+import time
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+# Frames kept per allocation. Lines are grouped by the innermost.
+TRACEBACK_FRAMES = 1
+SNAPSHOT_EVERY = 50
+TOP_LINES = 10
+# Lines retaining less are left out of reports
+MIN_LINE_SIZE = 64 * 1024
+PROFILE_NAME = "allocations.json"
+
+StageProfile = dict[str, Any]
+Profile = dict[str, StageProfile]
+F = TypeVar("F", bound=Callable[..., Any])
+
+ENABLED = False
+PROFILE: Profile = {}
+SNAPSHOT_EVERY_CALLS = SNAPSHOT_EVERY
+# The traced peak of each stage being profiled, innermost last
+STACK: list[dict[str, int]] = []
+
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def enable(snapshot_every: int = SNAPSHOT_EVERY) -> None:
+    """
+    Start profiling in this process, discarding any profile so far (such as one inherited by a worker). With
+    snapshot_every 0, no snapshots are taken, so only growth and peaks are recorded.
+    """
+    global ENABLED, PROFILE, SNAPSHOT_EVERY_CALLS
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEBACK_FRAMES)
+    ENABLED = True
+    PROFILE = {}
+    SNAPSHOT_EVERY_CALLS = snapshot_every
+    STACK.clear()
+
+
+def disable() -> None:
+    global ENABLED
+    ENABLED = False
+    tracemalloc.stop()
+
+
+def is_enabled() -> bool:
+    return ENABLED
+
+
+def get_empty_stage_profile() -> StageProfile:
+    return {"calls": 0, "seconds": 0.0, "growth": 0, "peak": 0, "snapshots": 0, "lines": {}}
+
+
+def take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+
+def add_snapshot_diff(stage_profile: StageProfile, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot) -> None:
+    lines = stage_profile["lines"]
+    for stat in after.compare_to(before, "lineno"):
+        if stat.size_diff or stat.count_diff:
+            frame = stat.traceback[0]
+            line = lines.setdefault(f"{frame.filename}:{frame.lineno}", [0, 0])
+            line[0] += stat.size_diff
+            line[1] += stat.count_diff
+
+
+def update_peaks() -> None:
+    """Carry the traced peak so far into every stage being profiled, before the peak is reset."""
+    peak = tracemalloc.get_traced_memory()[1]
+    for frame in STACK:
+        frame["peak"] = max(frame["peak"], peak)
+
+
+@contextmanager
+def profiling_stage(stage: str, snapshots: bool = True) -> Iterator[None]:
+    stage_profile = PROFILE.setdefault(stage, get_empty_stage_profile())
+    snapshot = snapshots and SNAPSHOT_EVERY_CALLS > 0 and stage_profile["calls"] % SNAPSHOT_EVERY_CALLS == 0
+    # The snapshot before is taken first, so its own memory is in the memory at the start
+    before = take_snapshot() if snapshot else None
+    update_peaks()
+    tracemalloc.reset_peak()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    frame = {"peak": start_memory}
+    STACK.append(frame)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start_time
+        update_peaks()
+        STACK.pop()
+        stage_profile["calls"] += 1
+        stage_profile["seconds"] += seconds
+        stage_profile["growth"] += tracemalloc.get_traced_memory()[0] - start_memory
+        stage_profile["peak"] = max(stage_profile["peak"], frame["peak"] - start_memory)
+        if before is not None:
+            add_snapshot_diff(stage_profile, before, take_snapshot())
+            stage_profile["snapshots"] += 1
+
+
+def profile_stage(stage: str, snapshots: bool = True) -> Callable[[F], F]:
+    """Decorate a function as a stage of the build, profiled while profiling is enabled."""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with profiling_stage(stage, snapshots):
+                return func(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+def take_profile() -> Profile:
+    """Return this process's profile so far, and start a new one."""
+    global PROFILE
+    profile, PROFILE = PROFILE, {}
+    return profile
+
+
+def merge_profiles(target: Profile, source: Profile) -> None:
+    for stage, source_profile in source.items():
+        stage_profile = target.setdefault(stage, get_empty_stage_profile())
+        for key in ("calls", "seconds", "growth", "snapshots"):
+            stage_profile[key] += source_profile[key]
+        stage_profile["peak"] = max(stage_profile["peak"], source_profile["peak"])
+        for line, (size, count) in source_profile["lines"].items():
+            totals = stage_profile["lines"].setdefault(line, [0, 0])
+            totals[0] += size
+            totals[1] += count
+
+
+def get_top_lines(stage_profile: StageProfile, top: int = TOP_LINES) -> list[tuple[str, int, int]]:
+    """Return the lines which retained the most memory in a stage's snapshotted calls, as (line, bytes, blocks)."""
+    lines = sorted(stage_profile["lines"].items(), key=lambda item: item[1][0], reverse=True)
+    return [(line, size, count) for line, (size, count) in lines[:top] if size >= MIN_LINE_SIZE]
+
+
+def format_line(line: str) -> str:
+    """Shorten a line's path to be relative to the working directory where it's within it."""
+    path, _, lineno = line.rpartition(":")
+    relative_path = os.path.relpath(path)
+    return f"{path if relative_path.startswith('..') else relative_path}:{lineno}"
+
+
+def report(profiles: dict[str, Profile], out_dir: Optional[str] = None) -> None:
+    """Print each profile (e.g. the parent's and its workers'), and with out_dir, save them as JSON."""
+    mb = 1024 * 1024
+    for name, profile in profiles.items():
+        if not profile:
+            continue
+        print(f"Allocations in {name}:")
+        print(f"  {'Stage':<26} {'Calls':>6} {'Seconds':>9} {'Growth MB':>10} {'Peak MB':>9}")
+        for stage, stage_profile in profile.items():
+            print(
+                f"  {stage:<26} {stage_profile['calls']:>6} {stage_profile['seconds']:>9.1f} "
+                f"{stage_profile['growth'] / mb:>10.1f} {stage_profile['peak'] / mb:>9.1f}"
+            )
+        for stage, stage_profile in profile.items():
+            top_lines = get_top_lines(stage_profile)
+            if not top_lines:
+                continue
+            print(f"  Top lines in {stage} ({stage_profile['snapshots']} of {stage_profile['calls']} calls):")
+            for line, size, count in top_lines:
+                print(f"    {size / mb:>8.1f} MB {count:>10,} blocks  {format_line(line)}")
+    if out_dir is not None:
+        with open(os.path.join(out_dir, PROFILE_NAME), "w") as profile_file:
+            json.dump(profiles, profile_file, indent=2)
@@ -1,9 +1,27 @@
 #!/usr/bin/env python3
-from typing import Optional
+"""
+Queries against a built arcade.db.
 
-from sqlalchemy.orm import Session
+The get_*_for_* functions are bulk queries: they take any number of ids or names, bind them into IN clauses in
+batches of IN_BATCH_SIZE (SQLite limits the number of bound parameters in one statement), and return lightweight
+Core rows rather than ORM objects. Use them in preference to calling the single object helpers in a loop.
+"""
+
+from typing import Any, Iterable, Iterator, Optional, Sequence, TypeVar, Union
+from itertools import islice
+
+from sqlalchemy import Row, Select, select, text
+from sqlalchemy.orm import Session, selectinload
 
 from .shared import db
+from . import search
+
+# Comfortably below SQLITE_MAX_VARIABLE_NUMBER, which is 999 in SQLite builds older than 3.32
+IN_BATCH_SIZE = 500
+
+T = TypeVar("T")
+
+GAME_LIST_COLUMNS = (db.Game.id, db.Game.name, db.Game.description, db.Game.year, db.Game.cloneof)
 
 
 def get_compatible_emulators(session: Session, game: db.Game):
@@ -24,7 +42,7 @@ def get_clones(session: Session, game: db.Game, emulator: db.Emulator):
         session.query(db.Game)
         .join(db.GameEmulator)
         .filter(
-            db.Game.parent_id == game.id,
+            db.Game.cloneof == game.name,
             db.GameEmulator.emulator_id == emulator.id,
         )
         .all()
@@ -33,8 +51,152 @@ def get_clones(session: Session, game: db.Game, emulator: db.Emulator):
 
 
 def get_emulator_by_name(session: Session, name: str = "MAME", version: Optional[str] = None):
-    version = version if version is not None else "%"
-    emulator = (
-        session.query(db.Emulator).filter(db.Emulator.name == name.upper(), db.Emulator.version.like(version)).first()
+    query = session.query(db.Emulator).filter(db.Emulator.name == name.upper())
+    if version is not None:
+        query = query.filter(db.Emulator.version == version)
+    return query.first()
+
+
+def get_roms_by_crc_size(session: Session, crc: int, size: int) -> list[db.Rom]:
+    """
+    Retrieve roms matching the integer CRC and size reported by e.g. ZipInfo. Databases built with binary hashes
+    are queried with the integer as it is.
+    """
+    if db.get_hash_format(session) == "binary":
+        crc_value: Union[int, str] = crc
+    else:
+        crc_value = format(crc, "08x")
+    return session.query(db.Rom).filter(db.Rom.crc == crc_value, db.Rom.size == size).all()
+
+
+def iter_batches(values: Iterable[T], batch_size: int = IN_BATCH_SIZE) -> Iterator[list[T]]:
+    iterator = iter(values)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def get_emulators_for_games(session: Session, game_ids: Iterable[int]) -> dict[int, list[tuple[int, str, str]]]:
+    """
+    Retrieve (id, name, version) rows of the emulators supporting each game, keyed by game id. Games with no
+    emulators are omitted.
+    """
+    emulators: dict[int, list[tuple[int, str, str]]] = {}
+    for batch in iter_batches(set(game_ids)):
+        statement: Select = (
+            select(db.GameEmulator.game_id, db.Emulator.id, db.Emulator.name, db.Emulator.version)
+            .join(db.Emulator, db.Emulator.id == db.GameEmulator.emulator_id)
+            .where(db.GameEmulator.game_id.in_(batch))
+            .order_by(db.GameEmulator.game_id, db.Emulator.id)
+        )
+        for game_id, emulator_id, name, version in session.execute(statement):
+            emulators.setdefault(game_id, []).append((emulator_id, name, version))
+    return emulators
+
+
+def get_clones_for_parents(
+    session: Session, parent_names: Iterable[str], emulator_id: Optional[int] = None
+) -> dict[str, list[Row]]:
+    """
+    Retrieve GAME_LIST_COLUMNS rows of the clones of each parent, keyed by parent name. If emulator_id is given,
+    only clones supported by that emulator are included.
+    """
+    clones: dict[str, list[Row]] = {}
+    for batch in iter_batches(set(parent_names)):
+        statement: Select = select(*GAME_LIST_COLUMNS).where(db.Game.cloneof.in_(batch)).order_by(db.Game.name)
+        if emulator_id is not None:
+            statement = statement.join(db.GameEmulator, db.GameEmulator.game_id == db.Game.id).where(
+                db.GameEmulator.emulator_id == emulator_id
+            )
+        for row in session.execute(statement):
+            clones.setdefault(row.cloneof, []).append(row)
+    return clones
+
+
+def get_game_list(session: Session, emulator_id: int, columns: Sequence[Any] = GAME_LIST_COLUMNS) -> list[Row]:
+    """Retrieve the games supported by an emulator as rows of the given columns, ordered by name."""
+    statement = (
+        select(*columns)
+        .join(db.GameEmulator, db.GameEmulator.game_id == db.Game.id)
+        .where(db.GameEmulator.emulator_id == emulator_id)
+        .order_by(db.Game.name)
     )
-    return emulator
+    return list(session.execute(statement))
+
+
+def get_games(session: Session, game_ids: Iterable[int], eager: bool = False) -> list[db.Game]:
+    """
+    Retrieve ORM games by id. With eager, each game's roms and emulators are loaded alongside it using one
+    further query per relationship, rather than one query per game when they are first accessed.
+    """
+    games: list[db.Game] = []
+    for batch in iter_batches(set(game_ids)):
+        statement = select(db.Game).where(db.Game.id.in_(batch))
+        if eager:
+            statement = statement.options(
+                selectinload(db.Game.roms),
+                selectinload(db.Game.game_emulators).selectinload(db.GameEmulator.emulator),
+            )
+        games.extend(session.scalars(statement))
+    return sorted(games, key=lambda game: game.id)
+
+
+def escape_like(value: str) -> str:
+    """Escape LIKE's wildcards (and the escape character itself) in value, for a pattern with ESCAPE '\\'."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_games(
+    session: Session,
+    query: str,
+    manufacturer: Optional[str] = None,
+    year: Optional[str] = None,
+    emulator: Optional[str] = None,
+    version: Optional[str] = None,
+    limit: int = 50,
+) -> list[Row]:
+    """
+    Search game names, descriptions and manufacturers for every word in query, each matched as a word prefix.
+    Returns (id, name, description, year, manufacturer) rows, best matches first. manufacturer matches a prefix of
+    the manufacturer; emulator (and optionally version) restricts results to games supported by that emulator.
+
+    Databases built without the search stage fall back to scanning games with LIKE, which matches words anywhere
+    in the text and orders by name.
+    """
+    words = search.get_words(query)
+    if not words:
+        return []
+    filters = []
+    params: dict[str, Any] = {"limit": limit}
+    if manufacturer is not None:
+        filters.append("games.manufacturer LIKE :manufacturer ESCAPE '\\'")
+        params["manufacturer"] = f"{escape_like(manufacturer)}%"
+    if year is not None:
+        filters.append("CAST(games.year AS TEXT) = :year")
+        params["year"] = str(year)
+    if emulator is not None:
+        version_filter = "AND version = :version" if version is not None else ""
+        # An uncorrelated IN is evaluated once, rather than per game, and doesn't need an index on game_emulator
+        filters.append(
+            "games.id IN (SELECT game_id FROM game_emulator WHERE emulator_id IN "
+            f"(SELECT id FROM emulators WHERE name = :emulator {version_filter}))"
+        )
+        params["emulator"] = emulator.upper()
+        params["version"] = version
+    columns = "games.id, games.name, games.description, games.year, games.manufacturer"
+    if search.has_search_index(session):
+        where = " AND ".join([f"{search.SEARCH_TABLE} MATCH :match"] + filters)
+        weights = ", ".join(str(weight) for weight in search.RANK_WEIGHTS)
+        statement = (
+            f"SELECT {columns} FROM {search.SEARCH_TABLE} JOIN games ON games.id = {search.SEARCH_TABLE}.rowid "
+            f"WHERE {where} ORDER BY bm25({search.SEARCH_TABLE}, {weights}), games.name LIMIT :limit"
+        )
+        params["match"] = search.get_match_expression(words)
+    else:
+        for i, word in enumerate(words):
+            pattern = f":word{i} ESCAPE '\\'"
+            filters.append(
+                f"(games.name LIKE {pattern} OR games.description LIKE {pattern} OR games.manufacturer LIKE {pattern})"
+            )
+            params[f"word{i}"] = f"%{escape_like(word)}%"
+        statement = f"SELECT {columns} FROM games WHERE {' AND '.join(filters)} ORDER BY games.name LIMIT :limit"
+    return list(session.execute(text(statement), params))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""
+Memory-budgeted scheduling for parallel builds (rominfo.py build --concurrent --memory-budget).
+
+Each job's peak memory is estimated, and a job is only started once the estimates of the jobs already running
+leave room for it in the budget. Estimates come from the peaks measured when a DAT was last processed, which are
+kept in a history file, or failing that from the DAT's size. The size factors are deliberately high: for the
+same stored size, a MAME XML DAT (with its inputs, chips and dipswitches, which aren't read) peaks at about a
+third of the memory of an FBA or FBN DAT.
+"""
+
+from typing import Any, Callable, Iterable, Iterator, Optional
+import os
+import json
+import queue
+
+# Peak worker memory (MB) per MB of a DAT, as stored
+COMPRESSED_MEMORY_FACTOR = 200
+UNCOMPRESSED_MEMORY_FACTOR = 25
+
+MEMORY_HISTORY_NAME = "dat_memory.json"
+
+MemoryHistory = dict[str, dict[str, Any]]
+
+
+def get_history_path(out_dir: str) -> str:
+    return os.path.join(out_dir, MEMORY_HISTORY_NAME)
+
+
+def load_memory_history(path: str) -> MemoryHistory:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as history_file:
+        return json.load(history_file)
+
+
+def save_memory_history(path: str, history: MemoryHistory) -> None:
+    with open(path, "w") as history_file:
+        json.dump(history, history_file, indent=2, sort_keys=True)
+
+
+def record_peak(history: MemoryHistory, dat_file: str, peak_mb: float) -> None:
+    history[os.path.basename(dat_file)] = {"size": os.path.getsize(dat_file), "peak_mb": round(peak_mb, 1)}
+
+
+def estimate_memory(dat_file: str, history: MemoryHistory, part: Optional[bytes] = None) -> float:
+    """
+    Estimate the peak memory (MB) of processing a DAT, or a part of one (see sources.split_xml_dat). A recorded
+    peak is only used while the DAT is the same size as when it was recorded.
+    """
+    if part is not None:
+        return len(part) / (1024 * 1024) * UNCOMPRESSED_MEMORY_FACTOR
+    size = os.path.getsize(dat_file)
+    recorded = history.get(os.path.basename(dat_file))
+    if recorded is not None and recorded["size"] == size:
+        return recorded["peak_mb"]
+    factor = COMPRESSED_MEMORY_FACTOR if dat_file.endswith(".bz2") else UNCOMPRESSED_MEMORY_FACTOR
+    return size / (1024 * 1024) * factor
+
+
+def imap_budgeted(
+    pool: Any,
+    func: Callable[[Any], Any],
+    jobs: Iterable[tuple[Any, float]],
+    processes: int,
+    budget_mb: float,
+) -> Iterator[Any]:
+    """
+    Like pool.imap_unordered(func, jobs), for (job, estimated peak MB) pairs. Jobs are started in order, each
+    once fewer than `processes` jobs are running and their estimates leave room for it in budget_mb. A job
+    estimated at more than the whole budget is run on its own. Jobs are only taken from `jobs` as they are
+    started, so a generator of large jobs isn't read ahead.
+    """
+    results: queue.Queue = queue.Queue()
+    running: list[float] = []
+
+    def wait() -> Any:
+        estimate, succeeded, result = results.get()
+        running.remove(estimate)
+        if not succeeded:
+            raise result
+        return result
+
+    for job, estimate in jobs:
+        while running and (len(running) >= processes or sum(running) + estimate > budget_mb):
+            yield wait()
+        running.append(estimate)
+        pool.apply_async(
+            func,
+            (job,),
+            callback=lambda result, estimate=estimate: results.put((estimate, True, result)),
+            error_callback=lambda error, estimate=estimate: results.put((estimate, False, error)),
+        )
+    while running:
+        yield wait()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""
+Full-text search over games, an optional stage of create_db.write (see queries.search_games).
+
+games_fts is an FTS5 index of the name, description and manufacturer of each game, stored as an external content
+table over games so the text isn't duplicated. Two and three character prefixes are indexed, so prefix queries
+as typed ('stre figh') don't scan the term list.
+"""
+
+from typing import Any
+import re
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+SEARCH_TABLE = "games_fts"
+
+# bm25 weights for the name, description and manufacturer columns
+RANK_WEIGHTS = (4.0, 2.0, 1.0)
+
+CREATE_SEARCH_TABLE = f"""
+CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+    name, description, manufacturer, content='games', content_rowid='id', tokenize='unicode61', prefix='2 3'
+)
+"""
+
+# The games table is written by pandas, without a primary key. Reading matches back from the external content
+# table, and joining them to games, looks games up by id.
+CREATE_GAMES_ID_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_games_id ON games (id)"
+
+POPULATE_SEARCH_TABLE = f"""
+INSERT INTO {SEARCH_TABLE} (rowid, name, description, manufacturer)
+SELECT id, name, coalesce(description, ''), coalesce(manufacturer, '') FROM games
+"""
+
+
+def write_search_index(dat_data: dict[str, Any], engine: Any) -> None:
+    print("Writing search index...")
+    with engine.begin() as connection:
+        connection.execute(text(CREATE_GAMES_ID_INDEX))
+        connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+        connection.execute(text(CREATE_SEARCH_TABLE))
+        connection.execute(text(POPULATE_SEARCH_TABLE))
+        connection.execute(text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')"))
+
+
+def has_search_index(session: Session) -> bool:
+    return inspect(session.get_bind()).has_table(SEARCH_TABLE)
+
+
+def get_words(query: str) -> list[str]:
+    """Split free text into words. Punctuation is dropped, so user input can't form FTS5 syntax."""
+    return re.findall(r"\w+", query.lower())
+
+
+def get_match_expression(words: list[str]) -> str:
+    """Return an FTS5 query matching every word as a prefix, e.g. '"street"* AND "fig"*'."""
+    return " AND ".join(f'"{word}"*' for word in words)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""
+Sharded builds. Each shard processes a range of DATs (rominfo.py build --start/--end --shard) and writes its
+DatData, still keyed by hash, to a directory of sorted files rather than a database. merge_shards then combines
+any number of shards with a k-way merge of each table.
+
+Record ids are derived from identity hashes (see indexing.get_stable_id), so they agree between shards, and the
+merge yields each table in hash order. The database is the same however the DATs were divided between shards.
+"""
+
+from typing import Any, Iterator
+import os
+import gzip
+import json
+import heapq
+from itertools import groupby
+from operator import itemgetter
+
+DatData = dict[str, dict[str, dict[str, Any]]]
+
+MANIFEST_NAME = "manifest.json"
+TABLE_SUFFIX = ".jsonl.gz"
+
+
+def get_table_path(shard_dir: str, key: str) -> str:
+    return os.path.join(shard_dir, f"{key}{TABLE_SUFFIX}")
+
+
+def write_shard(dat_data: DatData, shard_dir: str, dats: list[str]) -> None:
+    """Write each table to shard_dir as gzipped JSON lines of [hash key, attributes], sorted by hash key."""
+    os.makedirs(shard_dir, exist_ok=True)
+    tables = [key for key in dat_data if not key.startswith("_")]
+    for key in tables:
+        print(f"Writing {key} shard...")
+        with gzip.open(get_table_path(shard_dir, key), "wt", encoding="utf-8", compresslevel=1) as table_file:
+            for hash_key in sorted(dat_data[key]):
+                table_file.write(json.dumps([hash_key, dat_data[key][hash_key]], separators=(",", ":")))
+                table_file.write("\n")
+    manifest = {
+        "dats": [os.path.basename(dat) for dat in dats],
+        "tables": {key: len(dat_data[key]) for key in tables},
+    }
+    with open(os.path.join(shard_dir, MANIFEST_NAME), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+def get_shard_tables(shard_dir: str) -> list[str]:
+    with open(os.path.join(shard_dir, MANIFEST_NAME), "r") as manifest_file:
+        return list(json.load(manifest_file)["tables"])
+
+
+def iter_shard_table(shard_dir: str, key: str) -> Iterator[tuple[str, dict[str, Any]]]:
+    path = get_table_path(shard_dir, key)
+    if not os.path.exists(path):
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as table_file:
+        for line in table_file:
+            hash_key, attrs = json.loads(line)
+            yield hash_key, attrs
+
+
+def iter_merged_table(shard_dirs: list[str], key: str) -> Iterator[tuple[str, dict[str, Any]]]:
+    """
+    Yield a table's records from all shards in hash order. Where shards share a record, the last shard's wins,
+    as in create_db.merge_dat_data, so shards should be given in DAT order.
+    """
+    merged = heapq.merge(*(iter_shard_table(shard_dir, key) for shard_dir in shard_dirs), key=itemgetter(0))
+    for _, records in groupby(merged, key=itemgetter(0)):
+        *_, last = records
+        yield last
+
+
+def get_tables(shard_dirs: list[str]) -> list[str]:
+    """Return the tables in any of the shards, in the order they were written."""
+    tables: list[str] = []
+    for shard_dir in shard_dirs:
+        tables.extend(key for key in get_shard_tables(shard_dir) if key not in tables)
+    return tables
+
+
+def merge_shards(shard_dirs: list[str]) -> DatData:
+    dat_data: DatData = {}
+    for key in get_tables(shard_dirs):
+        print(f"Merging {key} from {len(shard_dirs)} shards...")
+        dat_data[key] = dict(iter_merged_table(shard_dirs, key))
+    return dat_data
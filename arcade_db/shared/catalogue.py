@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""
+A catalogue of DATs, so that builds can be planned without parsing them. Scanning a DAT reads it once, without
+parsing it, for its format, header, counts of games and the elements create_db reads, its compressed and
+uncompressed sizes, a digest of its contents and a digest of its games (everything from the first game on), which
+is the same for DATs differing only in their headers.
+
+Scans are kept in a manifest (sources/catalogue.json by default) keyed by path relative to the manifest, and a DAT
+is only scanned again when its size or modification time changes.
+
+Counts come from matching tags (or, in ClrMamePro DATs, block names at the start of lines) rather than parsing,
+so a DAT with games in comments would be overcounted. None in the collection are.
+"""
+
+from typing import Any, Iterable, Optional
+import os
+import re
+import json
+import hashlib
+import multiprocessing
+from collections import Counter
+
+from lxml import etree as ET
+
+from . import sources
+
+CATALOGUE_PATH = os.path.join(sources.PARENT_PATH, "sources", "catalogue.json")
+CATALOGUE_VERSION = 2
+
+COUNTED_TAGS = ("game", "machine", "resource", "rom", "disk", "feature", "driver")
+XML_COUNT_PATTERN = re.compile(rb"<(" + "|".join(COUNTED_TAGS).encode() + rb")[\s/>]")
+CLRMAMEPRO_COUNT_PATTERN = re.compile(rb"^[ \t]*(" + "|".join(COUNTED_TAGS).encode() + rb")[ \t]*\(", re.MULTILINE)
+CLRMAMEPRO_GAME_START_PATTERN = re.compile(rb"^[ \t]*(?:game|machine|resource)[ \t]*\(", re.MULTILINE)
+
+# Enough of the start of a DAT to hold its header
+HEAD_SIZE = 64 * 1024
+
+CatalogueEntry = dict[str, Any]
+Catalogue = dict[str, CatalogueEntry]
+
+
+def get_xml_header(head: bytes) -> tuple[Optional[str], dict[str, str]]:
+    """Return the root tag of an XML DAT, and its attributes together with the fields of its header element."""
+    if (game_start := sources.GAME_START_PATTERN.search(head)) is not None:
+        head = head[: game_start.start()]
+    parser = ET.XMLParser(recover=True, resolve_entities=False, no_network=True)
+    root = ET.fromstring(head, parser) if head.strip() else None
+    if root is None:
+        return None, {}
+    header = {str(key): str(value) for key, value in root.attrib.items()}
+    if (header_element := root.find("header")) is not None:
+        header.update({child.tag: (child.text or "").strip() for child in header_element if isinstance(child.tag, str)})
+    return root.tag, header
+
+
+def get_clrmamepro_header(head: bytes) -> tuple[Optional[str], dict[str, str]]:
+    """Return the name of a ClrMamePro DAT's first block, if it isn't a game, and its values."""
+    lines = iter(head.decode("utf-8", errors="replace").splitlines())
+    for line in lines:
+        if line.strip():
+            break
+    else:
+        return None, {}
+    tag = line.split("(", 1)[0].strip()
+    if tag in sources.GAME_TAGS:
+        return None, {}
+    header = {}
+    for line in lines:
+        key, _, value = line.strip().partition(" ")
+        if key == ")":
+            break
+        if key:
+            header[key] = value.strip().strip('"')
+    return tag, header
+
+
+def scan_dat(path: str) -> CatalogueEntry:
+    """Read a DAT once, without parsing it, for a catalogue entry."""
+    print(f"Scanning {path}...")
+    stat = os.stat(path)
+    dat_format = sources.get_dat_format(path)
+    if dat_format == "xml":
+        pattern, separator, game_start = XML_COUNT_PATTERN, b"<", sources.GAME_START_PATTERN
+    else:
+        pattern, separator, game_start = CLRMAMEPRO_COUNT_PATTERN, b"\n", CLRMAMEPRO_GAME_START_PATTERN
+    digest = hashlib.blake2b(digest_size=16)
+    games_digest = hashlib.blake2b(digest_size=16)
+    # The contents so far, until the first game is found
+    before_games: Optional[bytes] = b""
+    counts: Counter = Counter()
+    uncompressed_size = 0
+    head = b""
+    carry = b""
+    for chunk in sources.iter_decompressed(path, sources.CHUNK_SIZE):
+        digest.update(chunk)
+        uncompressed_size += len(chunk)
+        if len(head) < HEAD_SIZE:
+            head += chunk[: HEAD_SIZE - len(head)]
+        if before_games is None:
+            games_digest.update(chunk)
+        elif match := game_start.search(before_games := before_games + chunk):
+            games_digest.update(before_games[match.start() :])
+            before_games = None
+        # Tags split between chunks are carried over to the next
+        data = carry + chunk
+        cut = data.rfind(separator)
+        counts.update(match[1].decode() for match in pattern.finditer(data, 0, max(cut, 0)))
+        carry = data[max(cut, 0) :]
+    counts.update(match[1].decode() for match in pattern.finditer(carry))
+    root, header = get_xml_header(head) if dat_format == "xml" else get_clrmamepro_header(head)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "format": dat_format,
+        "uncompressed_size": uncompressed_size,
+        "digest": digest.hexdigest(),
+        "games_digest": games_digest.hexdigest(),
+        "root": root,
+        "header": header,
+        "games": sum(counts[tag] for tag in sources.GAME_TAGS),
+        "counts": {tag: counts[tag] for tag in COUNTED_TAGS if counts[tag]},
+    }
+
+
+def load_catalogue(catalogue_path: str = CATALOGUE_PATH) -> Catalogue:
+    if not os.path.exists(catalogue_path):
+        return {}
+    with open(catalogue_path, "r") as catalogue_file:
+        manifest = json.load(catalogue_file)
+    # Entries from another version of the scan are discarded, to be scanned again
+    return manifest["dats"] if manifest.get("version") == CATALOGUE_VERSION else {}
+
+
+def save_catalogue(catalogue: Catalogue, catalogue_path: str = CATALOGUE_PATH) -> None:
+    temp_path = f"{catalogue_path}.part"
+    with open(temp_path, "w") as catalogue_file:
+        json.dump({"version": CATALOGUE_VERSION, "dats": catalogue}, catalogue_file, indent=2, sort_keys=True)
+    os.replace(temp_path, catalogue_path)
+
+
+def get_catalogue_key(path: str, catalogue_path: str = CATALOGUE_PATH) -> str:
+    return os.path.relpath(path, os.path.dirname(os.path.abspath(catalogue_path)))
+
+
+def is_current(entry: Optional[CatalogueEntry], path: str) -> bool:
+    if entry is None:
+        return False
+    stat = os.stat(path)
+    return entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+
+
+def update_catalogue(
+    paths: Iterable[str], catalogue_path: str = CATALOGUE_PATH, num_processes: int = 1
+) -> dict[str, CatalogueEntry]:
+    """
+    Return catalogue entries for the given DATs, keyed by path, scanning any which are new or have changed since
+    they were last scanned. The manifest is updated, and entries for DATs which no longer exist are removed.
+    """
+    paths = list(paths)
+    catalogue = load_catalogue(catalogue_path)
+    keys = {path: get_catalogue_key(path, catalogue_path) for path in paths}
+    changed = [path for path in paths if not is_current(catalogue.get(keys[path]), path)]
+    if num_processes > 1 and len(changed) > 1:
+        with multiprocessing.Pool(num_processes) as pool:
+            entries = pool.map(scan_dat, changed)
+    else:
+        entries = [scan_dat(path) for path in changed]
+    catalogue.update((keys[path], entry) for path, entry in zip(changed, entries))
+    base_dir = os.path.dirname(os.path.abspath(catalogue_path))
+    missing = [key for key in catalogue if not os.path.exists(os.path.join(base_dir, key))]
+    for key in missing:
+        del catalogue[key]
+    if changed or missing:
+        save_catalogue(catalogue, catalogue_path)
+    return {path: catalogue[keys[path]] for path in paths}
@@ -8,13 +8,36 @@ handle cases where the type checker was unable to properly handle SQLAlchemy
 types.
 """
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, Index
-from sqlalchemy.orm import Session, DeclarativeBase, sessionmaker
+from typing import Any
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import quote
+
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey, Table, Index, inspect, event
+from sqlalchemy.engine import URL, Engine
+from sqlalchemy.orm import Session, DeclarativeBase, sessionmaker, scoped_session
 
 # from sqlalchemy.orm import backref, relationship
 from sqlalchemy.orm import relationship
 from sqlalchemy import create_engine
 
+# A built database doesn't change, so readers can map it into memory, cache generously and skip locking
+READ_PRAGMAS = {
+    "mmap_size": 1024 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+    "query_only": "ON",
+}
+
+# The database is written from scratch by a single process and discarded if the build fails, so there's nothing
+# for a journal or fsyncs to protect
+BUILD_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "cache_size": -256 * 1024,
+    "temp_store": "MEMORY",
+}
+
 
 class Base(DeclarativeBase):
     pass
@@ -27,6 +50,61 @@ def get_session(db_path: str) -> Session:
     return Session()
 
 
+def set_pragmas(engine: Engine, pragmas: dict[str, Any]) -> None:
+    """Run the given PRAGMA statements on every new connection the engine makes."""
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
+
+
+def get_build_engine(db_path: str) -> Engine:
+    # Built rather than parsed, which would take '?' or '#' in the path as the start of a query or fragment
+    engine = create_engine(URL.create("sqlite", database=db_path))
+    set_pragmas(engine, BUILD_PRAGMAS)
+    return engine
+
+
+@lru_cache(maxsize=None)
+def get_read_engine(db_path: str) -> Engine:
+    """
+    Return a shared engine for reading a built database. The file is opened read-only and immutable, so SQLite
+    neither locks it nor checks it for changes: don't rebuild a database while a process is reading it. Connections
+    are pooled, one per thread in use.
+    """
+    # SQLite decodes the file URI, so the path is percent-encoded for '?', '#' and '%' in it to be kept. The URL is
+    # built rather than parsed, as parsing would decode it first.
+    path = quote(Path(db_path).absolute().as_posix(), safe="/")
+    uri = URL.create("sqlite", database=f"file:{path}", query={"mode": "ro", "immutable": "1", "uri": "true"})
+    engine = create_engine(uri, connect_args={"check_same_thread": False}, pool_size=8, max_overflow=24)
+    set_pragmas(engine, READ_PRAGMAS)
+    return engine
+
+
+@lru_cache(maxsize=None)
+def get_read_sessions(db_path: str) -> scoped_session:
+    """Return a registry of read-only sessions. Calling it returns the current thread's session."""
+    return scoped_session(sessionmaker(bind=get_read_engine(db_path)))
+
+
+def get_read_session(db_path: str) -> Session:
+    return get_read_sessions(db_path)()
+
+
+def get_hash_format(session: Session) -> str:
+    """
+    Return "hex" (the default) or "binary", the format in which the database at the other end of the session
+    stores CRCs and hashes.
+    """
+    if not inspect(session.get_bind()).has_table(BuildInfo.__tablename__):
+        return "hex"
+    build_info = session.get(BuildInfo, "hash_format")
+    return str(build_info.value) if build_info is not None else "hex"
+
+
 game_rom_association = Table(
     "game_rom",
     Base.metadata,
@@ -93,6 +171,11 @@ class Game(Base):
 
 
 class Rom(Base):
+    """
+    In databases built with hash_format "binary", crc holds an integer and sha1 and hash hold raw digests. SQLite
+    doesn't enforce column types, so the same model reads both.
+    """
+
     __tablename__ = "roms"
     id = Column(Integer, primary_key=True, autoincrement=True)
     hash = Column(String(64), unique=True, nullable=False, index=True)
@@ -102,7 +185,10 @@ class Rom(Base):
     sha1 = Column(String)
     games = relationship("Game", secondary=game_rom_association, back_populates="roms")
 
-    __table_args__ = (Index("idx_rom_lookup", "name", "size", "crc"),)
+    __table_args__ = (
+        Index("idx_rom_lookup", "name", "size", "crc"),
+        Index("idx_rom_crc_size", "crc", "size"),
+    )
 
 
 class Disk(Base):
@@ -179,3 +265,40 @@ class Driver(Base):
             "incomplete",
         ),
     )
+
+
+class BuildInfo(Base):
+    """Key/value details of how the database was built, e.g. hash_format."""
+
+    __tablename__ = "build_info"
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+
+class EmulatorCompatibility(Base):
+    """
+    Written by the optional compatibility stage. position orders the versions of each emulator name; games is a
+    little-endian bitmap with bit n set if the game at position n (see GameCompatibility) runs on this version.
+    """
+
+    __tablename__ = "emulator_compatibility"
+    emulator_id = Column(Integer, ForeignKey("emulators.id"), primary_key=True)
+    name = Column(String, nullable=False)
+    version = Column(String, nullable=False)
+    position = Column(Integer, nullable=False)
+    games = Column(LargeBinary, nullable=False)
+
+
+class GameCompatibility(Base):
+    """
+    Written by the optional compatibility stage. versions is a little-endian bitmap of the positions (see
+    EmulatorCompatibility) of the emulator versions supporting the game. position numbers the games in id order.
+    """
+
+    __tablename__ = "game_compatibility"
+    game_id = Column(Integer, ForeignKey("games.id"), primary_key=True)
+    name = Column(String, primary_key=True)
+    position = Column(Integer, nullable=False)
+    versions = Column(LargeBinary, nullable=False)
+    first_emulator_id = Column(Integer, ForeignKey("emulators.id"), nullable=False)
+    last_emulator_id = Column(Integer, ForeignKey("emulators.id"), nullable=False)
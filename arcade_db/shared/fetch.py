@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+"""
+Concurrent, resumable HTTP downloads.
+
+Completed downloads are recorded in a JSON manifest (size and sha256) so later runs can skip them without
+re-opening or re-hashing the files. Partial downloads are kept alongside their target with a '.part' suffix and
+resumed with an HTTP range request.
+"""
+
+from typing import Callable, Optional
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError, URLError
+
+CHUNK_SIZE = 1024 * 1024
+PARTIAL_SUFFIX = ".part"
+DEFAULT_TIMEOUT = 60
+
+# A download job is a list of (url, target) candidates, tried in order until one succeeds
+DownloadJob = list[tuple[str, str]]
+
+
+class Manifest:
+    """Thread-safe record of completed downloads, keyed by target file name."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r") as manifest_file:
+                self.entries = json.load(manifest_file)
+
+    def get(self, target: str) -> Optional[dict]:
+        with self.lock:
+            return self.entries.get(os.path.basename(target))
+
+    def is_complete(self, target: str) -> bool:
+        """A target is complete if it's in the manifest and the file on disk still has the recorded size."""
+        entry = self.get(target)
+        return entry is not None and os.path.exists(target) and os.path.getsize(target) == entry["size"]
+
+    def add(self, target: str, entry: dict) -> None:
+        with self.lock:
+            self.entries[os.path.basename(target)] = entry
+            self.save()
+
+    def save(self) -> None:
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as manifest_file:
+            json.dump(self.entries, manifest_file, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+def get_file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download(url: str, target: str, timeout: int = DEFAULT_TIMEOUT) -> dict:
+    """
+    Download url to target, resuming from target.part if a previous attempt was interrupted. Servers which ignore
+    the range header (responding 200 rather than 206) cause the download to restart from scratch.
+    """
+    partial_path = f"{target}{PARTIAL_SUFFIX}"
+    offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    request = Request(url)
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        # 416 means the partial file already holds the whole resource
+        if e.code != 416 or not offset:
+            raise
+        response = None
+    if response is not None:
+        with response:
+            mode = "ab" if response.status == 206 else "wb"
+            with open(partial_path, mode) as partial_file:
+                while chunk := response.read(CHUNK_SIZE):
+                    partial_file.write(chunk)
+    os.replace(partial_path, target)
+    return {"url": url, "size": os.path.getsize(target), "sha256": get_file_sha256(target)}
+
+
+def run_job(
+    job: DownloadJob,
+    manifest: Manifest,
+    validate: Optional[Callable[[str], bool]] = None,
+    timeout: int = DEFAULT_TIMEOUT,
+) -> Optional[str]:
+    """
+    Try each candidate in a job until one downloads and validates. Returns the completed target, or None.
+    """
+    for url, target in job:
+        if manifest.is_complete(target):
+            return target
+    for url, target in job:
+        try:
+            entry = download(url, target, timeout)
+        except (HTTPError, URLError, OSError) as e:
+            print("Error: ", url, e)
+            continue
+        if validate is not None and not validate(target):
+            print("Invalid download: ", url, target)
+            os.remove(target)
+            continue
+        manifest.add(target, entry)
+        print(url, target)
+        return target
+    return None
+
+
+def download_all(
+    jobs: list[DownloadJob],
+    manifest_path: str,
+    max_workers: int = 4,
+    validate: Optional[Callable[[str], bool]] = None,
+    timeout: int = DEFAULT_TIMEOUT,
+) -> list[str]:
+    """
+    Run download jobs using a bounded pool of threads. Returns the targets which are complete after the run.
+    """
+    manifest = Manifest(manifest_path)
+    completed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_job, job, manifest, validate, timeout) for job in jobs]
+        for future in as_completed(futures):
+            if (target := future.result()) is not None:
+                completed.append(target)
+    return sorted(completed)
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+from typing import Optional, Union
+import re
 import hashlib
 from lxml import etree as ET
 
@@ -43,6 +45,49 @@ def get_attributes_md5(attributes: dict[str, str]):
     return hashlib.md5("".join(ordered_attrs).encode()).hexdigest()
 
 
+# Record ids are the leading 63 bits of the record's identity hash, so they fit SQLite's signed INTEGER and a record
+# has the same id in every build (or shard) which includes it
+STABLE_ID_HEX_DIGITS = 16
+HEX_PATTERN = re.compile(r"[0-9a-f]+")
+
+
+def get_stable_id(hash_key: str) -> int:
+    """Return the id for an identity hash. Keys which aren't hex digests (e.g. 'mame0_263') are hashed first."""
+    if len(hash_key) < STABLE_ID_HEX_DIGITS or not HEX_PATTERN.fullmatch(hash_key):
+        hash_key = hashlib.sha256(hash_key.encode()).hexdigest()
+    return int(hash_key[:STABLE_ID_HEX_DIGITS], 16) >> 1
+
+
+# Databases built with hash_format "binary" store CRCs as integers and sha1/md5/identity hashes as raw digests.
+# These convert values from DATs (and lookups) to that form.
+
+
+def crc_to_int(crc: Union[int, str, None]) -> Optional[int]:
+    if isinstance(crc, int):
+        return crc
+    if not crc:
+        return None
+    try:
+        return int(crc, 16)
+    except ValueError:
+        return None
+
+
+def hex_to_bytes(value: Optional[str]) -> Union[bytes, str, None]:
+    # Values which aren't valid hex (there are a few malformed sha1s) are kept as they are
+    if not value:
+        return None
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        return value
+
+
+def encode_hash(value: str, hash_format: str) -> Union[bytes, str, None]:
+    """Encode a hex identity hash for comparison with the hash columns of a database."""
+    return hex_to_bytes(value) if hash_format == "binary" else value
+
+
 # In earlier versions it was necessary to match roms/games from SQLAlchemy records.
 # It's no longer necessary but might be again
 
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+"""
+Progress reporting for builds and validation runs over many DATs.
+
+Workers return their stats with their results (as create_db.dat_part_worker does in "_stats"), and the parent
+feeds one event per DAT, or part of a split DAT, to a BuildProgress. Each event prints a status line with the DATs
+done and remaining, games and decompressed MB per second, and an ETA, and is appended to an optional JSON-lines
+event log. The log ends with per-worker totals, so slow DATs and changes in throughput can be compared between
+runs.
+
+The ETA assumes the remaining DATs take as long per byte as those done so far. DATs are weighted by their
+uncompressed size from the catalogue when all their entries are current, otherwise by their size as stored.
+"""
+
+from typing import Any, Callable, Optional
+import os
+import json
+import time
+import datetime
+
+from . import catalogue
+
+ProgressStats = dict[str, Any]
+
+
+def get_dat_weights(dats: list[str], catalogue_path: str = catalogue.CATALOGUE_PATH) -> dict[str, int]:
+    """Return each DAT's uncompressed size from the catalogue, or if any entry isn't current, its stored size."""
+    entries = catalogue.load_catalogue(catalogue_path)
+    scanned = {dat_file: entries.get(catalogue.get_catalogue_key(dat_file, catalogue_path)) for dat_file in dats}
+    if all(catalogue.is_current(entry, dat_file) for dat_file, entry in scanned.items()):
+        return {dat_file: entry["uncompressed_size"] for dat_file, entry in scanned.items()}  # type: ignore
+    return {dat_file: os.path.getsize(dat_file) for dat_file in dats}
+
+
+def format_duration(seconds: float) -> str:
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+class BuildProgress:
+    """
+    Progress over a list of DATs. A split DAT (see create_db.iter_dat_jobs) is counted done once all of its parts
+    are, each part weighing an equal share of it.
+    """
+
+    def __init__(
+        self,
+        dats: list[str],
+        log_path: Optional[str] = None,
+        weights: Optional[dict[str, int]] = None,
+        label: str = "build",
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.weights = weights if weights is not None else get_dat_weights(dats)
+        self.total_weight = sum(self.weights[dat_file] for dat_file in dats)
+        self.log_path = log_path
+        self.label = label
+        self.clock = clock
+        self.num_dats = len(dats)
+        self.parts: dict[str, int] = {}
+        self.parts_done: dict[str, int] = {}
+        self.dats_done = 0
+        self.weight_done = 0.0
+        self.games = 0
+        self.bytes_read = 0
+        self.workers: dict[str, dict[str, float]] = {}
+        self.start_time = clock()
+        if log_path is not None:
+            # Truncate the log from any previous run
+            open(log_path, "w").close()
+        self.log_event("start", dats=self.num_dats, total_weight=self.total_weight)
+
+    def log_event(self, event: str, **fields: Any) -> None:
+        if self.log_path is None:
+            return
+        record = {"event": event, "label": self.label, "time": time.time(), "elapsed": self.get_elapsed(), **fields}
+        with open(self.log_path, "a") as log_file:
+            log_file.write(json.dumps(record) + "\n")
+
+    def get_elapsed(self) -> float:
+        return round(self.clock() - self.start_time, 3)
+
+    def split(self, dat_file: str, parts: int) -> None:
+        """Record that a DAT has been split into parts, each reported separately."""
+        self.parts[dat_file] = parts
+
+    def is_done(self, dat_file: str) -> bool:
+        return self.parts_done.get(dat_file, 0) == self.parts.get(dat_file, 1)
+
+    def get_eta(self) -> Optional[float]:
+        if not self.weight_done:
+            return None
+        return self.get_elapsed() * (self.total_weight - self.weight_done) / self.weight_done
+
+    def update(self, dat_file: str, stats: ProgressStats) -> None:
+        """
+        Record a DAT, or part of one, as processed, with stats giving its "games", decompressed "bytes", "seconds"
+        taken and the "worker" (process id) which processed it.
+        """
+        parts = self.parts.get(dat_file, 1)
+        self.parts_done[dat_file] = self.parts_done.get(dat_file, 0) + 1
+        if self.is_done(dat_file):
+            self.dats_done += 1
+        self.weight_done += self.weights[dat_file] / parts
+        self.games += stats["games"]
+        self.bytes_read += stats["bytes"]
+        worker = self.workers.setdefault(str(stats["worker"]), {"jobs": 0, "games": 0, "bytes": 0, "seconds": 0.0})
+        worker["jobs"] += 1
+        for key in ("games", "bytes", "seconds"):
+            worker[key] += stats[key]
+
+        elapsed = max(self.get_elapsed(), 1e-9)
+        eta = self.get_eta()
+        self.log_event(
+            "dat",
+            dat=os.path.basename(dat_file),
+            part=self.parts_done[dat_file] if parts > 1 else None,
+            parts=parts,
+            games=stats["games"],
+            bytes=stats["bytes"],
+            seconds=round(stats["seconds"], 3),
+            worker=stats["worker"],
+            dats_done=self.dats_done,
+            dats_remaining=self.num_dats - self.dats_done,
+            games_per_second=round(self.games / elapsed, 1),
+            mb_per_second=round(self.bytes_read / elapsed / (1024 * 1024), 2),
+            eta=None if eta is None else round(eta, 1),
+        )
+        print(
+            f"Progress: {self.dats_done}/{self.num_dats} DATs, {self.num_dats - self.dats_done} remaining "
+            f"({self.weight_done / max(self.total_weight, 1):.1%} by size), {self.games / elapsed:,.0f} games/s, "
+            f"{self.bytes_read / elapsed / (1024 * 1024):.1f} MB/s, "
+            f"ETA {'unknown' if eta is None else format_duration(eta)}"
+        )
+
+    def finish(self) -> None:
+        """Print and log the totals, overall and per worker."""
+        elapsed = self.get_elapsed()
+        print(
+            f"Processed {self.dats_done} DATs ({self.games:,} games, {self.bytes_read / (1024 * 1024):,.1f} MB) "
+            f"in {format_duration(elapsed)}"
+        )
+        for worker, totals in sorted(self.workers.items()):
+            print(
+                f"  Worker {worker}: {totals['jobs']:.0f} jobs, {totals['games']:,.0f} games "
+                f"in {format_duration(totals['seconds'])}"
+            )
+        self.log_event(
+            "end",
+            dats_done=self.dats_done,
+            games=self.games,
+            bytes=self.bytes_read,
+            workers={
+                worker: dict(totals, seconds=round(totals["seconds"], 3)) for worker, totals in self.workers.items()
+            },
+        )
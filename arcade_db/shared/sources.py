@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 
-from typing import Optional
+from typing import IO, Iterable, Iterator, Optional, Union
 import os
 import re
 import bz2
+import queue
+import threading
+from abc import ABC, abstractmethod
 from lxml import etree as ET
 import gc
 
@@ -14,21 +17,165 @@ WORKDIR = os.path.join(PARENT_PATH, "sources", "working")
 MAME_DAT_DIR = os.path.join(PARENT_PATH, "sources", "mame", "dats")
 FBA_DAT_DIR = os.path.join(PARENT_PATH, "sources", "fba", "dats")
 FBN_DAT_DIR = os.path.join(PARENT_PATH, "sources", "fbn", "dats")
+FBA_ORIGINAL_DAT_DIR = os.path.join(PARENT_PATH, "sources", "fba", "non-xml-originals")
 
 MAME_DATS = [os.path.join(MAME_DAT_DIR, file) for file in os.listdir(MAME_DAT_DIR)]
 FBA_DATS = [os.path.join(FBA_DAT_DIR, file) for file in os.listdir(FBA_DAT_DIR)]
 FBN_DATS = [os.path.join(FBN_DAT_DIR, file) for file in os.listdir(FBN_DAT_DIR)]
+FBA_ORIGINAL_DATS = [
+    os.path.join(FBA_ORIGINAL_DAT_DIR, file) for file in os.listdir(FBA_ORIGINAL_DAT_DIR) if file.endswith(".xml")
+]
 
+GAME_TAGS = ("game", "machine", "resource")
+# The children of games which create_db reads, and so which GameRecords keep
+RECORD_CHILD_TAGS = set(["description", "year", "manufacturer", "rom", "disk", "feature", "driver"])
+GAME_START_PATTERN = re.compile(rb"<(?:game|machine|resource)[\s>]")
 
-def extract_mame_version(filename):
-    version = filename.replace("MAME ", "").replace(".xml.bz2", "")
-    version = re.sub(r"\D", "", version)
-    return float(version) if version else 0
+# Decompressed DATs are read in chunks of CHUNK_SIZE bytes, with up to CHUNK_QUEUE_SIZE read ahead (see iter_chunks)
+CHUNK_SIZE = 1024 * 1024
+CHUNK_QUEUE_SIZE = 8
+BZ2_BLOCK_SIZE = 256 * 1024
+
+# In ClrMamePro DATs these are stored as attributes of the game element, other values as child elements.
+CLRMAMEPRO_GAME_ATTRIBUTES = ("name", "cloneof", "romof", "sampleof")
+
+CLRMAMEPRO_TOKEN_PATTERN = re.compile(r'"[^"]*"|[^\s()"]+')
+
+# Values in nested blocks run up to the next key, because some are empty ('name  size 0') and some contain
+# unquoted spaces ('name uc07 p12 size 524288')
+CLRMAMEPRO_BLOCK_KEYS = set(
+    ["name", "size", "crc", "md5", "sha1", "merge", "bios", "status", "region", "offset", "flags", "description"]
+    + ["default", "serial", "date"]
+)
+
+
+# Sort ranks of version tokens. Betas ('0.33b1') and release candidates ('0.33rc1') come before the release they
+# precede, which comes before its fixes and updates ('0.35fix', '0.69a') and point releases ('0.21.5').
+VERSION_RANKS = {"b": -3, "rc": -2}
+VERSION_END_RANK = -1
+VERSION_NUMBER_RANK = 0
+VERSION_SUFFIX_RANK = 1
+
+VersionKey = tuple[tuple[int, Union[int, str]], ...]
+
+
+def extract_mame_version(filename: str) -> VersionKey:
+    """
+    Return a sort key for the version in a DAT file name or emulator version string, e.g. 'MAME 0.37b1.xml.bz2'
+    or '0.37b1'. Versions of MAME, FBA and FBN each sort correctly among themselves.
+    """
+    version = re.sub(r"\.(xml|dat)(\.bz2)?$", "", os.path.basename(filename))
+    version = re.sub(r"^[A-Za-z]+[\s_]", "", version).lower()
+    tokens = re.findall(r"\d+|[a-z]+", version)
+    key: list[tuple[int, Union[int, str]]] = []
+    for i, token in enumerate(tokens):
+        if token.isdigit():
+            key.append((VERSION_NUMBER_RANK, int(token)))
+        elif token in VERSION_RANKS and i + 1 < len(tokens) and tokens[i + 1].isdigit():
+            key.append((VERSION_RANKS[token], 0))
+        else:
+            key.append((VERSION_SUFFIX_RANK, token))
+    key.append((VERSION_END_RANK, 0))
+    return tuple(key)
+
+
+def open_dat(path: str) -> IO[bytes]:
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
 
 
 def get_xml_contents(path: str) -> bytes:
-    with bz2.open(path, "rb") as bzip_file:
-        return bzip_file.read()
+    with open_dat(path) as dat_file:
+        return dat_file.read()
+
+
+def iter_decompressed(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yield a DAT's decompressed contents in chunks of up to chunk_size bytes. bz2 DATs are decompressed a block at
+    a time in one call, which releases the GIL, rather than through BZ2File's small buffered reads.
+    """
+    with open(path, "rb") as dat_file:
+        if not path.endswith(".bz2"):
+            while chunk := dat_file.read(chunk_size):
+                yield chunk
+            return
+        decompressor = bz2.BZ2Decompressor()
+        data = b""
+        while True:
+            if decompressor.eof:
+                # bz2 files may hold several streams
+                data = decompressor.unused_data + data
+                if not data and not (data := dat_file.read(BZ2_BLOCK_SIZE)):
+                    return
+                decompressor = bz2.BZ2Decompressor()
+            elif decompressor.needs_input and not data and not (data := dat_file.read(BZ2_BLOCK_SIZE)):
+                raise EOFError(f"Compressed file ended before the end-of-stream marker was reached: {path}")
+            if chunk := decompressor.decompress(data, chunk_size):
+                yield chunk
+            data = b""
+
+
+def iter_chunks(path: str, chunk_size: int = CHUNK_SIZE, queue_size: int = CHUNK_QUEUE_SIZE) -> Iterator[bytes]:
+    """
+    Yield a DAT's decompressed contents in chunks. A thread reads ahead, up to queue_size chunks, so decompression
+    (which releases the GIL) overlaps with whatever consumes the chunks. Errors reading the file are raised here.
+    """
+    chunks: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item: Union[bytes, BaseException, None]) -> None:
+        # Give up if the consumer has gone, rather than blocking on a full queue forever
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def read() -> None:
+        try:
+            for chunk in iter_decompressed(path, chunk_size):
+                if stop.is_set():
+                    break
+                put(chunk)
+        except BaseException as error:
+            put(error)
+        finally:
+            put(None)
+
+    reader = threading.Thread(target=read, name=f"read {os.path.basename(path)}", daemon=True)
+    reader.start()
+    try:
+        while (item := chunks.get()) is not None:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+
+
+def split_xml_dat(contents: bytes, parts: int) -> list[bytes]:
+    """
+    Split an XML DAT's contents into up to `parts` standalone documents of roughly equal size. Each holds the
+    original prolog (declaration, DTD and root start tag), a run of whole games and the root end tag. Splits are
+    made at game start tags found by searching the text, which assumes, as holds for DATs, that none appears in a
+    comment or CDATA section.
+    """
+    first = GAME_START_PATTERN.search(contents)
+    if first is None or parts < 2:
+        return [contents]
+    end = contents.rindex(b"</")
+    prolog, epilog = contents[: first.start()], contents[end:]
+    step = (end - first.start()) // parts
+    starts = [first.start()]
+    for i in range(1, parts):
+        match = GAME_START_PATTERN.search(contents, max(starts[-1] + 1, first.start() + i * step), end)
+        if match is None:
+            break
+        starts.append(match.start())
+    return [prolog + contents[start:stop] + epilog for start, stop in zip(starts, starts[1:] + [end])]
 
 
 def get_dat_root(path: str) -> Optional[ET._Element]:
@@ -41,8 +188,266 @@ def get_dat_root(path: str) -> Optional[ET._Element]:
     return root
 
 
+class DatReader(ABC):
+    """
+    Yields one game element per game/machine in a DAT, whatever its format. Elements have the same tag,
+    attributes and children as in a MAME XML DAT, so they can be passed straight to create_db.process_games.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Decompressed bytes read so far, for progress reporting
+        self.bytes_read = 0
+
+    @abstractmethod
+    def iter_games(self) -> Iterator[ET._Element]:
+        pass
+
+    def count_bytes(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            self.bytes_read += len(chunk)
+            yield chunk
+
+
+class XmlDatReader(DatReader):
+    """
+    MAME (<mame>) and logiqx (<datafile>) XML DATs.
+
+    Games are parsed incrementally from chunks decompressed in a thread (see iter_chunks) and yielded as soon as
+    each is complete, so processing starts before the file has been read, and decompression overlaps with parsing
+    and processing. Parsing and processing stay in one thread, since lxml trees can't be shared between threads
+    and processing holds the GIL anyway. Games are removed from the tree once processed, so the whole DAT is never
+    held in memory.
+    """
+
+    def iter_games(self) -> Iterator[ET._Element]:
+        print(f"Reading games from {self.path}")
+        return self.iter_parsed(self.count_bytes(iter_chunks(self.path, CHUNK_SIZE)))
+
+    @classmethod
+    def iter_parsed(cls, chunks: Iterable[bytes]) -> Iterator[ET._Element]:
+        """Yield the games in an XML DAT's contents, given in chunks."""
+        parser = ET.XMLPullParser(events=("end",), tag=GAME_TAGS, remove_comments=True)
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from cls.read_games(parser)
+        parser.close()
+        yield from cls.read_games(parser)
+
+    @staticmethod
+    def read_games(parser: ET.XMLPullParser) -> Iterator[ET._Element]:
+        for _, element in parser.read_events():
+            yield element
+            if (parent := element.getparent()) is not None:
+                parent.remove(element)
+
+
+class GameRecord:
+    """
+    A game, or one of its children, built by GameRecordTarget without an lxml tree. It has the parts of the
+    _Element interface used by create_db.process_games (tag, text, get, find, findall and iterating over children),
+    so it can be processed in place of a game element. Children are grouped by tag, which keeps find and findall
+    cheap, so iterating over them gives them in document order only within each tag.
+    """
+
+    __slots__ = ("tag", "attrib", "text", "children")
+
+    def __init__(self, tag: str, attrib: dict[str, str]):
+        self.tag = tag
+        self.attrib = attrib
+        self.text: Optional[str] = None
+        self.children: dict[str, list["GameRecord"]] = {}
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return self.attrib.get(key, default)
+
+    def find(self, tag: str) -> Optional["GameRecord"]:
+        children = self.children.get(tag)
+        return children[0] if children else None
+
+    def findall(self, tag: str) -> list["GameRecord"]:
+        return self.children.get(tag, [])
+
+    def __iter__(self) -> Iterator["GameRecord"]:
+        return (child for children in self.children.values() for child in children)
+
+    def serialise(self) -> bytes:
+        """The record's contents as bytes, for fingerprinting."""
+        children = [(child.tag, child.attrib, child.text) for child in self]
+        return repr((self.tag, self.attrib, children)).encode()
+
+
+class GameRecordTarget:
+    """
+    lxml parser target (see https://lxml.de/parsing.html#the-target-parser-interface) collecting GameRecords for
+    the games in a DAT. Only the children of games which create_db reads are kept, without their own children.
+    """
+
+    def __init__(self):
+        self.games: list[GameRecord] = []
+        self.depth = 0
+        self.game: Optional[GameRecord] = None
+        self.child: Optional[GameRecord] = None
+        self.text: list[str] = []
+
+    def start(self, tag: str, attrib: dict[str, str]) -> None:
+        self.depth += 1
+        if self.depth == 2 and tag in GAME_TAGS:
+            self.game = GameRecord(tag, attrib)
+        elif self.depth == 3 and self.game is not None and tag in RECORD_CHILD_TAGS:
+            self.child = GameRecord(tag, attrib)
+            self.game.children.setdefault(tag, []).append(self.child)
+
+    def data(self, data: str) -> None:
+        if self.child is not None and self.depth == 3:
+            self.text.append(data)
+
+    def end(self, tag: str) -> None:
+        if self.depth == 3 and self.child is not None:
+            self.child.text = "".join(self.text) if self.text else None
+            self.child = None
+            self.text = []
+        elif self.depth == 2 and self.game is not None:
+            self.games.append(self.game)
+            self.game = None
+        self.depth -= 1
+
+    def close(self) -> None:
+        pass
+
+
+class XmlRecordDatReader(XmlDatReader):
+    """
+    As XmlDatReader, but yielding GameRecords built by an lxml parser target, so no tree or elements are
+    allocated. Games' children which create_db doesn't read (inputs, dipswitches, chips...) are skipped.
+    """
+
+    @classmethod
+    def iter_parsed(cls, chunks: Iterable[bytes]) -> Iterator[ET._Element]:
+        target = GameRecordTarget()
+        # _Element.get returns defaults declared in a DAT's DTD (e.g. runnable="yes"), so records include them
+        parser = ET.XMLParser(target=target, remove_comments=True, attribute_defaults=True)
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from target.games  # type: ignore
+            target.games.clear()
+        parser.close()
+        yield from target.games  # type: ignore
+
+
+class ClrMameProDatReader(DatReader):
+    """
+    ClrMamePro-style parenthetical DATs, e.g. the older FBA DATs in sources/fba/non-xml-originals. Elements are
+    built directly from each line, skipping the conversion to XML text and parsing it back.
+
+    Like the DATs themselves this is line-based: each game value or nested block (rom, biosset, disk) is on its own
+    line. Quoted game values run to the last quote on the line because some contain quotes of their own, e.g.
+    description "Hack of "The King of Fighters 2001"]".
+    """
+
+    def iter_games(self) -> Iterator[ET._Element]:
+        with open_dat(self.path) as dat_file:
+            lines = (line.decode("utf-8", errors="replace").strip() for line in self.count_bytes(dat_file))
+            for line in lines:
+                tag = line.split("(", 1)[0].strip()
+                if tag in GAME_TAGS and line.endswith("("):
+                    yield self.parse_game(tag, lines)
+
+    @staticmethod
+    def parse_block(line: str) -> dict[str, str]:
+        """Parse a single-line block such as 'rom ( name x size 1 crc y )' into attributes."""
+        content = line.split("(", 1)[1].rsplit(")", 1)[0]
+        values: dict[str, list[str]] = {}
+        key = None
+        for token in CLRMAMEPRO_TOKEN_PATTERN.findall(content):
+            if token in CLRMAMEPRO_BLOCK_KEYS:
+                key = token
+                values[key] = []
+            elif key is not None:
+                values[key].append(token.strip('"'))
+        # Flags without values, e.g. 'default' in some biossets, are given an empty value
+        return {key: " ".join(value) for key, value in values.items()}
+
+    def parse_game(self, tag: str, lines: Iterator[str]) -> ET._Element:
+        game_element = ET.Element(tag)
+        for line in lines:
+            if line == ")":
+                break
+            key, _, value = line.partition(" ")
+            value = value.strip()
+            if not key:
+                continue
+            if value.startswith("("):
+                attributes = self.parse_block(line)
+                # Some FBA DATs include placeholder roms with no name, which can't match a file
+                if key == "rom" and not attributes.get("name"):
+                    continue
+                ET.SubElement(game_element, key, attributes)
+            else:
+                if len(value) > 1 and value.startswith('"') and value.endswith('"'):
+                    value = value[1:-1]
+                if key in CLRMAMEPRO_GAME_ATTRIBUTES:
+                    game_element.set(key, value)
+                else:
+                    ET.SubElement(game_element, key).text = value
+        return game_element
+
+
+def get_dat_format(path: str) -> str:
+    with open_dat(path) as dat_file:
+        head = dat_file.read(1024).lstrip()
+    return "xml" if head.startswith(b"<") else "clrmamepro"
+
+
+DAT_READERS: dict[str, type[DatReader]] = {
+    "xml": XmlDatReader,
+    "clrmamepro": ClrMameProDatReader,
+}
+
+# Ways of parsing XML DATs: into lxml elements ("tree") or straight into GameRecords ("records")
+PARSE_ENGINES: dict[str, type[XmlDatReader]] = {
+    "tree": XmlDatReader,
+    "records": XmlRecordDatReader,
+}
+PARSE_ENGINE = "tree"
+
+
+def set_parse_engine(engine: str) -> None:
+    """Set the engine used for XML DATs in this process. Also a Pool initializer, to set it in workers."""
+    global PARSE_ENGINE
+    PARSE_ENGINE = engine
+
+
+def get_dat_reader(path: str) -> DatReader:
+    dat_format = get_dat_format(path)
+    if dat_format == "xml":
+        return PARSE_ENGINES[PARSE_ENGINE](path)
+    return DAT_READERS[dat_format](path)
+
+
+def iter_part_games(part: bytes) -> Iterator[ET._Element]:
+    """Yield the games in part of a DAT (see split_xml_dat), fed to the parser a chunk at a time."""
+    chunks = (part[start : start + CHUNK_SIZE] for start in range(0, len(part), CHUNK_SIZE))
+    return PARSE_ENGINES[PARSE_ENGINE].iter_parsed(chunks)
+
+
+def get_direct_fba_dats() -> list[str]:
+    """
+    FBA DATs with the originals used in place of the XMLs converted from them.
+    """
+    original_versions = {os.path.basename(path).replace("fba_", "FBA ") for path in FBA_ORIGINAL_DATS}
+    converted = [path for path in FBA_DATS if os.path.basename(path).replace(".bz2", "") not in original_versions]
+    return converted + FBA_ORIGINAL_DATS
+
+
+def sort_dats(paths: list[str]) -> list[str]:
+    """Order DATs by version, so builds (and shards, see create_workflow.py) cover the same DATs on any machine."""
+    return sorted(paths, key=lambda path: (extract_mame_version(path), os.path.basename(path)))
+
+
 BUILD_DATS = {
-    "mame": MAME_DATS + FBA_DATS + FBN_DATS,
+    "mame": sort_dats(MAME_DATS) + sort_dats(FBA_DATS) + sort_dats(FBN_DATS),
+    "direct": sort_dats(MAME_DATS) + sort_dats(get_direct_fba_dats()) + sort_dats(FBN_DATS),
 }
 
 # BUILD_DATS = {
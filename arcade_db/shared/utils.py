@@ -3,6 +3,7 @@
 import gc
 from typing import Type
 import os
+import sys
 import warnings
 import functools
 import time
@@ -25,6 +26,18 @@ def log_memory(msg=""):
     return memory_mb
 
 
+def get_peak_memory() -> float:
+    """Return the process's peak resident set size so far, in MB."""
+    memory_info = psutil.Process(os.getpid()).memory_info()
+    if hasattr(memory_info, "peak_wset"):  # Windows
+        return memory_info.peak_wset / (1024 * 1024)
+    import resource
+
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
 def time_execution(message: str):
     def decorator(func):
         @functools.wraps(func)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+"""
+A read-only, memory-mapped lookup file written next to arcade.db by the optional snapshot stage.
+
+The file is a fixed header followed by five sections:
+
+- games: fixed size records sorted by game identity hash
+- roms: fixed size records sorted by (crc, size), for dumped roms only
+- game_roms, rom_games: arrays of record indexes, giving each game's roms and each rom's games
+- strings: length-prefixed UTF-8 names and descriptions, referenced by offset
+
+Snapshot reads records in place with struct.unpack_from and binary searches the sorted sections, so opening a
+snapshot costs an mmap and a header read. Processes opening the same file share its pages in the OS page cache.
+"""
+
+from typing import Any, Iterator, NamedTuple, Optional, Union
+import os
+import mmap
+import struct
+
+from .shared import indexing
+
+SNAPSHOT_NAME = "arcade.snapshot"
+
+MAGIC = b"ARCSNAP1"
+FORMAT_VERSION = 2
+SECTIONS = ("games", "roms", "game_roms", "rom_games", "strings")
+
+# Magic, format version, then an (offset, count) pair per section
+HEADER = struct.Struct("<8sI" + "QQ" * len(SECTIONS))
+# Hash, id, name offset, description offset, first game_roms index, game_roms count
+GAME_RECORD = struct.Struct("<32sQIIII")
+# CRC, size, id, name offset, first rom_games index, rom_games count
+ROM_RECORD = struct.Struct("<IQQIII")
+ROM_KEY = struct.Struct("<IQ")
+INDEX = struct.Struct("<I")
+STRING_LENGTH = struct.Struct("<I")
+
+DatTable = dict[str, dict[str, Any]]
+
+
+class SnapshotGame(NamedTuple):
+    position: int
+    id: int
+    name: str
+    description: str
+
+
+class SnapshotRom(NamedTuple):
+    position: int
+    id: int
+    name: str
+    size: int
+    crc: int
+
+
+class StringTable:
+    """Deduplicating builder for the strings section."""
+
+    def __init__(self):
+        self.offsets: dict[str, int] = {}
+        self.data = bytearray()
+
+    def add(self, value: Optional[str]) -> int:
+        value = value or ""
+        if (offset := self.offsets.get(value)) is None:
+            encoded = value.encode()
+            offset = self.offsets[value] = len(self.data)
+            self.data += STRING_LENGTH.pack(len(encoded)) + encoded
+        return offset
+
+
+def to_digest(value: Union[bytes, str]) -> bytes:
+    """Identity hashes are hex strings, or raw digests in databases built with binary hashes."""
+    return value if isinstance(value, bytes) else bytes.fromhex(value)
+
+
+def write_snapshot_file(dat_data: dict[str, DatTable], path: str) -> None:
+    """Write a snapshot of DatData."""
+    strings = StringTable()
+    games = sorted(dat_data["games"].values(), key=lambda game: to_digest(game["hash"]))
+    roms = [rom for rom in dat_data["roms"].values() if indexing.crc_to_int(rom["crc"]) is not None]
+    roms.sort(key=lambda rom: (indexing.crc_to_int(rom["crc"]), int(rom["size"])))
+    game_indexes = {game["id"]: i for i, game in enumerate(games)}
+    rom_indexes = {rom["id"]: i for i, rom in enumerate(roms)}
+
+    game_roms: list[list[int]] = [[] for _ in games]
+    rom_games: list[list[int]] = [[] for _ in roms]
+    for game_rom in dat_data["game_rom"].values():
+        game_index, rom_index = game_indexes[game_rom["game_id"]], rom_indexes.get(game_rom["rom_id"])
+        if rom_index is not None:
+            game_roms[game_index].append(rom_index)
+            rom_games[rom_index].append(game_index)
+
+    game_roms_array: list[int] = []
+    rom_games_array: list[int] = []
+    game_records = bytearray()
+    for game, indexes in zip(games, game_roms):
+        game_records += GAME_RECORD.pack(
+            to_digest(game["hash"]),
+            game["id"],
+            strings.add(game["name"]),
+            strings.add(game.get("description")),
+            len(game_roms_array),
+            len(indexes),
+        )
+        game_roms_array.extend(sorted(indexes))
+    rom_records = bytearray()
+    for rom, indexes in zip(roms, rom_games):
+        rom_records += ROM_RECORD.pack(
+            indexing.crc_to_int(rom["crc"]),
+            int(rom["size"]),
+            rom["id"],
+            strings.add(rom["name"]),
+            len(rom_games_array),
+            len(indexes),
+        )
+        rom_games_array.extend(sorted(indexes))
+    sections = {
+        "games": bytes(game_records),
+        "roms": bytes(rom_records),
+        "game_roms": b"".join(INDEX.pack(index) for index in game_roms_array),
+        "rom_games": b"".join(INDEX.pack(index) for index in rom_games_array),
+        "strings": bytes(strings.data),
+    }
+    counts = {
+        "games": len(games),
+        "roms": len(roms),
+        "game_roms": len(game_roms_array),
+        "rom_games": len(rom_games_array),
+        "strings": len(strings.data),
+    }
+
+    header_values: list[int] = []
+    offset = HEADER.size
+    for section in SECTIONS:
+        header_values.extend((offset, counts[section]))
+        offset += len(sections[section])
+    temp_path = f"{path}.part"
+    with open(temp_path, "wb") as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, *header_values))
+        for section in SECTIONS:
+            snapshot_file.write(sections[section])
+    os.replace(temp_path, path)
+
+
+def write_snapshot(dat_data: dict[str, DatTable], engine: Any) -> None:
+    path = os.path.join(os.path.dirname(engine.url.database), SNAPSHOT_NAME)
+    print(f"Writing snapshot to {path}...")
+    write_snapshot_file(dat_data, path)
+
+
+class Snapshot:
+    """
+    Lookups against a snapshot file. Use as a context manager, or call close(). Records returned by the find_
+    methods carry their position in the file, which the get_ methods use to follow associations.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as snapshot_file:
+            self.mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, *header_values = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.mmap.close()
+            raise ValueError(f"Not a version {FORMAT_VERSION} snapshot: {path}")
+        self.offsets = dict(zip(SECTIONS, header_values[::2]))
+        self.counts = dict(zip(SECTIONS, header_values[1::2]))
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.mmap.close()
+
+    def get_string(self, offset: int) -> str:
+        start = self.offsets["strings"] + offset
+        (length,) = STRING_LENGTH.unpack_from(self.mmap, start)
+        start += STRING_LENGTH.size
+        return self.mmap[start : start + length].decode()
+
+    def get_index(self, section: str, position: int) -> int:
+        return INDEX.unpack_from(self.mmap, self.offsets[section] + position * INDEX.size)[0]
+
+    def get_game(self, position: int) -> SnapshotGame:
+        _, game_id, name, description, _, _ = GAME_RECORD.unpack_from(
+            self.mmap, self.offsets["games"] + position * GAME_RECORD.size
+        )
+        return SnapshotGame(position, game_id, self.get_string(name), self.get_string(description))
+
+    def get_rom(self, position: int) -> SnapshotRom:
+        crc, size, rom_id, name, _, _ = ROM_RECORD.unpack_from(
+            self.mmap, self.offsets["roms"] + position * ROM_RECORD.size
+        )
+        return SnapshotRom(position, rom_id, self.get_string(name), size, crc)
+
+    def find_game(self, index_hash: Union[bytes, str]) -> Optional[SnapshotGame]:
+        """Return the game with the given identity hash (see indexing.get_game_index_hash)."""
+        digest = to_digest(index_hash)
+        offset = self.offsets["games"]
+        low, high = 0, self.counts["games"]
+        while low < high:
+            middle = (low + high) // 2
+            start = offset + middle * GAME_RECORD.size
+            if self.mmap[start : start + 32] < digest:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.counts["games"]:
+            start = offset + low * GAME_RECORD.size
+            if self.mmap[start : start + 32] == digest:
+                return self.get_game(low)
+        return None
+
+    def find_roms(self, crc: Union[int, str], size: int) -> list[SnapshotRom]:
+        """Return the roms with the given CRC and size. Several roms (with different names) may match."""
+        crc_value = indexing.crc_to_int(crc)
+        if crc_value is None:
+            return []
+        key = (crc_value, size)
+        offset = self.offsets["roms"]
+        low, high = 0, self.counts["roms"]
+        while low < high:
+            middle = (low + high) // 2
+            if ROM_KEY.unpack_from(self.mmap, offset + middle * ROM_RECORD.size) < key:
+                low = middle + 1
+            else:
+                high = middle
+        roms = []
+        while low < self.counts["roms"] and ROM_KEY.unpack_from(self.mmap, offset + low * ROM_RECORD.size) == key:
+            roms.append(self.get_rom(low))
+            low += 1
+        return roms
+
+    def get_game_roms(self, game: SnapshotGame) -> Iterator[SnapshotRom]:
+        """Yield the dumped roms of a game."""
+        *_, start, count = GAME_RECORD.unpack_from(self.mmap, self.offsets["games"] + game.position * GAME_RECORD.size)
+        for position in range(start, start + count):
+            yield self.get_rom(self.get_index("game_roms", position))
+
+    def get_rom_games(self, rom: SnapshotRom) -> Iterator[SnapshotGame]:
+        *_, start, count = ROM_RECORD.unpack_from(self.mmap, self.offsets["roms"] + rom.position * ROM_RECORD.size)
+        for position in range(start, start + count):
+            yield self.get_game(self.get_index("rom_games", position))
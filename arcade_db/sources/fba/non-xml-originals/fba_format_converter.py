@@ -7,17 +7,26 @@ Converts FBNeo DAT files from various formats to the MAME XML format:
 - v2: Partial XML without datafile wrapper → MAME XML
 - v3: Already complete MAME XML (copy as-is)
 
+Input is read and output written line by line, so memory use doesn't grow with file size. Output paths ending
+'.bz2' are compressed as they're written. Directories are converted across multiple processes.
+
 Usage:
-    python fba_format_converter.py <input_dir> <output_dir>
+    python fba_format_converter.py <input_dir> <output_dir> [--bz2] [--processes N]
     python fba_format_converter.py <input_file> <output_file>
 """
 
+from typing import IO, Iterable, Iterator, Optional
 import os
 import re
+import bz2
 import sys
 import argparse
+import multiprocessing
 from pathlib import Path
 
+# Enough of the start of a file to find the XML declaration, DOCTYPE and <datafile> element
+FORMAT_DETECTION_SIZE = 4096
+
 
 class FBAFormatConverter:
     """Converts FBNeo DAT files between different formats."""
@@ -30,12 +39,12 @@ class FBAFormatConverter:
         self.xml_footer = "</datafile>"
 
     def detect_format(self, content: str) -> str:
-        """Detect the format of the input file."""
-        content = content.strip()
+        """Detect the format of the input file from (at least) its first few KB."""
+        content = content.lstrip()
 
         if content.startswith("<?xml") and "<datafile>" in content:
             return "v3"  # Complete MAME XML
-        elif content.startswith("<game") or content.startswith("\t<game"):
+        elif content.startswith("<game"):
             return "v2"  # Partial XML without wrapper
         elif content.startswith("game ("):
             return "v1"  # Non-XML parenthetical format
@@ -44,33 +53,27 @@ class FBAFormatConverter:
 
     def convert_v1_to_xml(self, content: str) -> str:
         """Convert v1 parenthetical format to MAME XML."""
-        lines = content.strip().split("\n")
-        xml_lines = [self.xml_header]
-
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-
+        return "\n".join(self.iter_v1_xml(content.strip().split("\n")))
+
+    def iter_v1_xml(self, lines: Iterable[str]) -> Iterator[str]:
+        """Convert v1 parenthetical lines to MAME XML lines, one block at a time."""
+        yield self.xml_header
+        line_iterator = iter(lines)
+        for line in line_iterator:
+            line = line.strip()
             if line.startswith("game (") or line.startswith("resource ("):
                 element_type = "game" if line.startswith("game (") else "resource"
-                i, xml_block = self._parse_v1_block(lines, i, element_type)
-                xml_lines.extend(xml_block)
-            else:
-                i += 1
-
-        xml_lines.append(self.xml_footer)
-        return "\n".join(xml_lines)
+                yield from self._parse_v1_block(line_iterator, element_type)
+        yield self.xml_footer
 
-    def _parse_v1_block(self, lines: list[str], start_idx: int, element_type: str) -> tuple:
-        """Parse a v1 game or resource block into XML."""
+    def _parse_v1_block(self, lines: Iterator[str], element_type: str) -> list[str]:
+        """Parse a v1 game or resource block into XML, consuming lines up to the closing parenthesis."""
         xml_block = []
         attributes = {}
         child_elements = []
 
-        i = start_idx + 1
-
-        while i < len(lines):
-            line = lines[i].strip()
+        for line in lines:
+            line = line.strip()
 
             if line == ")":
                 break
@@ -85,8 +88,6 @@ class FBAFormatConverter:
                 if attr_name:
                     attributes[attr_name] = attr_value
 
-            i += 1
-
         attrs_str = " ".join(
             f'{k}="{self._escape_xml(v)}"' for k, v in attributes.items() if k in ["name", "cloneof", "romof"]
         )
@@ -100,7 +101,7 @@ class FBAFormatConverter:
 
         xml_block.append(f"\t</{element_type}>")
 
-        return i + 1, xml_block
+        return xml_block
 
     def _parse_v1_attribute(self, line: str) -> tuple:
         """Parse a v1 attribute line."""
@@ -172,16 +173,36 @@ class FBAFormatConverter:
 
     def convert_v2_to_xml(self, content: str) -> str:
         """Convert v2 partial XML to complete MAME XML."""
-        content = content.strip()
-        if not content.startswith("<?xml"):
-            return f"{self.xml_header}\n{content}\n{self.xml_footer}"
-        else:
-            if "<datafile>" not in content:
-                content = re.sub(r"<\?xml[^>]*\?>\s*", "", content)
-                content = re.sub(r"<!DOCTYPE[^>]*>\s*", "", content)
-                return f"{self.xml_header}\n{content}\n{self.xml_footer}"
-
-        return content
+        return "\n".join(self.iter_v2_xml(content.split("\n")))
+
+    def iter_v2_xml(self, lines: Iterable[str]) -> Iterator[str]:
+        """
+        Wrap v2 partial XML lines in the datafile header and footer. Leading and trailing blank lines are dropped
+        and any XML declaration or DOCTYPE is replaced by those in the header.
+        """
+        yield self.xml_header
+        started = False
+        blank_lines: list[str] = []
+        previous_line: Optional[str] = None
+        for line in lines:
+            line = line.rstrip("\n")
+            if not started:
+                line = re.sub(r"<\?xml[^>]*\?>\s*", "", line.lstrip())
+                line = re.sub(r"<!DOCTYPE[^>]*>\s*", "", line)
+                if not line:
+                    continue
+                started = True
+            if not line.strip():
+                blank_lines.append(line)
+                continue
+            if previous_line is not None:
+                yield previous_line
+            yield from blank_lines
+            blank_lines = []
+            previous_line = line
+        if previous_line is not None:
+            yield previous_line.rstrip()
+        yield self.xml_footer
 
     def _escape_xml(self, text: str) -> str:
         """Escape XML special characters."""
@@ -196,33 +217,67 @@ class FBAFormatConverter:
             .replace("'", "&#39;")
         )
 
-    def convert_file(self, input_path: str, output_path: str) -> None:
-        """Convert a single file."""
-        with open(input_path, "r", encoding="utf-8") as f:
-            content = f.read()
+    def iter_xml(self, input_file: IO[str]) -> Iterator[str]:
+        """Detect the format of an open file and yield its contents as MAME XML lines."""
+        format_type = self.detect_format(input_file.read(FORMAT_DETECTION_SIZE))
+        input_file.seek(0)
+        if format_type == "v1":
+            return self.iter_v1_xml(input_file)
+        elif format_type == "v2":
+            return self.iter_v2_xml(input_file)
+        elif format_type == "v3":
+            print("Already in MAME format, copying as-is")
+            return self._split_lines(input_file)
+        raise ValueError(f"Unsupported format: {format_type}")
+
+    @staticmethod
+    def _split_lines(input_file: IO[str]) -> Iterator[str]:
+        """Yield lines without line endings, with a final empty line if the file ends with a newline."""
+        line = ""
+        for line in input_file:
+            yield line[:-1] if line.endswith("\n") else line
+        if line.endswith("\n"):
+            yield ""
 
+    def convert_file(self, input_path: str, output_path: str) -> None:
+        """Convert a single file. Output paths ending '.bz2' are compressed."""
+        print(f"Converting {input_path} -> {output_path}")
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        temp_path = f"{output_path}.part"
         try:
-            format_type = self.detect_format(content)
-            print(f"Converting {input_path} (format: {format_type}) -> {output_path}")
-            if format_type == "v1":
-                converted = self.convert_v1_to_xml(content)
-            elif format_type == "v2":
-                converted = self.convert_v2_to_xml(content)
-            elif format_type == "v3":
-                converted = content
-                print("Already in MAME format, copying as-is")
-            else:
-                raise ValueError(f"Unsupported format: {format_type}")
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(converted)
+            with open(input_path, "r", encoding="utf-8") as input_file:
+                xml_lines = self.iter_xml(input_file)
+                opener = bz2.open if output_path.endswith(".bz2") else open
+                with opener(temp_path, "wt", encoding="utf-8") as output_file:
+                    self._write_lines(xml_lines, output_file)
+            os.replace(temp_path, output_path)
             print(f"  Successfully converted to {output_path}")
         except Exception as e:
             print(f"Error converting {input_path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
             raise
 
-    def convert_directory(self, input_dir: str, output_dir: str) -> None:
-        """Convert all XML files in a directory."""
+    @staticmethod
+    def _write_lines(lines: Iterable[str], output_file: IO[str]) -> None:
+        for i, line in enumerate(lines):
+            if i:
+                output_file.write("\n")
+            output_file.write(line)
+
+    @staticmethod
+    def get_output_name(input_name: str, compress: bool) -> str:
+        """Compressed output follows the sources/fba/dats naming: fba_029523.xml -> FBA 029523.xml.bz2."""
+        if not compress:
+            return input_name
+        return f"{input_name.replace('fba_', 'FBA ', 1)}.bz2"
+
+    def convert_directory(
+        self, input_dir: str, output_dir: str, compress: bool = False, processes: Optional[int] = None
+    ) -> None:
+        """Convert all XML files in a directory using a pool of processes."""
         input_path = Path(input_dir)
         output_path = Path(output_dir)
 
@@ -231,16 +286,18 @@ class FBAFormatConverter:
 
         output_path.mkdir(parents=True, exist_ok=True)
 
-        xml_files = list(input_path.glob("*.xml"))
+        xml_files = sorted(input_path.glob("*.xml"))
         if not xml_files:
             print(f"No XML files found in {input_dir}")
             return
 
         print(f"Found {len(xml_files)} XML files to convert")
 
-        for xml_file in xml_files:
-            output_file = output_path / xml_file.name
-            self.convert_file(str(xml_file), str(output_file))
+        tasks = [
+            (str(xml_file), str(output_path / self.get_output_name(xml_file.name, compress))) for xml_file in xml_files
+        ]
+        with multiprocessing.Pool(processes=processes) as pool:
+            pool.starmap(self.convert_file, tasks)
 
 
 def main():
@@ -248,6 +305,8 @@ def main():
     parser.add_argument("input", help="Input file or directory")
     parser.add_argument("output", help="Output file or directory")
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument("--bz2", "-z", action="store_true", help="Compress directory output to 'FBA x.xml.bz2'")
+    parser.add_argument("--processes", "-p", type=int, default=None, help="Processes to use (defaults to CPU count)")
 
     args = parser.parse_args()
 
@@ -259,7 +318,7 @@ def main():
             converter.convert_file(args.input, args.output)
         elif os.path.isdir(args.input):
             # Convert directory
-            converter.convert_directory(args.input, args.output)
+            converter.convert_directory(args.input, args.output, compress=args.bz2, processes=args.processes)
         else:
             print(f"Error: Input path '{args.input}' is neither a file nor a directory")
             return 1
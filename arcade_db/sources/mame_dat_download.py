@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
 
+"""
+Download MAME DAT archives from progetto snaps and convert them to the 'MAME x.xml.bz2' layout used by
+sources.MAME_DATS.
+
+Run from the repo root with:
+
+    python -m arcade_db.sources.mame_dat_download
+"""
+
+from typing import Iterator, IO, Optional
 import os
-from urllib.request import urlretrieve
+import re
+import bz2
+import shutil
+import argparse
+import tempfile
+from contextlib import contextmanager
 
-import py7zr
-import rarfile
+from ..shared import fetch
 
 BASE_URL_1 = "https://www.progettosnaps.net/download/?tipo=dat_mame&file=/dats/MAME/packs/MAME_Dats_{}.7z"
 BASE_URL_2 = "https://www.progettosnaps.net/download/?tipo=dat_mame&file=/dats/MAME/MAME_Dats_{}.rar"
@@ -17,48 +31,149 @@ OTHER_URLS = [
 
 STANDARD_VERSIONED_RANGES = ((1, 31), (33, 36), (53, 262))
 
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_DIR = os.path.join(SCRIPT_DIR, "mame", "archives")
+MAME_DAT_DIR = os.path.join(SCRIPT_DIR, "mame", "dats")
+MANIFEST_FILENAME = "manifest.json"
+
+# Progetto snaps responds to missing files with an HTML page, so downloads are checked by signature
+ARCHIVE_SIGNATURES = (b"7z\xbc\xaf\x27\x1c", b"Rar!\x1a\x07")
+
+LISTING_EXTENSIONS = (".xml", ".dat")
+
 
 def is_valid_archive(path: str) -> bool:
-    try:
-        py7zr.SevenZipFile(path, mode="r")
-        return True
-    except (py7zr.Bad7zFile, FileNotFoundError):
-        pass
-    try:
-        rarfile.RarFile(path)
-        return True
-    except (rarfile.BadRarFile, FileNotFoundError):
-        pass
-    return False
-
-
-def download_dat(url, target):
-    try:
-        urlretrieve(url, target)
-        print(url, target)
-        return True
-    except Exception as e:
-        print("Error: ", url, e)
-    return False
-
-
-for range_ in STANDARD_VERSIONED_RANGES:
-    for i in range(range_[0], range_[1]):
-        version = str(i).zfill(3)
-        urls = [BASE_URL_1.format(version), BASE_URL_2.format(version)]
-        targets = [
-            os.path.join(".", "dats", f"MAME-DATS-{version}.7z"),
-            os.path.join(".", "dats", f"MAME-DATS-{version}.rar"),
-        ]
-        if not any([is_valid_archive(target) for target in targets]):
-            for i in range(2):
-                if download_dat(urls[i], targets[i]):
-                    break
-
-for version, url in OTHER_URLS:
-    targets = [
-        os.path.join(".", "dats", f"MAME-DATS-{version}.7z"),
-        os.path.join(".", "dats", f"MAME-DATS-{version}.rar"),
-    ]
-    if not any([is_valid_archive(target) for target in targets]):
-        download_dat(url, os.path.join(".", "dats", f"MAME-DATS-{version}.{url[-3:]}".replace("..", ".")))
+    with open(path, "rb") as archive_file:
+        header = archive_file.read(8)
+    return any(header.startswith(signature) for signature in ARCHIVE_SIGNATURES)
+
+
+def get_archive_target(archive_dir: str, version: str, extension: str) -> str:
+    return os.path.join(archive_dir, f"MAME-DATS-{version}.{extension}")
+
+
+def get_download_jobs(archive_dir: str) -> list[fetch.DownloadJob]:
+    jobs = []
+    for range_ in STANDARD_VERSIONED_RANGES:
+        for i in range(range_[0], range_[1]):
+            version = str(i).zfill(3)
+            jobs.append(
+                [
+                    (BASE_URL_1.format(version), get_archive_target(archive_dir, version, "7z")),
+                    (BASE_URL_2.format(version), get_archive_target(archive_dir, version, "rar")),
+                ]
+            )
+    for version, url in OTHER_URLS:
+        jobs.append([(url, get_archive_target(archive_dir, version, url[-3:].replace(".", "")))])
+    return jobs
+
+
+def get_dotted_version(archive_version: str) -> str:
+    """
+    Convert an archive version ('001', '037b1') to the dotted form used in DAT file names ('0.1', '0.37b1').
+    """
+    if match := re.match(r"^(\d+)(\D\w*)?$", archive_version):
+        return f"0.{int(match.group(1))}{match.group(2) or ''}"
+    return archive_version
+
+
+def get_member_version(member_name: str) -> Optional[str]:
+    """
+    Multi-version packs don't share a single archive version, so each member is named from its own file name.
+    """
+    if match := re.search(r"0\.(\d+\w*?)(?:\.xml|\.dat)?$", os.path.basename(member_name), re.IGNORECASE):
+        return f"0.{match.group(1)}"
+    return None
+
+
+def get_listing_members(member_names: list[str]) -> list[str]:
+    """Prefer XML listings. Some archives (approx 53 - 84) only include DATs."""
+    for extension in LISTING_EXTENSIONS:
+        if members := [name for name in member_names if name.lower().endswith(extension)]:
+            return members
+    return []
+
+
+@contextmanager
+def open_archive_member(archive_path: str, member_name: str) -> Iterator[IO[bytes]]:
+    # py7zr and rarfile are only needed for conversion, so are imported here rather than at module level
+    if archive_path.endswith(".7z"):
+        import py7zr
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with py7zr.SevenZipFile(archive_path, mode="r") as archive:
+                archive.extract(path=temp_dir, targets=[member_name])
+            with open(os.path.join(temp_dir, member_name), "rb") as member_file:
+                yield member_file
+    else:
+        import rarfile
+
+        with rarfile.RarFile(archive_path) as archive:
+            with archive.open(member_name) as member_file:
+                yield member_file
+
+
+def get_archive_member_names(archive_path: str) -> list[str]:
+    if archive_path.endswith(".7z"):
+        import py7zr
+
+        with py7zr.SevenZipFile(archive_path, mode="r") as archive:
+            return archive.getnames()
+    import rarfile
+
+    with rarfile.RarFile(archive_path) as archive:
+        return archive.namelist()
+
+
+def compress_stream(source: IO[bytes], target: str) -> None:
+    temp_target = f"{target}{fetch.PARTIAL_SUFFIX}"
+    with bz2.open(temp_target, "wb") as bzip_file:
+        shutil.copyfileobj(source, bzip_file, fetch.CHUNK_SIZE)
+    os.replace(temp_target, target)
+
+
+def convert_archive(archive_path: str, dat_dir: str) -> list[str]:
+    """
+    Write each listing in an archive to dat_dir as 'MAME <version>.<xml|dat>.bz2', skipping any which exist.
+    """
+    archive_version = os.path.basename(archive_path).replace("MAME-DATS-", "").rsplit(".", 1)[0]
+    members = get_listing_members(get_archive_member_names(archive_path))
+    written = []
+    for member_name in members:
+        version = get_dotted_version(archive_version) if len(members) == 1 else get_member_version(member_name)
+        if version is None:
+            print("Unable to determine version: ", archive_path, member_name)
+            continue
+        extension = member_name.lower().rsplit(".", 1)[1]
+        target = os.path.join(dat_dir, f"MAME {version}.{extension}.bz2")
+        if os.path.exists(target):
+            continue
+        with open_archive_member(archive_path, member_name) as member_file:
+            compress_stream(member_file, target)
+        written.append(target)
+        print(archive_path, member_name, target)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download and convert MAME DAT archives")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="Directory for downloaded archives")
+    parser.add_argument("--dat-dir", default=MAME_DAT_DIR, help="Directory for converted DATs")
+    parser.add_argument("--workers", "-w", type=int, default=4, help="Maximum concurrent downloads")
+    parser.add_argument("--no-convert", action="store_true", help="Download archives without converting them")
+    args = parser.parse_args()
+
+    os.makedirs(args.archive_dir, exist_ok=True)
+    archives = fetch.download_all(
+        get_download_jobs(args.archive_dir),
+        os.path.join(args.archive_dir, MANIFEST_FILENAME),
+        max_workers=args.workers,
+        validate=is_valid_archive,
+    )
+    if not args.no_convert:
+        for archive_path in archives:
+            convert_archive(archive_path, args.dat_dir)
+
+
+if __name__ == "__main__":
+    main()
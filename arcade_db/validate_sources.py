@@ -8,9 +8,11 @@ For now, this only validates the MAME source files
 """
 from typing import Any, Optional
 import os
+import time
+import argparse
 import multiprocessing
 from lxml import etree as ET
-from shared import sources
+from shared import catalogue, progress, sources
 
 KNOWN_ELEMENT_TAG_NAMES = set(["game", "machine"])
 
@@ -196,9 +198,28 @@ def process_dat(
     return None
 
 
-def process_files():
+def timed_process_dat(path: str) -> tuple[str, float, int, Any]:
+    start_time = time.perf_counter()
+    result = process_dat(path)
+    return path, time.perf_counter() - start_time, os.getpid(), result
+
+
+def process_files(progress_log: Optional[str] = None):
+    # The catalogue counts games without parsing, so the total (for estimating build times) is quick once scanned
+    entries = catalogue.update_catalogue(sources.FBA_DATS, num_processes=4)
+    print(f"{len(entries)} DATs, {sum(entry['games'] for entry in entries.values())} games")
+
+    # Games and decompressed sizes come from the catalogue, since DATs are read whole by get_dat_root
+    weights = {path: entry["uncompressed_size"] for path, entry in entries.items()}
+    tracker = progress.BuildProgress(sources.FBA_DATS, progress_log, weights, label="validate")
+    results_by_path = {}
     with multiprocessing.Pool(4) as pool:
-        results = pool.map(process_dat, sources.FBA_DATS)
+        for path, seconds, worker, result in pool.imap_unordered(timed_process_dat, sources.FBA_DATS):
+            results_by_path[path] = result
+            stats = {"games": entries[path]["games"], "bytes": weights[path], "seconds": seconds, "worker": worker}
+            tracker.update(path, stats)
+    tracker.finish()
+    results = [results_by_path[path] for path in sources.FBA_DATS]
 
     game_attributes = set()
     driver_attributes = set()
@@ -247,4 +268,6 @@ def process_files():
 
 
 if __name__ == "__main__":
-    process_files()
+    parser = argparse.ArgumentParser(description="Validate the assumptions create_db makes about the FBA DATs")
+    parser.add_argument("--progress-log", help="Also write progress events to this JSON-lines file")
+    process_files(parser.parse_args().progress_log)
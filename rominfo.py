@@ -5,11 +5,12 @@ from zipfile import ZipFile
 
 import click
 
-from arcade_db import create_db
-from arcade_db.shared import db, indexing, sources
+from arcade_db import create_db, export, profiling, queries, shards, snapshot
+from arcade_db.shared import catalogue, db, indexing, sources
 
 
 DB_PATH = Path("./arcade-out/arcade.db")
+SNAPSHOT_PATH = DB_PATH.with_name(snapshot.SNAPSHOT_NAME)
 
 
 def to_hex(value) -> str:
@@ -33,6 +34,12 @@ def get_arcade_game_index(file_path: str) -> str:
     return signature
 
 
+def check_low_memory(exports, stages, shard=False):
+    # Exports, stages and shards are written from the whole DatData, which a low memory build never holds
+    if exports or stages or shard:
+        raise click.UsageError("--low-memory can't be combined with --export, --stage or --shard")
+
+
 @click.group()
 def cli():
     pass
@@ -45,29 +52,264 @@ def cli():
 @click.option("--end", "-e", default=None, type=int, help="End DAT index")
 @click.option("--concurrent", "-c", is_flag=True, help="Enable concurrent processing using multiprocessing")
 @click.option("--processes", "-p", default=4, type=int, help="Number of processes to use (defaults to 4)")
-def build(dir, dat_type, start, end, concurrent, processes):
+@click.option(
+    "--export",
+    "exports",
+    multiple=True,
+    type=click.Choice(list(export.EXPORTERS)),
+    help="Also export tables in this format (repeatable). Parquet and Arrow need pyarrow (the arrow extra).",
+)
+@click.option(
+    "--binary-hashes", is_flag=True, help="Store CRCs as integers and sha1/md5/identity hashes as raw digests"
+)
+@click.option(
+    "--stage",
+    "stages",
+    multiple=True,
+    type=click.Choice(list(create_db.STAGES)),
+    help="Also run this optional stage, adding derived tables to the database (repeatable)",
+)
+@click.option("--shard", is_flag=True, help="Write a shard for the merge command rather than a database")
+@click.option(
+    "--low-memory",
+    is_flag=True,
+    help="Spill each DAT's records to disk and write the database from them, using memory for one DAT at a time",
+)
+@click.option("--delta", is_flag=True, help="Only fully process games which are new or changed since the previous DAT")
+@click.option(
+    "--game-cache-mb",
+    default=None,
+    type=click.FloatRange(min=0),
+    help="Replay the hashes of games seen in earlier DATs from a cache of up to this many MB (per process)",
+)
+@click.option(
+    "--split-mb",
+    default=None,
+    type=float,
+    help="With --concurrent, split XML DATs of at least this many MB (compressed) into a part per process",
+)
+@click.option(
+    "--engine",
+    default=sources.PARSE_ENGINE,
+    type=click.Choice(list(sources.PARSE_ENGINES)),
+    help="Parse XML DATs into lxml elements (tree) or straight into game records (records)",
+)
+@click.option(
+    "--memory-budget",
+    default=None,
+    type=float,
+    help="With --concurrent, only start DATs while their estimated peak memory fits in this many MB",
+)
+@click.option(
+    "--max-tasks-per-child",
+    default=None,
+    type=int,
+    help="With --concurrent, replace each worker process after this many DATs, returning its memory to the OS",
+)
+@click.option(
+    "--skip-duplicates",
+    is_flag=True,
+    help="Link DATs with the same games as the DAT before them (found using the catalogue) rather than reading them",
+)
+@click.option(
+    "--progress-log",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Also write progress events (per DAT, and totals per worker) to this JSON-lines file, outside --dir",
+)
+@click.option(
+    "--checkpoint-interval",
+    default=None,
+    type=float,
+    help="Checkpoint the build (beside --dir) every this many seconds, so a failed build can be resumed",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Reload the last checkpoint, if any, and skip the DATs it has done. Other options must be as before.",
+)
+@click.option(
+    "--profile-allocations",
+    is_flag=True,
+    help="Profile memory allocated by each stage of the build with tracemalloc, in the parent and in workers",
+)
+@click.option(
+    "--profile-snapshot-every",
+    default=profiling.SNAPSHOT_EVERY,
+    type=click.IntRange(min=0),
+    help="With --profile-allocations, find the lines allocating in every this many calls of a stage (0 for none)",
+)
+def build(
+    dir,
+    dat_type,
+    start,
+    end,
+    concurrent,
+    processes,
+    exports,
+    binary_hashes,
+    stages,
+    shard,
+    low_memory,
+    delta,
+    game_cache_mb,
+    split_mb,
+    engine,
+    memory_budget,
+    max_tasks_per_child,
+    skip_duplicates,
+    progress_log,
+    checkpoint_interval,
+    resume,
+    profile_allocations,
+    profile_snapshot_every,
+):
+    sources.set_parse_engine(engine)
     dat_paths = sources.BUILD_DATS[dat_type]
     end = end if end is not None else len(dat_paths)
     source_dats = dat_paths[start:end]
+    hash_format = "binary" if binary_hashes else "hex"
 
-    if concurrent:
-        create_db.process_dats_parallel(source_dats, dir, processes)
+    if delta and (concurrent or low_memory):
+        # Each DAT is compared with the one before it, so they are processed in order in one process
+        raise click.UsageError("--delta can't be combined with --concurrent or --low-memory")
+    if split_mb is not None and (not concurrent or low_memory):
+        raise click.UsageError("--split-mb needs --concurrent and can't be combined with --low-memory")
+    if (memory_budget is not None or max_tasks_per_child is not None) and (not concurrent or low_memory):
+        raise click.UsageError(
+            "--memory-budget and --max-tasks-per-child need --concurrent and can't be combined with --low-memory"
+        )
+    if skip_duplicates and low_memory:
+        raise click.UsageError("--skip-duplicates can't be combined with --low-memory")
+    if (checkpoint_interval is not None or resume) and low_memory:
+        raise click.UsageError("--checkpoint-interval and --resume can't be combined with --low-memory")
+    if profile_allocations and low_memory:
+        raise click.UsageError("--profile-allocations can't be combined with --low-memory")
+    if game_cache_mb is not None and low_memory:
+        raise click.UsageError("--game-cache-mb can't be combined with --low-memory")
+    if shard and (exports or stages or binary_hashes):
+        # A shard only holds the DAT tables, and merge writes the database from shards with these options
+        raise click.UsageError(
+            "--shard can't be combined with --export, --stage or --binary-hashes (pass them to merge)"
+        )
+    if profile_allocations:
+        profiling.enable(profile_snapshot_every)
+    if low_memory:
+        check_low_memory(exports, stages, shard)
+        create_db.process_dats_spilled(
+            source_dats,
+            dir,
+            processes if concurrent else 1,
+            hash_format=hash_format,
+            progress_log=progress_log,
+        )
+    elif concurrent:
+        split_size = int(split_mb * 1024 * 1024) if split_mb is not None else None
+        create_db.process_dats_parallel(
+            source_dats,
+            dir,
+            processes,
+            exports=exports,
+            hash_format=hash_format,
+            stages=stages,
+            shard=shard,
+            split_size=split_size,
+            memory_budget=memory_budget,
+            max_tasks_per_child=max_tasks_per_child,
+            skip_duplicates=skip_duplicates,
+            progress_log=progress_log,
+            checkpoint_interval=checkpoint_interval,
+            resume=resume,
+            game_cache_mb=game_cache_mb,
+        )
     else:
-        create_db.process_dats_consecutively(source_dats, dir)
+        create_db.process_dats_consecutively(
+            source_dats,
+            dir,
+            exports=exports,
+            hash_format=hash_format,
+            stages=stages,
+            shard=shard,
+            delta=delta,
+            skip_duplicates=skip_duplicates,
+            progress_log=progress_log,
+            checkpoint_interval=checkpoint_interval,
+            resume=resume,
+            game_cache_mb=game_cache_mb,
+        )
+
+
+@cli.command()
+@click.argument("shard_dirs", nargs=-1, required=True)
+@click.option("--dir", "-d", default="./arcade-out", help="Output directory")
+@click.option(
+    "--export", "exports", multiple=True, type=click.Choice(list(export.EXPORTERS)), help="As for build (repeatable)"
+)
+@click.option("--binary-hashes", is_flag=True, help="As for build")
+@click.option(
+    "--stage", "stages", multiple=True, type=click.Choice(list(create_db.STAGES)), help="As for build (repeatable)"
+)
+@click.option("--low-memory", is_flag=True, help="Merge shards a batch of records at a time")
+def merge(shard_dirs, dir, exports, binary_hashes, stages, low_memory):
+    """Merge shards written by build --shard, given in DAT order, into one database."""
+    hash_format = "binary" if binary_hashes else "hex"
+    if low_memory:
+        check_low_memory(exports, stages)
+        create_db.write_from_shards(list(shard_dirs), dir, hash_format)
+    else:
+        create_db.write(shards.merge_shards(list(shard_dirs)), dir, exports, hash_format, stages)
+
+
+@cli.command("catalogue")
+@click.option("--type", "-t", "dat_type", default="mame", help="Dat type")
+@click.option("--processes", "-p", default=1, type=int, help="Number of processes to scan changed DATs with")
+def catalogue_dats(dat_type, processes):
+    """Scan new or changed DATs into the catalogue and list them all, with totals."""
+    entries = catalogue.update_catalogue(sources.BUILD_DATS[dat_type], num_processes=processes)
+    for path, entry in entries.items():
+        print(
+            f"{Path(path).name:<36}{entry['format']:<12}{entry['games']:>8} games{entry['counts'].get('rom', 0):>9} roms"
+            f"{entry['size'] / 1024 / 1024:>8.1f}MB{entry['uncompressed_size'] / 1024 / 1024:>8.1f}MB uncompressed"
+        )
+    games = sum(entry["games"] for entry in entries.values())
+    size = sum(entry["uncompressed_size"] for entry in entries.values()) / 1024 / 1024
+    print(f"{len(entries)} DATs, {games} games, {size:.1f}MB uncompressed")
 
 
 @cli.command()
 @click.argument("path")
 def file(path):
-    session = db.get_session(str(DB_PATH.absolute()))
     signature = get_arcade_game_index(path)
     index_hash = indexing.get_game_index_hash(Path(path).stem, signature)
-    results = session.query(db.Game).filter(db.Game.hash == index_hash)
+    if SNAPSHOT_PATH.exists():
+        with snapshot.Snapshot(str(SNAPSHOT_PATH)) as game_snapshot:
+            game = game_snapshot.find_game(index_hash)
+        if game:
+            print(game.description)
+        return
+    session = db.get_read_session(str(DB_PATH))
+    hash_format = db.get_hash_format(session)
+    results = session.query(db.Game).filter(db.Game.hash == indexing.encode_hash(index_hash, hash_format))
     match = results.one_or_none()
     if match:
         print(match.description)
     breakpoint()
 
 
+@cli.command()
+@click.argument("query", nargs=-1, required=True)
+@click.option("--manufacturer", "-m", default=None, help="Manufacturer (prefix)")
+@click.option("--year", "-y", default=None, help="Year of release")
+@click.option("--emulator", "-e", default=None, help="Emulator supporting the game, e.g. 'MAME' or 'MAME 0.100'")
+@click.option("--limit", "-l", default=50, type=int, help="Maximum number of results")
+def search(query, manufacturer, year, emulator, limit):
+    session = db.get_read_session(str(DB_PATH))
+    emulator_name, version = (emulator.split(maxsplit=1) + [None])[:2] if emulator else (None, None)
+    games = queries.search_games(session, " ".join(query), manufacturer, year, emulator_name, version, limit)
+    for game in games:
+        details = ", ".join(str(value) for value in (game.year, game.manufacturer) if value)
+        print(f"{game.name:<16}{game.description} ({details})")
+
+
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,35 @@
+import os
+import sqlite3
+from typing import Any
+
+from arcade_db import create_db
+
+
+def read_tables(db_dir: str) -> dict[str, list[tuple[Any, ...]]]:
+    """Return the rows of every table in db_dir/arcade.db, in a fixed order, so databases can be compared."""
+    connection = sqlite3.connect(os.path.join(db_dir, "arcade.db"))
+    try:
+        tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        return {table: sorted(connection.execute(f"SELECT * FROM {table}"), key=repr) for table in tables}
+    finally:
+        connection.close()
+
+
+def read_dat_tables(db_dir: str) -> dict[str, list[dict[str, Any]]]:
+    """
+    Return the rows of each DAT table in db_dir/arcade.db by column name, leaving out empty values, since write
+    omits columns which no record has (and tables which have no records).
+    """
+    connection = sqlite3.connect(os.path.join(db_dir, "arcade.db"))
+    try:
+        contents = {}
+        for key in create_db.get_empty_dat_data():
+            columns = [row[1] for row in connection.execute(f"PRAGMA table_info({key})")]
+            if not columns:
+                continue
+            rows = [dict(zip(columns, row)) for row in connection.execute(f"SELECT * FROM {key}")]
+            rows = [{column: value for column, value in row.items() if value is not None} for row in rows]
+            contents[key] = sorted(rows, key=lambda row: repr(sorted(row.items())))
+        return contents
+    finally:
+        connection.close()
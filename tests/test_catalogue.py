@@ -0,0 +1,139 @@
+import os
+import bz2
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from arcade_db.shared import catalogue, sources
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "sources")
+CLRMAMEPRO_PATH = os.path.join(FIXTURES_PATH, "clrmamepro.dat")
+LOGIQX_PATH = os.path.join(FIXTURES_PATH, "logiqx.xml")
+MAME_PATH = os.path.join(FIXTURES_PATH, "mame.xml")
+
+
+class TestScanDat(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_xml_header_and_counts(self):
+        entry = catalogue.scan_dat(LOGIQX_PATH)
+        self.assertEqual(entry["format"], "xml")
+        self.assertEqual(entry["root"], "datafile")
+        self.assertEqual(entry["header"], {"name": "FB Alpha"})
+        self.assertEqual(entry["games"], 3)
+        self.assertEqual(entry["counts"], {"game": 2, "resource": 1, "rom": 5})
+        self.assertEqual(entry["size"], os.path.getsize(LOGIQX_PATH))
+        self.assertEqual(entry["uncompressed_size"], entry["size"])
+
+    def test_counts_match_parsed_games(self):
+        for path in (LOGIQX_PATH, MAME_PATH):
+            games = list(sources.get_dat_reader(path).iter_games())
+            entry = catalogue.scan_dat(path)
+            self.assertEqual(entry["games"], len(games), path)
+            self.assertEqual(entry["counts"]["rom"], sum(len(game.findall("rom")) for game in games), path)
+
+    def test_mame_root_attributes_are_the_header(self):
+        entry = catalogue.scan_dat(MAME_PATH)
+        self.assertEqual(entry["root"], "mame")
+        self.assertIn("build", entry["header"])
+
+    def test_tags_split_between_chunks_are_counted(self):
+        expected = catalogue.scan_dat(LOGIQX_PATH)
+        for chunk_size in (1, 7, 16):
+            with mock.patch.object(sources, "CHUNK_SIZE", chunk_size):
+                self.assertEqual(catalogue.scan_dat(LOGIQX_PATH), expected, chunk_size)
+
+    def test_compressed_dat_has_same_contents(self):
+        path = os.path.join(self.temp_dir.name, "FBA 029523.xml.bz2")
+        with open(LOGIQX_PATH, "rb") as source, bz2.open(path, "wb") as target:
+            shutil.copyfileobj(source, target)
+        entry = catalogue.scan_dat(path)
+        expected = catalogue.scan_dat(LOGIQX_PATH)
+        self.assertEqual(entry["size"], os.path.getsize(path))
+        for key in ("uncompressed_size", "digest", "games", "counts", "header"):
+            self.assertEqual(entry[key], expected[key], key)
+
+    def test_games_digest_ignores_header(self):
+        path = os.path.join(self.temp_dir.name, "FBA 029524.xml")
+        with open(LOGIQX_PATH, "rb") as source, open(path, "wb") as target:
+            target.write(source.read().replace(b"<name>FB Alpha</name>", b"<name>FB Alpha v0.2.95.24</name>"))
+        entry, expected = catalogue.scan_dat(path), catalogue.scan_dat(LOGIQX_PATH)
+        self.assertNotEqual(entry["digest"], expected["digest"])
+        self.assertEqual(entry["games_digest"], expected["games_digest"])
+        with mock.patch.object(sources, "CHUNK_SIZE", 7):
+            self.assertEqual(catalogue.scan_dat(path)["games_digest"], expected["games_digest"])
+
+    def test_clrmamepro_header_and_counts(self):
+        path = os.path.join(self.temp_dir.name, "FBA 029523.dat")
+        with open(CLRMAMEPRO_PATH, "rb") as source, open(path, "wb") as target:
+            target.write(b'clrmamepro (\n\tname "FB Alpha"\n\tversion 0.2.95.23\n)\n\n' + source.read())
+        entry = catalogue.scan_dat(path)
+        self.assertEqual(entry["format"], "clrmamepro")
+        self.assertEqual(entry["root"], "clrmamepro")
+        self.assertEqual(entry["header"], {"name": "FB Alpha", "version": "0.2.95.23"})
+        self.assertEqual(entry["games"], 3)
+        # Placeholder roms without names are counted, although DatReaders skip them
+        self.assertEqual(entry["counts"]["rom"], 6)
+        self.assertEqual(catalogue.scan_dat(CLRMAMEPRO_PATH)["header"], {})
+        self.assertEqual(entry["games_digest"], catalogue.scan_dat(CLRMAMEPRO_PATH)["games_digest"])
+
+
+class TestUpdateCatalogue(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.catalogue_path = os.path.join(self.temp_dir.name, "catalogue.json")
+        self.dats = []
+        for path in (LOGIQX_PATH, MAME_PATH):
+            self.dats.append(os.path.join(self.temp_dir.name, "dats", os.path.basename(path)))
+            os.makedirs(os.path.dirname(self.dats[-1]), exist_ok=True)
+            shutil.copy(path, self.dats[-1])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def update(self) -> tuple[dict[str, catalogue.CatalogueEntry], list[str]]:
+        with mock.patch.object(catalogue, "scan_dat", wraps=catalogue.scan_dat) as scan_dat:
+            entries = catalogue.update_catalogue(self.dats, self.catalogue_path)
+        return entries, [call.args[0] for call in scan_dat.call_args_list]
+
+    def test_only_new_or_changed_dats_are_scanned(self):
+        entries, scanned = self.update()
+        self.assertEqual(scanned, self.dats)
+        self.assertEqual(list(entries), self.dats)
+        self.assertEqual(self.update(), (entries, []))
+        with open(self.dats[1], "ab") as dat_file:
+            dat_file.write(b"\n")
+        entries, scanned = self.update()
+        self.assertEqual(scanned, [self.dats[1]])
+        self.assertEqual(entries[self.dats[1]]["uncompressed_size"], os.path.getsize(self.dats[1]))
+
+    def test_manifest_is_keyed_by_relative_path(self):
+        self.update()
+        with open(self.catalogue_path) as catalogue_file:
+            manifest = json.load(catalogue_file)
+        self.assertEqual(manifest["version"], catalogue.CATALOGUE_VERSION)
+        self.assertEqual(sorted(manifest["dats"]), ["dats/logiqx.xml", "dats/mame.xml"])
+
+    def test_removed_dats_are_dropped(self):
+        self.update()
+        os.remove(self.dats.pop())
+        self.update()
+        self.assertEqual(list(catalogue.load_catalogue(self.catalogue_path)), ["dats/logiqx.xml"])
+
+    def test_other_scan_versions_are_rescanned(self):
+        self.update()
+        with mock.patch.object(catalogue, "CATALOGUE_VERSION", catalogue.CATALOGUE_VERSION + 1):
+            _, scanned = self.update()
+        self.assertEqual(scanned, self.dats)
+
+
+if __name__ == "__main__":
+    unittest.main()
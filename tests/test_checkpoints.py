@@ -0,0 +1,159 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from arcade_db import checkpoints, create_db
+from tests.helpers import read_tables
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "create_db")
+
+
+class TestCheckpointer(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_dir = checkpoints.get_checkpoint_dir(os.path.join(self.temp_dir.name, "out"))
+        self.dats = [f"/dats/MAME 0.{i}.xml" for i in range(1, 4)]
+        self.records = [{"games": {f"hash{i}": {"id": i, "name": f"game{i}"}}} for i in range(3)]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def resume(self) -> checkpoints.Checkpointer:
+        checkpointer = checkpoints.Checkpointer(self.checkpoint_dir, self.dats, 3600, resume=True)
+        self.addCleanup(checkpointer.close)
+        return checkpointer
+
+    def test_records_and_done_dats_are_resumed(self):
+        checkpointer = checkpoints.Checkpointer(self.checkpoint_dir, self.dats, 3600)
+        for record, dat_file in zip(self.records[:2], self.dats):
+            checkpointer.add(dict(record, _stats={}))
+            checkpointer.set_done(dat_file)
+        checkpointer.close()
+        resumed = self.resume()
+        self.assertEqual(resumed.get_done(), set(self.dats[:2]))
+        self.assertEqual(list(resumed.iter_records()), self.records[:2])
+        self.assertIsNone(resumed.load_fingerprints())
+
+    def test_records_after_the_last_commit_are_discarded(self):
+        checkpointer = checkpoints.Checkpointer(self.checkpoint_dir, self.dats, 3600)
+        checkpointer.add(self.records[0])
+        checkpointer.close()
+        # A record cut short when the build was killed
+        with open(os.path.join(self.checkpoint_dir, checkpoints.RECORDS_NAME), "ab") as records_file:
+            records_file.write(checkpoints.RECORD_LENGTH.pack(100) + b"partial")
+        resumed = self.resume()
+        resumed.add(self.records[1])
+        resumed.close()
+        self.assertEqual(list(self.resume().iter_records()), self.records[:2])
+
+    def test_fingerprints_match_the_commit(self):
+        checkpointer = checkpoints.Checkpointer(self.checkpoint_dir, self.dats, 0)
+        for i, dat_file in enumerate(self.dats):
+            checkpointer.add(self.records[i])
+            checkpointer.set_fingerprints({b"fingerprint": f"hash{i}"})
+            checkpointer.set_done(dat_file)
+        checkpointer.close()
+        self.assertEqual(self.resume().load_fingerprints(), {b"fingerprint": "hash2"})
+        fingerprint_files = [name for name in os.listdir(self.checkpoint_dir) if name.startswith("fingerprints")]
+        self.assertEqual(len(fingerprint_files), 1)
+
+    def test_checkpoints_for_other_dats_are_rejected(self):
+        checkpoints.Checkpointer(self.checkpoint_dir, self.dats[:2], 3600).close()
+        with self.assertRaisesRegex(ValueError, "different DATs"):
+            self.resume()
+
+    def test_without_resume_the_checkpoint_is_replaced(self):
+        checkpointer = checkpoints.Checkpointer(self.checkpoint_dir, self.dats, 3600)
+        checkpointer.add(self.records[0])
+        checkpointer.set_done(self.dats[0])
+        checkpointer.close()
+        checkpoints.Checkpointer(self.checkpoint_dir, self.dats, 3600).close()
+        with open(os.path.join(self.checkpoint_dir, checkpoints.MANIFEST_NAME)) as manifest_file:
+            self.assertEqual(json.load(manifest_file)["done"], [])
+
+
+class TestResumedBuilds(unittest.TestCase):
+    FIXTURES = (
+        ("games_with_overlapping_roms.xml", "MAME 0.1"),
+        ("games_with_overlapping_roms.xml", "MAME 0.2"),
+        ("one_game_diff_rom_crc.xml", "MAME 0.3"),
+        ("games_with_disks.xml", "MAME 0.4"),
+        ("one_game_with_features_driver.xml", "MAME 0.5"),
+    )
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.out_dir = os.path.join(self.temp_dir.name, "out")
+        self.dats = []
+        for fixture, emulator in self.FIXTURES:
+            self.dats.append(os.path.join(self.temp_dir.name, f"{emulator}.xml"))
+            shutil.copy(os.path.join(FIXTURES_PATH, fixture), self.dats[-1])
+        expected_dir = os.path.join(self.temp_dir.name, "expected")
+        create_db.process_dats_consecutively(self.dats, expected_dir)
+        self.expected = read_tables(expected_dir)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def crash(self, build, failing_dat: str) -> None:
+        """Run build until it reads failing_dat, then finish writing its checkpoint as a killed build would."""
+        checkpointer_class = checkpoints.Checkpointer
+        started = []
+        get_dat_reader = create_db.sources.get_dat_reader
+
+        def start(*args, **kwargs):
+            started.append(checkpointer_class(*args, **kwargs))
+            return started[-1]
+
+        def fail(path):
+            if path == failing_dat:
+                raise MemoryError(path)
+            return get_dat_reader(path)
+
+        with mock.patch.object(checkpoints, "Checkpointer", start):
+            with mock.patch.object(create_db.sources, "get_dat_reader", fail):
+                with self.assertRaises(MemoryError):
+                    build()
+        started[0].close()
+
+    def resume(self, build) -> list[str]:
+        with mock.patch.object(create_db.sources, "get_dat_reader", wraps=create_db.sources.get_dat_reader) as reader:
+            build()
+        self.assertEqual(read_tables(self.out_dir), self.expected)
+        self.assertFalse(os.path.exists(checkpoints.get_checkpoint_dir(self.out_dir)))
+        return [call.args[0] for call in reader.call_args_list]
+
+    def test_consecutive_build_resumes_after_the_last_dat_done(self):
+        for delta in (False, True):
+            self.crash(
+                lambda: create_db.process_dats_consecutively(
+                    self.dats, self.out_dir, delta=delta, checkpoint_interval=0
+                ),
+                self.dats[3],
+            )
+            read = self.resume(
+                lambda: create_db.process_dats_consecutively(self.dats, self.out_dir, delta=delta, resume=True)
+            )
+            self.assertEqual(read, self.dats[3:])
+
+    def test_parallel_build_resumes(self):
+        # Workers are forked with the failing reader
+        self.crash(
+            lambda: create_db.process_dats_parallel(self.dats, self.out_dir, 1, checkpoint_interval=0), self.dats[3]
+        )
+        with mock.patch.object(create_db.sources, "split_xml_dat", wraps=create_db.sources.split_xml_dat) as split:
+            self.resume(lambda: create_db.process_dats_parallel(self.dats, self.out_dir, 2, split_size=0, resume=True))
+        self.assertEqual(split.call_count, 2)
+
+    def test_resume_without_a_checkpoint_builds_everything(self):
+        read = self.resume(lambda: create_db.process_dats_consecutively(self.dats, self.out_dir, resume=True))
+        self.assertEqual(read, self.dats)
+
+
+if __name__ == "__main__":
+    unittest.main()
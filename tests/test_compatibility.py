@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+
+from lxml import etree as ET
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from arcade_db import compatibility, create_db
+from arcade_db.shared import db, sources
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "create_db")
+
+
+class TestExtractMameVersion(unittest.TestCase):
+    def test_versions_sort_in_release_order(self):
+        in_order = ["0.8.1", "0.21", "0.21.5", "0.33b2", "0.33b10", "0.33rc1", "0.33", "0.35fix", "0.69a", "0.100"]
+        self.assertEqual(sorted(reversed(in_order), key=sources.extract_mame_version), in_order)
+
+    def test_file_names_and_versions_match(self):
+        self.assertEqual(sources.extract_mame_version("MAME 0.37b1.dat.bz2"), sources.extract_mame_version("0.37b1"))
+        self.assertEqual(sources.extract_mame_version("FBA 029523.xml.bz2"), sources.extract_mame_version("029523"))
+
+
+class TestBitmaps(unittest.TestCase):
+    def test_round_trip(self):
+        for bitmap in (0, 1, 0b1010, 1 << 70):
+            self.assertEqual(compatibility.from_bytes(compatibility.to_bytes(bitmap)), bitmap)
+
+    def test_iter_bits(self):
+        self.assertEqual(list(compatibility.iter_bits(0b100101)), [0, 2, 5])
+
+
+class TestCompatibilityIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        dat_data = create_db.get_empty_dat_data()
+        # Processed out of version order, as they would be by process_dats_parallel
+        for fixture, emulator in (
+            ("games_with_cloneof_romof_unordered.xml", "MAME 0.100"),
+            ("games_with_cloneof_romof_rels.xml", "MAME 0.37b1"),
+            ("games_with_cloneof_romof_rels.xml", "MAME 0.9.1"),
+            ("one_game_with_features_driver.xml", "FBA 029523"),
+        ):
+            root = ET.parse(os.path.join(FIXTURES_PATH, fixture)).getroot()
+            create_db.merge_dat_data(dat_data, create_db.process_games(root, create_db.get_emulator_attrs(emulator)))
+        create_db.write(dat_data, cls.temp_dir.name, stages=("compatibility",))
+        cls.engine = create_engine(f"sqlite:///{os.path.join(cls.temp_dir.name, 'arcade.db')}")  # noqa: E231
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
+        cls.temp_dir.cleanup()
+
+    def setUp(self):
+        self.session = sessionmaker(bind=self.engine)()
+        self.index = compatibility.CompatibilityIndex(self.session)
+        self.game_ids = {game.name: game.id for game in self.session.query(db.Game)}
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_versions_are_ordered(self):
+        self.assertEqual(self.index.versions["MAME"], ["0.9.1", "0.37b1", "0.100"])
+        self.assertEqual(self.index.versions["FBA"], ["029523"])
+
+    def test_first_and_last_versions(self):
+        self.assertEqual(self.index.get_versions(self.game_ids["columnsj"]), ["0.9.1", "0.37b1", "0.100"])
+        self.assertEqual(self.index.get_first_version(self.game_ids["columnsxyz"]), "0.100")
+        self.assertEqual(self.index.get_last_version(self.game_ids["columnsxyz"]), "0.100")
+        self.assertEqual(self.index.get_first_version(self.game_ids["1on1gov"], "FBA"), "029523")
+        self.assertIsNone(self.index.get_first_version(self.game_ids["1on1gov"]))
+
+    def test_stored_version_range(self):
+        row = self.session.get(db.GameCompatibility, (self.game_ids["columns"], "MAME"))
+        self.assertEqual(self.session.get(db.Emulator, row.first_emulator_id).version, "0.9.1")
+        self.assertEqual(self.session.get(db.Emulator, row.last_emulator_id).version, "0.100")
+
+    def test_common_games(self):
+        old, new = self.index.get_emulator_id("0.9.1"), self.index.get_emulator_id("0.100")
+        self.assertEqual(
+            sorted(self.index.get_common_games([old, new])),
+            sorted([self.game_ids["columns"], self.game_ids["columnsj"]]),
+        )
+        self.assertEqual(self.index.get_common_games([old, self.index.get_emulator_id("029523", "FBA")]), [])
+        self.assertTrue(self.index.supports(self.game_ids["columnsxyz"], new))
+        self.assertFalse(self.index.supports(self.game_ids["columnsxyz"], old))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,17 @@
 import os
+import shutil
+import tempfile
 import unittest
+from typing import Optional
+from unittest import mock
 
 
 from lxml import etree as ET
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
-from arcade_db import create_db
-from arcade_db.shared import db
+from arcade_db import create_db, queries, shards
+from arcade_db.shared import catalogue, db, indexing
+from tests.helpers import read_tables
 
 
 SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
@@ -74,5 +79,290 @@ class TestGetEmulatorAttrs(unittest.TestCase):
         self.assertDictEqual({"id": "mame0_263", "name": "MAME", "version": "0.263"}, attrs)
 
 
+class TestStableIds(unittest.TestCase):
+    def process(self, fixture: str, emulator: str) -> create_db.DatData:
+        root = get_dat_root(os.path.join(FIXTURES_PATH, fixture))
+        return create_db.process_games(root, create_db.get_emulator_attrs(emulator))
+
+    def test_ids_do_not_depend_on_dat_order(self):
+        dats = [("games_with_overlapping_roms.xml", "MAME 0.1"), ("games_with_disks.xml", "MAME 0.2")]
+        builds = []
+        for order in (dats, dats[::-1]):
+            dat_data = create_db.get_empty_dat_data()
+            for fixture, emulator in order:
+                create_db.merge_dat_data(dat_data, self.process(fixture, emulator))
+            builds.append(
+                {
+                    key: {hash_key: attrs["id"] for hash_key, attrs in table.items()}
+                    for key, table in dat_data.items()
+                    if key in create_db.ID_TABLES
+                }
+            )
+        self.assertEqual(builds[0], builds[1])
+
+    def test_associations_use_ids(self):
+        dat_data = self.process("games_with_disks.xml", "MAME 0.1")
+        game_ids = {game["id"] for game in dat_data["games"].values()}
+        game_emulator_ids = {game_emulator["id"] for game_emulator in dat_data["game_emulator"].values()}
+        self.assertTrue(all(game_rom["game_id"] in game_ids for game_rom in dat_data["game_rom"].values()))
+        self.assertTrue(
+            all(disk["game_emulator_id"] in game_emulator_ids for disk in dat_data["game_emulator_disk"].values())
+        )
+
+    def test_emulator_attrs_are_not_modified(self):
+        emulator_attrs = create_db.get_emulator_attrs("MAME 0.1")
+        dat_data = self.process("one_game.xml", "MAME 0.1")
+        self.process("one_game.xml", "MAME 0.1")
+        self.assertEqual(emulator_attrs, create_db.get_emulator_attrs("MAME 0.1"))
+        self.assertEqual(dat_data["emulators"]["mame0_1"]["id"], indexing.get_stable_id("mame0_1"))
+
+    def test_nullable_ids_are_not_rounded(self):
+        dat_data = create_db.get_empty_dat_data()
+        for fixture in ("one_game.xml", "one_game_with_features_driver.xml"):
+            create_db.merge_dat_data(dat_data, self.process(fixture, "MAME 0.1"))
+        with tempfile.TemporaryDirectory() as out_dir:
+            create_db.write(dat_data, out_dir)
+            engine = create_engine(f"sqlite:///{os.path.join(out_dir, 'arcade.db')}")
+            with engine.connect() as connection:
+                driver_ids = {row[0] for row in connection.execute(text("SELECT driver_id FROM game_emulator"))}
+            engine.dispose()
+        self.assertEqual(driver_ids, {None, *(driver["id"] for driver in dat_data["drivers"].values())})
+
+    def test_check_ids_detects_collisions(self):
+        dat_data = self.process("games_with_overlapping_roms.xml", "MAME 0.1")
+        create_db.check_ids(dat_data)
+        first, second = list(dat_data["roms"].values())[:2]
+        second["id"] = first["id"]
+        with self.assertRaisesRegex(ValueError, "share id"):
+            create_db.check_ids(dat_data)
+
+
+class TestDelta(unittest.TestCase):
+    FIXTURES = (
+        ("games_with_overlapping_roms.xml", "MAME 0.1"),
+        ("games_with_overlapping_roms.xml", "MAME 0.2"),
+        ("one_game_diff_rom_crc.xml", "MAME 0.3"),
+        ("one_game_diff_rom_crc_2.xml", "MAME 0.4"),
+        ("games_with_disks.xml", "MAME 0.5"),
+        ("games_with_disks.xml", "MAME 0.6"),
+    )
+
+    def build(self, delta: bool) -> create_db.DatData:
+        dat_data = create_db.get_empty_dat_data()
+        fingerprints: Optional[dict[bytes, str]] = {} if delta else None
+        for fixture, emulator in self.FIXTURES:
+            root = get_dat_root(os.path.join(FIXTURES_PATH, fixture))
+            dat = create_db.process_games(root, create_db.get_emulator_attrs(emulator), fingerprints)
+            fingerprints = dat.pop("_fingerprints", None)  # type: ignore
+            create_db.merge_dat_data(dat_data, dat)
+        return dat_data
+
+    def test_delta_matches_full_processing(self):
+        self.assertEqual(self.build(delta=True), self.build(delta=False))
+
+    def test_unchanged_games_are_only_linked(self):
+        first = create_db.process_games(
+            get_dat_root(os.path.join(FIXTURES_PATH, "games_with_disks.xml")),
+            create_db.get_emulator_attrs("MAME 0.1"),
+            {},
+        )
+        second = create_db.process_games(
+            get_dat_root(os.path.join(FIXTURES_PATH, "games_with_disks.xml")),
+            create_db.get_emulator_attrs("MAME 0.2"),
+            first["_fingerprints"],
+        )
+        self.assertEqual(second["games"], {})
+        self.assertEqual(second["roms"], {})
+        self.assertEqual(len(second["game_emulator"]), len(first["game_emulator"]))
+        self.assertEqual(len(second["game_emulator_disk"]), len(first["game_emulator_disk"]))
+        self.assertEqual(second["_fingerprints"], first["_fingerprints"])
+
+
+class TestGameCache(unittest.TestCase):
+    def process(self, fixture: str, emulator: str, game_cache: Optional[create_db.GameCache]) -> create_db.DatData:
+        root = get_dat_root(os.path.join(FIXTURES_PATH, fixture))
+        return create_db.process_games(root, create_db.get_emulator_attrs(emulator), game_cache=game_cache)
+
+    def test_cached_games_give_the_same_records(self):
+        game_cache = create_db.GameCache(1024 * 1024)
+        for fixture in ("games_with_disks.xml", "one_game_with_features_driver.xml"):
+            uncached = self.process(fixture, "MAME 0.2", None)
+            self.process(fixture, "MAME 0.1", game_cache)
+            self.assertEqual(self.process(fixture, "MAME 0.2", game_cache), uncached)
+
+    def test_cached_hashes_are_replayed(self):
+        game_cache = create_db.GameCache(1024 * 1024)
+        self.process("one_game_with_features_driver.xml", "MAME 0.1", game_cache)
+        with mock.patch.object(indexing, "get_rom_index_hash") as get_rom_index_hash:
+            self.process("one_game_with_features_driver.xml", "MAME 0.2", game_cache)
+        get_rom_index_hash.assert_not_called()
+
+    def test_cache_is_emptied_when_full(self):
+        game_cache = create_db.GameCache(1024 * 1024)
+        self.process("games_with_overlapping_roms.xml", "MAME 0.1", game_cache)
+        self.assertGreater(len(game_cache), 1)
+        self.assertLessEqual(game_cache.bytes, game_cache.max_bytes)
+        largest = max(create_db.GameCache.get_size(key, *entry) for key, entry in game_cache.entries.items())
+        game_cache = create_db.GameCache(largest)
+        dat_data = self.process("games_with_overlapping_roms.xml", "MAME 0.1", game_cache)
+        self.assertGreater(len(dat_data["games"]), 1)
+        self.assertEqual(len(game_cache), 1)
+        self.assertLessEqual(game_cache.bytes, largest)
+
+    def test_cached_builds_match_uncached_builds(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dats = []
+            for fixture, emulator in (("games_with_disks.xml", "MAME 0.1"), ("games_with_disks.xml", "MAME 0.2")):
+                dats.append(os.path.join(temp_dir, f"{emulator}.xml"))
+                shutil.copy(os.path.join(FIXTURES_PATH, fixture), dats[-1])
+            expected_dir = os.path.join(temp_dir, "expected")
+            create_db.process_dats_consecutively(dats, expected_dir)
+            for build in (
+                lambda out_dir: create_db.process_dats_consecutively(dats, out_dir, game_cache_mb=1),
+                lambda out_dir: create_db.process_dats_parallel(dats, out_dir, 1, game_cache_mb=1),
+            ):
+                out_dir = os.path.join(temp_dir, "cached")
+                build(out_dir)
+                self.assertEqual(read_tables(out_dir), read_tables(expected_dir))
+
+
+class TestSplitDats(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dat_file = os.path.join(self.temp_dir.name, "MAME 0.1.xml")
+        shutil.copy(os.path.join(FIXTURES_PATH, "games_with_disks.xml"), self.dat_file)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_parts_merge_to_the_whole_dat(self):
+        jobs = list(create_db.iter_dat_jobs([self.dat_file], 0, 3))
+        self.assertEqual(len(jobs), 3)
+        dat_data = create_db.get_empty_dat_data()
+        for job in jobs:
+            create_db.merge_dat_data(dat_data, create_db.dat_part_worker(job))
+        whole_dat_data = create_db.dat_part_worker((self.dat_file, None))
+        self.assertIn(self.dat_file, whole_dat_data.pop("_stats"))
+        self.assertEqual(dat_data, whole_dat_data)
+
+    def test_small_dats_are_not_split(self):
+        self.assertEqual(list(create_db.iter_dat_jobs([self.dat_file], 1024 * 1024, 3)), [(self.dat_file, None)])
+        self.assertEqual(list(create_db.iter_dat_jobs([self.dat_file], None, 3)), [(self.dat_file, None)])
+
+
+class TestSkipDuplicates(unittest.TestCase):
+    FIXTURES = (
+        ("games_with_disks.xml", "MAME 0.1"),
+        ("games_with_disks.xml", "MAME 0.2"),
+        ("one_game_with_features_driver.xml", "MAME 0.3"),
+        ("one_game_with_features_driver.xml", "MAME 0.4"),
+        ("games_with_disks.xml", "MAME 0.5"),
+    )
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dats = []
+        for fixture, emulator in self.FIXTURES:
+            with open(os.path.join(FIXTURES_PATH, fixture), "rb") as dat_file:
+                contents = dat_file.read()
+            if emulator == "MAME 0.4":
+                # Different headers don't stop DATs being duplicates
+                contents = contents.replace(b"<datafile>", b"<datafile><header><name>MAME 0.4</name></header>", 1)
+            self.dats.append(os.path.join(self.temp_dir.name, f"{emulator}.xml"))
+            with open(self.dats[-1], "wb") as dat_file:
+                dat_file.write(contents)
+        catalogue_path = os.path.join(self.temp_dir.name, "catalogue.json")
+        self.catalogue_patch = mock.patch.object(catalogue, "CATALOGUE_PATH", catalogue_path)
+        self.catalogue_patch.start()
+
+    def tearDown(self):
+        self.catalogue_patch.stop()
+        self.temp_dir.cleanup()
+
+    def test_only_runs_of_consecutive_duplicates_are_collapsed(self):
+        duplicates = create_db.get_duplicate_dats(self.dats)
+        self.assertEqual(duplicates, {self.dats[0]: [self.dats[1]], self.dats[2]: [self.dats[3]]})
+
+    def test_linked_duplicate_matches_processed_duplicate(self):
+        first = create_db.process_games(get_dat_root(self.dats[2]), create_db.get_emulator_attrs("MAME 0.3"))
+        second = create_db.process_games(get_dat_root(self.dats[3]), create_db.get_emulator_attrs("MAME 0.4"))
+        linked = create_db.link_duplicate_dat(first, create_db.get_emulator_attrs("MAME 0.4"))
+        for key in ("emulators", "game_emulator", "game_emulator_feature", "game_emulator_disk"):
+            self.assertEqual(linked[key], second[key], key)
+
+    def test_builds_match_full_builds(self):
+        expected_dir = os.path.join(self.temp_dir.name, "expected")
+        create_db.process_dats_consecutively(self.dats, expected_dir)
+        expected = read_tables(expected_dir)
+        for build in (
+            lambda out_dir: create_db.process_dats_consecutively(self.dats, out_dir, skip_duplicates=True),
+            lambda out_dir: create_db.process_dats_consecutively(self.dats, out_dir, delta=True, skip_duplicates=True),
+            lambda out_dir: create_db.process_dats_parallel(self.dats, out_dir, 2, split_size=0, skip_duplicates=True),
+        ):
+            out_dir = os.path.join(self.temp_dir.name, "skipped")
+            build(out_dir)
+            self.assertEqual(read_tables(out_dir), expected)
+
+    def test_duplicates_are_not_read(self):
+        out_dir = os.path.join(self.temp_dir.name, "skipped")
+        with mock.patch.object(create_db.sources, "get_dat_reader", wraps=create_db.sources.get_dat_reader) as reader:
+            create_db.process_dats_consecutively(self.dats, out_dir, skip_duplicates=True)
+        self.assertEqual([call.args[0] for call in reader.call_args_list], [self.dats[0], self.dats[2], self.dats[4]])
+
+
+class TestWriteBinaryHashes(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.out_dir = os.path.join(self.temp_dir.name, "out")
+        dat_data = create_db.get_empty_dat_data()
+        for fixture in ("one_game.xml", "one_game_with_features_driver.xml"):
+            root = get_dat_root(os.path.join(FIXTURES_PATH, fixture))
+            create_db.merge_dat_data(dat_data, create_db.process_games(root, create_db.get_emulator_attrs("MAME 0.1")))
+        create_db.write(dat_data, self.out_dir, hash_format="binary")
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.out_dir, 'arcade.db')}")  # noqa: E231
+        self.session = sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        self.temp_dir.cleanup()
+
+    def test_hash_format_is_recorded(self):
+        self.assertEqual(db.get_hash_format(self.session), "binary")
+
+    def test_rom_columns_are_compact(self):
+        rows = self.session.execute(
+            text("SELECT typeof(crc), typeof(hash), length(hash) FROM roms WHERE crc IS NOT NULL")
+        ).fetchall()
+        self.assertTrue(rows)
+        self.assertEqual(set(rows), {("integer", "blob", 32)})
+
+    def test_crc_size_index(self):
+        indexes = self.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).fetchall()
+        self.assertIn(("idx_rom_crc_size",), indexes)
+
+    def test_rom_lookup_by_integer_crc(self):
+        roms = queries.get_roms_by_crc_size(self.session, 0x69FFBCB4, 524288)
+        self.assertEqual([rom.name for rom in roms], ["m534002c-61.ic353"])
+
+    def test_game_lookup_by_binary_hash(self):
+        game = self.session.query(db.Game).filter(db.Game.name == "1on1gov").one()
+        rom_elements = get_dat_root(os.path.join(FIXTURES_PATH, "one_game_with_features_driver.xml")).findall(
+            "machine/rom"
+        )
+        index_hash = indexing.get_game_index_from_elements("1on1gov", rom_elements)
+        self.assertEqual(game.hash, indexing.encode_hash(index_hash, "binary"))
+
+    def test_build_without_roms(self):
+        dat_data = create_db.process_games([], create_db.get_emulator_attrs("MAME 0.2"))
+        out_dir = os.path.join(self.temp_dir.name, "no-roms")
+        create_db.write(dat_data, out_dir, hash_format="binary")
+        self.assertNotIn("roms", read_tables(out_dir))
+        shard_dir = os.path.join(self.temp_dir.name, "no-roms-shard")
+        shards.write_shard(dat_data, shard_dir, [])
+        create_db.write_from_shards([shard_dir], out_dir, hash_format="binary")
+        self.assertNotIn("roms", read_tables(out_dir))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from lxml import etree as ET
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from arcade_db import create_db
+from arcade_db.shared import db
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "create_db")
+
+
+class TestReadSessions(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        root = ET.parse(os.path.join(FIXTURES_PATH, "one_game.xml")).getroot()
+        create_db.write(create_db.process_games(root, create_db.get_emulator_attrs("MAME 0.1")), cls.temp_dir.name)
+        cls.db_path = os.path.join(cls.temp_dir.name, "arcade.db")
+
+    @classmethod
+    def tearDownClass(cls):
+        db.get_read_sessions(cls.db_path).remove()
+        db.get_read_engine(cls.db_path).dispose()
+        cls.temp_dir.cleanup()
+
+    def test_engines_are_cached_per_path(self):
+        self.assertIs(db.get_read_engine(self.db_path), db.get_read_engine(self.db_path))
+
+    def test_pragmas_are_applied(self):
+        session = db.get_read_session(self.db_path)
+        self.assertEqual(session.execute(text("PRAGMA query_only")).scalar(), 1)
+        self.assertEqual(session.execute(text("PRAGMA cache_size")).scalar(), db.READ_PRAGMAS["cache_size"])
+
+    def test_writes_are_refused(self):
+        session = db.get_read_session(self.db_path)
+        with self.assertRaises(OperationalError):
+            session.execute(text("DELETE FROM games"))
+        session.rollback()
+
+    def test_paths_with_uri_characters(self):
+        out_dir = os.path.join(self.temp_dir.name, "a?b#c%41 d")
+        root = ET.parse(os.path.join(FIXTURES_PATH, "one_game.xml")).getroot()
+        create_db.write(create_db.process_games(root, create_db.get_emulator_attrs("MAME 0.1")), out_dir)
+        db_path = os.path.join(out_dir, "arcade.db")
+        self.assertTrue(os.path.exists(db_path))
+        engine = db.get_read_engine(db_path)
+        try:
+            with engine.connect() as connection:
+                self.assertEqual(connection.execute(text("SELECT count(*) FROM games")).scalar(), 1)
+        finally:
+            engine.dispose()
+
+    def test_sessions_are_per_thread(self):
+        sessions = []
+        names = []
+
+        def lookup():
+            session = db.get_read_session(self.db_path)
+            sessions.append(session)
+            names.append(session.query(db.Game.name).scalar())
+            db.get_read_sessions(self.db_path).remove()
+
+        threads = [threading.Thread(target=lookup) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(map(id, sessions))), 4)
+        self.assertEqual(len(set(names)), 1)
+        self.assertIsNotNone(names[0])
+
+
+class TestBuildEngine(unittest.TestCase):
+    def test_pragmas_are_applied(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            engine = db.get_build_engine(os.path.join(temp_dir, "arcade.db"))
+            with engine.connect() as connection:
+                self.assertEqual(connection.execute(text("PRAGMA synchronous")).scalar(), 0)
+                self.assertEqual(connection.execute(text("PRAGMA journal_mode")).scalar(), "off")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import csv
+import tempfile
+import unittest
+
+from lxml import etree as ET
+
+from arcade_db import create_db, export
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "create_db")
+
+try:
+    import pyarrow  # noqa: F401
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+def get_dat_data() -> create_db.DatData:
+    dat_data = create_db.get_empty_dat_data()
+    for fixture, emulator in (
+        ("games_with_disks.xml", "MAME 0.100"),
+        ("one_game_with_features_driver.xml", "MAME 0.200"),
+    ):
+        root = ET.parse(os.path.join(FIXTURES_PATH, fixture)).getroot()
+        create_db.merge_dat_data(dat_data, create_db.process_games(root, create_db.get_emulator_attrs(emulator)))
+    return dat_data
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.dat_data = get_dat_data()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.out_dir = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_no_formats_writes_nothing(self):
+        export.export(self.dat_data, self.out_dir, ())
+        self.assertEqual(os.listdir(self.out_dir), [])
+
+    def test_csv_rows_and_header(self):
+        export.export(self.dat_data, self.out_dir, ("csv",), row_group_size=2)
+        with open(os.path.join(self.out_dir, "csv", "roms.csv")) as csv_file:
+            rows = list(csv.DictReader(csv_file))
+        self.assertEqual(len(rows), len(self.dat_data["roms"]))
+        self.assertEqual(list(rows[0].keys()), ["id", "hash", "name", "size", "crc", "sha1"])
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_parquet_types_and_row_groups(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        export.export(self.dat_data, self.out_dir, ("parquet",), row_group_size=2)
+        parquet_file = pq.ParquetFile(os.path.join(self.out_dir, "parquet", "roms.parquet"))
+        self.assertEqual(parquet_file.metadata.num_rows, len(self.dat_data["roms"]))
+        self.assertEqual(parquet_file.metadata.num_row_groups, -(-len(self.dat_data["roms"]) // 2))
+        table = parquet_file.read()
+        self.assertEqual(table.schema.field("id").type, pa.int64())
+        self.assertEqual(table.schema.field("size").type, pa.int64())
+        self.assertTrue(pa.types.is_dictionary(table.schema.field("crc").type))
+        self.assertEqual(table.schema.field("hash").type, pa.string())
+        expected_crcs = sorted(rom["crc"] for rom in self.dat_data["roms"].values())
+        self.assertEqual(sorted(table.column("crc").to_pylist()), expected_crcs)
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_arrow_dictionaries_span_batches(self):
+        import pyarrow.ipc as ipc
+
+        export.export(self.dat_data, self.out_dir, ("arrow",), row_group_size=1)
+        table = ipc.open_file(os.path.join(self.out_dir, "arrow", "games.arrow")).read_all()
+        expected_names = [game["name"] for game in self.dat_data["games"].values()]
+        self.assertEqual(table.column("name").to_pylist(), expected_names)
+        expected_years = [game["year"] for game in self.dat_data["games"].values()]
+        self.assertEqual(table.column("year").to_pylist(), expected_years)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from arcade_db.shared import fetch
+from arcade_db.sources import mame_dat_download
+
+
+FILES = {
+    "/one.7z": b"7z\xbc\xaf\x27\x1c" + bytes(range(256)) * 64,
+    "/two.rar": b"Rar!\x1a\x07" + bytes(range(255, -1, -1)) * 64,
+    "/missing.7z": b"<html>Not found</html>",
+}
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serves FILES, honouring single 'bytes=N-' range headers."""
+
+    requests: list[tuple[str, str]] = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get("Range", "")))
+        if self.path not in FILES:
+            self.send_error(404)
+            return
+        content = FILES[self.path]
+        range_header = self.headers.get("Range")
+        if range_header:
+            start = int(range_header.replace("bytes=", "").rstrip("-"))
+            if start >= len(content):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")
+            content = content[start:]
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestFetch(unittest.TestCase):
+    server: ThreadingHTTPServer
+    base_url: str
+    thread: threading.Thread
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"  # noqa: E231
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        RangeRequestHandler.requests.clear()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.out_dir = self.temp_dir.name
+        self.manifest_path = os.path.join(self.out_dir, "manifest.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get_job(self, *paths: str) -> fetch.DownloadJob:
+        return [(f"{self.base_url}{path}", os.path.join(self.out_dir, path.lstrip("/"))) for path in paths]
+
+    def test_download_all_fetches_files_concurrently(self):
+        jobs = [self.get_job("/one.7z"), self.get_job("/two.rar")]
+        completed = fetch.download_all(jobs, self.manifest_path, max_workers=2)
+        self.assertEqual(len(completed), 2)
+        for path in ("/one.7z", "/two.rar"):
+            with open(os.path.join(self.out_dir, path.lstrip("/")), "rb") as file:
+                self.assertEqual(file.read(), FILES[path])
+
+    def test_manifest_records_size_and_checksum(self):
+        fetch.download_all([self.get_job("/one.7z")], self.manifest_path)
+        entry = fetch.Manifest(self.manifest_path).get("one.7z")
+        assert entry is not None
+        self.assertEqual(entry["size"], len(FILES["/one.7z"]))
+        self.assertEqual(entry["sha256"], hashlib.sha256(FILES["/one.7z"]).hexdigest())
+
+    def test_completed_downloads_are_skipped(self):
+        fetch.download_all([self.get_job("/one.7z")], self.manifest_path)
+        RangeRequestHandler.requests.clear()
+        completed = fetch.download_all([self.get_job("/one.7z")], self.manifest_path)
+        self.assertEqual(len(completed), 1)
+        self.assertEqual(RangeRequestHandler.requests, [])
+
+    def test_partial_download_is_resumed(self):
+        target = os.path.join(self.out_dir, "one.7z")
+        with open(f"{target}{fetch.PARTIAL_SUFFIX}", "wb") as partial_file:
+            partial_file.write(FILES["/one.7z"][:1000])
+        fetch.download_all([self.get_job("/one.7z")], self.manifest_path)
+        self.assertEqual(RangeRequestHandler.requests, [("/one.7z", "bytes=1000-")])
+        with open(target, "rb") as file:
+            self.assertEqual(file.read(), FILES["/one.7z"])
+        self.assertFalse(os.path.exists(f"{target}{fetch.PARTIAL_SUFFIX}"))
+
+    def test_complete_partial_download_is_finalised(self):
+        target = os.path.join(self.out_dir, "one.7z")
+        with open(f"{target}{fetch.PARTIAL_SUFFIX}", "wb") as partial_file:
+            partial_file.write(FILES["/one.7z"])
+        fetch.download_all([self.get_job("/one.7z")], self.manifest_path)
+        with open(target, "rb") as file:
+            self.assertEqual(file.read(), FILES["/one.7z"])
+
+    def test_invalid_candidate_falls_through_to_next(self):
+        job = self.get_job("/missing.7z", "/two.rar")
+        completed = fetch.download_all([job], self.manifest_path, validate=mame_dat_download.is_valid_archive)
+        self.assertEqual(completed, [os.path.join(self.out_dir, "two.rar")])
+        self.assertFalse(os.path.exists(os.path.join(self.out_dir, "missing.7z")))
+        self.assertIsNone(fetch.Manifest(self.manifest_path).get("missing.7z"))
+
+    def test_http_errors_are_not_recorded(self):
+        completed = fetch.download_all([self.get_job("/absent.7z")], self.manifest_path)
+        self.assertEqual(completed, [])
+
+
+class TestMameDatDownload(unittest.TestCase):
+    def test_get_dotted_version(self):
+        self.assertEqual(mame_dat_download.get_dotted_version("001"), "0.1")
+        self.assertEqual(mame_dat_download.get_dotted_version("053"), "0.53")
+        self.assertEqual(mame_dat_download.get_dotted_version("037b1"), "0.37b1")
+        self.assertEqual(mame_dat_download.get_dotted_version("261"), "0.261")
+
+    def test_get_member_version(self):
+        self.assertEqual(mame_dat_download.get_member_version("MAME 0.37b12fix.dat"), "0.37b12fix")
+        self.assertEqual(mame_dat_download.get_member_version("dats/MAME 0.52.xml"), "0.52")
+        self.assertIsNone(mame_dat_download.get_member_version("readme.txt"))
+
+    def test_get_listing_members_prefers_xml(self):
+        members = ["MAME 0.60.dat", "MAME 0.60.xml", "readme.txt"]
+        self.assertEqual(mame_dat_download.get_listing_members(members), ["MAME 0.60.xml"])
+        self.assertEqual(mame_dat_download.get_listing_members(["MAME 0.60.dat"]), ["MAME 0.60.dat"])
+
+
+if __name__ == "__main__":
+    unittest.main()
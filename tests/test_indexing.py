@@ -53,5 +53,36 @@ class TestIndexing(unittest.TestCase):
         self.assertEqual(result, "65ae03eb08c4fc99fede5304a8abba8df18da2acf9dc9c32379c14c43843b00a")
 
 
+class TestStableIds(unittest.TestCase):
+    def test_id_is_leading_63_bits_of_hash(self):
+        hex_hash = indexing.get_game_index_hash("Game", "rom1/100/crchash")
+        self.assertEqual(indexing.get_stable_id(hex_hash), int(hex_hash[:16], 16) >> 1)
+        self.assertLess(indexing.get_stable_id("f" * 64), 2**63)
+
+    def test_non_hex_keys_are_hashed(self):
+        self.assertNotEqual(indexing.get_stable_id("mame0_1"), indexing.get_stable_id("mame0_2"))
+        self.assertEqual(indexing.get_stable_id("mame0_1"), indexing.get_stable_id("mame0_1"))
+
+
+class TestBinaryHashes(unittest.TestCase):
+    def test_crc_to_int(self):
+        self.assertEqual(indexing.crc_to_int("8e68533e"), 0x8E68533E)
+        self.assertEqual(indexing.crc_to_int("00000000"), 0)
+        self.assertEqual(indexing.crc_to_int(0x8E68533E), 0x8E68533E)
+        self.assertIsNone(indexing.crc_to_int(""))
+        self.assertIsNone(indexing.crc_to_int(None))
+
+    def test_hex_to_bytes(self):
+        self.assertEqual(indexing.hex_to_bytes("03eb2feb"), b"\x03\xeb\x2f\xeb")
+        self.assertIsNone(indexing.hex_to_bytes(""))
+        self.assertEqual(indexing.hex_to_bytes("not hex"), "not hex")
+
+    def test_encode_hash(self):
+        hex_hash = indexing.get_game_index_hash("Game", "rom1/100/crchash")
+        self.assertEqual(indexing.encode_hash(hex_hash, "hex"), hex_hash)
+        self.assertEqual(indexing.encode_hash(hex_hash, "binary"), bytes.fromhex(hex_hash))
+        self.assertEqual(len(indexing.encode_hash(hex_hash, "binary")), 32)
+
+
 if __name__ == "__main__":
     unittest.main()
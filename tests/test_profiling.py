@@ -0,0 +1,117 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from arcade_db import create_db, profiling
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "create_db")
+
+
+@profiling.profile_stage("outer")
+def outer(size: int) -> list[bytes]:
+    return [bytes(size)] + inner(size)
+
+
+@profiling.profile_stage("inner")
+def inner(size: int) -> list[bytes]:
+    return [bytes(size)]
+
+
+class TestProfileStage(unittest.TestCase):
+    def setUp(self):
+        profiling.enable(snapshot_every=2)
+
+    def tearDown(self):
+        profiling.disable()
+
+    def test_disabled_stages_are_not_profiled(self):
+        profiling.disable()
+        self.assertEqual(len(outer(10)), 2)
+        self.assertEqual(profiling.PROFILE, {})
+
+    def test_nested_stages_record_retained_and_peak_memory(self):
+        kept = [outer(1024 * 1024) for _ in range(3)]
+        profile = profiling.take_profile()
+        self.assertEqual(profiling.PROFILE, {})
+        self.assertEqual(profile.keys(), {"outer", "inner"})
+        self.assertEqual((profile["outer"]["calls"], profile["outer"]["snapshots"]), (3, 2))
+        # The outer stage includes the inner stage's allocations
+        self.assertGreaterEqual(profile["inner"]["growth"], 3 * 1024 * 1024)
+        self.assertGreaterEqual(profile["outer"]["growth"], 6 * 1024 * 1024)
+        self.assertGreaterEqual(profile["outer"]["peak"], 2 * 1024 * 1024)
+        (line, size, count) = profiling.get_top_lines(profile["inner"])[0]
+        self.assertTrue(line.startswith(os.path.abspath(__file__)))
+        self.assertGreaterEqual(size, 2 * 1024 * 1024)
+        self.assertEqual(len(kept), 3)
+
+    def test_without_snapshots_only_growth_is_recorded(self):
+        profiling.enable(snapshot_every=0)
+        kept = outer(1024 * 1024)
+        profile = profiling.take_profile()
+        self.assertEqual((profile["outer"]["calls"], profile["outer"]["snapshots"]), (1, 0))
+        self.assertEqual(profile["outer"]["lines"], {})
+        self.assertGreaterEqual(profile["outer"]["growth"], 2 * 1024 * 1024)
+        self.assertEqual(len(kept), 2)
+
+    def test_profiles_are_merged(self):
+        outer(10)
+        first = profiling.take_profile()
+        outer(10)
+        outer(10)
+        second = profiling.take_profile()
+        merged: profiling.Profile = {}
+        profiling.merge_profiles(merged, first)
+        profiling.merge_profiles(merged, second)
+        self.assertEqual(merged["inner"]["calls"], 3)
+        self.assertEqual(merged["inner"]["snapshots"], 2)
+        self.assertEqual(merged["outer"]["seconds"], first["outer"]["seconds"] + second["outer"]["seconds"])
+        self.assertEqual(merged["outer"]["peak"], max(first["outer"]["peak"], second["outer"]["peak"]))
+
+
+class TestProfiledBuilds(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.out_dir = os.path.join(self.temp_dir.name, "out")
+        self.dats = []
+        for fixture, emulator in (("games_with_disks.xml", "MAME 0.1"), ("one_game.xml", "MAME 0.2")):
+            self.dats.append(os.path.join(self.temp_dir.name, f"{emulator}.xml"))
+            shutil.copy(os.path.join(FIXTURES_PATH, fixture), self.dats[-1])
+        profiling.enable()
+
+    def tearDown(self):
+        profiling.disable()
+        self.temp_dir.cleanup()
+
+    def read_profiles(self) -> dict:
+        with open(os.path.join(self.out_dir, profiling.PROFILE_NAME)) as profile_file:
+            return json.load(profile_file)
+
+    def test_consecutive_build(self):
+        output = StringIO()
+        with redirect_stdout(output):
+            create_db.process_dats_consecutively(self.dats, self.out_dir)
+        profiles = self.read_profiles()
+        self.assertEqual(profiles.keys(), {"parent"})
+        parent = profiles["parent"]
+        for stage in ("process_games", "merge_dat_data", "check_ids", "write"):
+            self.assertIn(stage, parent)
+        self.assertEqual(parent["process_games"]["calls"], 2)
+        self.assertIn("Allocations in parent:", output.getvalue())
+
+    def test_parallel_build_reports_workers_separately(self):
+        with redirect_stdout(StringIO()):
+            create_db.process_dats_parallel(self.dats, self.out_dir, 2)
+        profiles = self.read_profiles()
+        self.assertEqual(profiles["workers"]["process_games"]["calls"], 2)
+        self.assertNotIn("process_games", profiles["parent"])
+        self.assertIn("write", profiles["parent"])
+
+
+if __name__ == "__main__":
+    unittest.main()
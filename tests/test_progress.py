@@ -0,0 +1,175 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from arcade_db import create_db
+from arcade_db.shared import catalogue, progress, sources
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures")
+CREATE_DB_FIXTURES_PATH = os.path.join(FIXTURES_PATH, "create_db")
+CLRMAMEPRO_PATH = os.path.join(FIXTURES_PATH, "sources", "clrmamepro.dat")
+LOGIQX_PATH = os.path.join(FIXTURES_PATH, "sources", "logiqx.xml")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def read_events(log_path: str) -> list[dict]:
+    with open(log_path) as log_file:
+        return [json.loads(line) for line in log_file]
+
+
+class TestBuildProgress(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.temp_dir.name, "progress.jsonl")
+        self.clock = FakeClock()
+        self.tracker = progress.BuildProgress(
+            ["a", "b", "c"], self.log_path, {"a": 100, "b": 100, "c": 200}, clock=self.clock
+        )
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def update(self, dat_file: str, games: int = 10, worker: int = 1) -> str:
+        output = StringIO()
+        with redirect_stdout(output):
+            self.tracker.update(dat_file, {"games": games, "bytes": 1024 * 1024, "seconds": 1.0, "worker": worker})
+        return output.getvalue()
+
+    def test_eta_is_weighted_by_size(self):
+        self.assertIsNone(self.tracker.get_eta())
+        self.clock.now = 10
+        output = self.update("a")
+        # A quarter of the weight took 10s
+        self.assertEqual(self.tracker.get_eta(), 30)
+        self.assertIn("1/3 DATs, 2 remaining (25.0% by size), 1 games/s, 0.1 MB/s, ETA 0:00:30", output)
+        self.clock.now = 30
+        self.update("c")
+        self.assertEqual(self.tracker.get_eta(), 10)
+
+    def test_split_dat_is_done_with_its_last_part(self):
+        self.tracker.split("c", 2)
+        self.clock.now = 10
+        self.update("c")
+        self.assertEqual((self.tracker.dats_done, self.tracker.weight_done), (0, 100))
+        self.update("c")
+        self.assertEqual((self.tracker.dats_done, self.tracker.weight_done), (1, 200))
+
+    def test_event_log(self):
+        self.clock.now = 4
+        self.update("a", 10, worker=1)
+        self.update("b", 30, worker=2)
+        self.update("c", 20, worker=1)
+        with redirect_stdout(StringIO()):
+            self.tracker.finish()
+        events = read_events(self.log_path)
+        self.assertEqual([event["event"] for event in events], ["start", "dat", "dat", "dat", "end"])
+        self.assertEqual(events[0]["total_weight"], 400)
+        self.assertEqual(events[2]["dat"], "b")
+        self.assertEqual((events[2]["dats_done"], events[2]["dats_remaining"]), (2, 1))
+        self.assertEqual(events[2]["games_per_second"], 10)
+        self.assertEqual(events[2]["mb_per_second"], 0.5)
+        self.assertEqual(events[-1]["games"], 60)
+        self.assertEqual(events[-1]["workers"]["1"], {"jobs": 2, "games": 30, "bytes": 2 * 1024 * 1024, "seconds": 2})
+
+    def test_log_is_replaced(self):
+        progress.BuildProgress(["a"], self.log_path, {"a": 1})
+        self.assertEqual([event["event"] for event in read_events(self.log_path)], ["start"])
+
+
+class TestDatWeights(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.catalogue_path = os.path.join(self.temp_dir.name, "catalogue.json")
+        self.dats = [os.path.join(self.temp_dir.name, "logiqx.xml"), os.path.join(self.temp_dir.name, "mame.xml")]
+        shutil.copy(LOGIQX_PATH, self.dats[0])
+        shutil.copy(os.path.join(FIXTURES_PATH, "sources", "mame.xml"), self.dats[1])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_catalogue_sizes_are_used_when_all_are_current(self):
+        catalogue.update_catalogue(self.dats[:1], self.catalogue_path)
+        stored = {dat_file: os.path.getsize(dat_file) for dat_file in self.dats}
+        self.assertEqual(progress.get_dat_weights(self.dats, self.catalogue_path), stored)
+        entries = catalogue.update_catalogue(self.dats, self.catalogue_path)
+        expected = {dat_file: entry["uncompressed_size"] for dat_file, entry in entries.items()}
+        self.assertEqual(progress.get_dat_weights(self.dats, self.catalogue_path), expected)
+
+
+class TestReaderBytes(unittest.TestCase):
+    def test_bytes_read_are_decompressed_sizes(self):
+        for path in (LOGIQX_PATH, CLRMAMEPRO_PATH):
+            reader = sources.get_dat_reader(path)
+            self.assertEqual(reader.bytes_read, 0)
+            with redirect_stdout(StringIO()):
+                list(reader.iter_games())
+            self.assertEqual(reader.bytes_read, os.path.getsize(path), path)
+
+
+class TestBuildProgressLog(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.temp_dir.name, "progress.jsonl")
+        self.dats = []
+        for fixture, emulator in (("games_with_disks.xml", "MAME 0.1"), ("one_game.xml", "MAME 0.2")):
+            self.dats.append(os.path.join(self.temp_dir.name, f"{emulator}.xml"))
+            shutil.copy(os.path.join(CREATE_DB_FIXTURES_PATH, fixture), self.dats[-1])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def assert_dat_events(self, split: bool = False):
+        events = read_events(self.log_path)
+        self.assertEqual(events[0]["event"], "start")
+        self.assertEqual(events[-1]["event"], "write")
+        dat_events = [event for event in events if event["event"] == "dat"]
+        by_dat: dict[str, int] = {}
+        for event in dat_events:
+            by_dat[event["dat"]] = by_dat.get(event["dat"], 0) + event["bytes"]
+        sizes = {os.path.basename(dat_file): os.path.getsize(dat_file) for dat_file in self.dats}
+        if split:
+            # Each part repeats the DAT's root element and header
+            self.assertEqual(by_dat.keys(), sizes.keys())
+            self.assertTrue(all(by_dat[dat] >= sizes[dat] for dat in sizes))
+        else:
+            self.assertEqual(by_dat, sizes)
+        self.assertEqual(dat_events[-1]["dats_remaining"], 0)
+        end = events[-2]
+        self.assertEqual(end["event"], "end")
+        self.assertEqual(end["dats_done"], len(self.dats))
+        self.assertEqual(end["games"], sum(event["games"] for event in dat_events))
+        self.assertGreater(end["games"], 0)
+        if split:
+            self.assertGreater(len(dat_events), len(self.dats))
+
+    def test_consecutive_build(self):
+        create_db.process_dats_consecutively(
+            self.dats, os.path.join(self.temp_dir.name, "out"), progress_log=self.log_path
+        )
+        self.assert_dat_events()
+
+    def test_parallel_build_with_split_dats(self):
+        out_dir = os.path.join(self.temp_dir.name, "out")
+        create_db.process_dats_parallel(self.dats, out_dir, 2, split_size=0, progress_log=self.log_path)
+        self.assert_dat_events(split=True)
+
+    def test_spilled_build(self):
+        create_db.process_dats_spilled(self.dats, os.path.join(self.temp_dir.name, "out"), progress_log=self.log_path)
+        self.assert_dat_events()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+
+from lxml import etree as ET
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from arcade_db import create_db, queries
+from arcade_db.shared import db
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "create_db")
+
+
+class TestQueries(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        dat_data = create_db.get_empty_dat_data()
+        for fixture, emulator in (
+            ("games_with_cloneof_romof_rels.xml", "MAME 0.100"),
+            ("games_with_cloneof_romof_unordered.xml", "MAME 0.200"),
+            ("one_game_with_features_driver.xml", "MAME 0.200"),
+        ):
+            root = ET.parse(os.path.join(FIXTURES_PATH, fixture)).getroot()
+            create_db.merge_dat_data(dat_data, create_db.process_games(root, create_db.get_emulator_attrs(emulator)))
+        create_db.write(dat_data, cls.temp_dir.name)
+        cls.engine = create_engine(f"sqlite:///{os.path.join(cls.temp_dir.name, 'arcade.db')}")  # noqa: E231
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
+        cls.temp_dir.cleanup()
+
+    def setUp(self):
+        self.session = sessionmaker(bind=self.engine)()
+        self.mame_100 = queries.get_emulator_by_name(self.session, "mame", "0.100")
+        self.mame_200 = queries.get_emulator_by_name(self.session, "MAME", "0.200")
+        self.game_ids = {game.name: game.id for game in self.session.query(db.Game)}
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_get_emulator_by_name(self):
+        self.assertEqual((self.mame_100.name, self.mame_100.version), ("MAME", "0.100"))
+        self.assertIsNotNone(queries.get_emulator_by_name(self.session))
+        self.assertIsNone(queries.get_emulator_by_name(self.session, "MAME", "0.1"))
+
+    def test_get_clones(self):
+        parent = self.session.get(db.Game, self.game_ids["columns"])
+        self.assertEqual([game.name for game in queries.get_clones(self.session, parent, self.mame_100)], ["columnsj"])
+        self.assertEqual(
+            sorted(game.name for game in queries.get_clones(self.session, parent, self.mame_200)),
+            ["columnsj", "columnsxyz"],
+        )
+
+    def test_get_emulators_for_games(self):
+        emulators = queries.get_emulators_for_games(self.session, self.game_ids.values())
+        self.assertEqual(sorted(version for _, _, version in emulators[self.game_ids["columnsj"]]), ["0.100", "0.200"])
+        self.assertEqual([version for _, _, version in emulators[self.game_ids["columnsxyz"]]], ["0.200"])
+
+    def test_get_emulators_for_games_batches(self):
+        ids = list(self.game_ids.values()) + list(range(10_000, 10_000 + 2 * queries.IN_BATCH_SIZE))
+        self.assertEqual(
+            queries.get_emulators_for_games(self.session, ids),
+            queries.get_emulators_for_games(self.session, self.game_ids.values()),
+        )
+
+    def test_get_clones_for_parents(self):
+        clones = queries.get_clones_for_parents(self.session, ["columns", "1on1gov"])
+        self.assertEqual(list(clones), ["columns"])
+        self.assertEqual([row.name for row in clones["columns"]], ["columnsj", "columnsxyz"])
+        clones = queries.get_clones_for_parents(self.session, ["columns"], self.mame_100.id)
+        self.assertEqual([row.name for row in clones["columns"]], ["columnsj"])
+
+    def test_get_game_list(self):
+        games = queries.get_game_list(self.session, self.mame_200.id)
+        self.assertEqual([row.name for row in games], ["1on1gov", "columns", "columnsj", "columnsxyz"])
+        self.assertEqual(games[2].cloneof, "columns")
+        names = queries.get_game_list(self.session, self.mame_100.id, (db.Game.name,))
+        self.assertEqual([tuple(row) for row in names], [("columns",), ("columnsj",)])
+
+    def test_get_games_eager(self):
+        games = queries.get_games(self.session, self.game_ids.values(), eager=True)
+        self.assertEqual([game.id for game in games], sorted(self.game_ids.values()))
+        self.session.expunge_all()
+        game = next(game for game in games if game.name == "columnsj")
+        self.assertEqual(
+            sorted(game_emulator.emulator.version for game_emulator in game.game_emulators), ["0.100", "0.200"]
+        )
+        self.assertTrue(game.roms)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from multiprocessing.pool import ThreadPool
+
+from arcade_db import create_db, scheduling
+from tests.helpers import read_tables
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "create_db")
+
+
+class TestEstimateMemory(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dat_file = os.path.join(self.temp_dir.name, "MAME 0.1.xml.bz2")
+        with open(self.dat_file, "wb") as dat_file:
+            dat_file.write(b"x" * 1024 * 1024)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_estimate_from_size(self):
+        self.assertEqual(scheduling.estimate_memory(self.dat_file, {}), scheduling.COMPRESSED_MEMORY_FACTOR)
+        part = b"x" * 1024 * 1024
+        self.assertEqual(scheduling.estimate_memory(self.dat_file, {}, part), scheduling.UNCOMPRESSED_MEMORY_FACTOR)
+
+    def test_recorded_peak_is_used_until_the_dat_changes(self):
+        history: scheduling.MemoryHistory = {}
+        scheduling.record_peak(history, self.dat_file, 12.34)
+        self.assertEqual(scheduling.estimate_memory(self.dat_file, history), 12.3)
+        with open(self.dat_file, "ab") as dat_file:
+            dat_file.write(b"x")
+        self.assertGreater(scheduling.estimate_memory(self.dat_file, history), 200)
+
+    def test_history_round_trip(self):
+        path = scheduling.get_history_path(self.temp_dir.name)
+        self.assertEqual(scheduling.load_memory_history(path), {})
+        history: scheduling.MemoryHistory = {}
+        scheduling.record_peak(history, self.dat_file, 5)
+        scheduling.save_memory_history(path, history)
+        self.assertEqual(scheduling.load_memory_history(path), history)
+
+
+class TestImapBudgeted(unittest.TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.running: list[float] = []
+        self.peaks: list[float] = []
+
+    def run_job(self, estimate: float) -> float:
+        with self.lock:
+            self.running.append(estimate)
+            self.peaks.append(sum(self.running))
+        time.sleep(0.01)
+        with self.lock:
+            self.running.remove(estimate)
+        return estimate
+
+    def test_running_jobs_stay_within_budget(self):
+        estimates = [30, 50, 10, 20, 40, 10, 10, 60, 5, 5]
+        with ThreadPool(4) as pool:
+            jobs = ((estimate, estimate) for estimate in estimates)
+            results = list(scheduling.imap_budgeted(pool, self.run_job, jobs, 4, 60))
+        self.assertEqual(sorted(results), sorted(estimates))
+        self.assertLessEqual(max(self.peaks), 60)
+        self.assertGreater(max(self.peaks), 60 / 2)
+
+    def test_jobs_larger_than_the_budget_run_alone(self):
+        with ThreadPool(4) as pool:
+            jobs = ((estimate, estimate) for estimate in (10, 100, 10))
+            results = list(scheduling.imap_budgeted(pool, self.run_job, jobs, 4, 50))
+        self.assertEqual(sorted(results), [10, 10, 100])
+        self.assertIn(100, self.peaks)
+        self.assertNotIn(110, self.peaks)
+
+    def test_errors_are_raised(self):
+        def fail(job):
+            raise ValueError(job)
+
+        with ThreadPool(2) as pool:
+            with self.assertRaisesRegex(ValueError, "bad"):
+                list(scheduling.imap_budgeted(pool, fail, [("bad", 1)], 2, 10))
+
+
+class TestBudgetedBuild(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dats = []
+        for fixture, emulator in (("games_with_disks.xml", "MAME 0.1"), ("one_game.xml", "MAME 0.2")):
+            self.dats.append(os.path.join(self.temp_dir.name, f"{emulator}.xml"))
+            shutil.copy(os.path.join(FIXTURES_PATH, fixture), self.dats[-1])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_matches_unbudgeted_build_and_records_peaks(self):
+        expected_dir = os.path.join(self.temp_dir.name, "expected")
+        budgeted_dir = os.path.join(self.temp_dir.name, "budgeted")
+        create_db.process_dats_consecutively(self.dats, expected_dir)
+        for _ in range(2):
+            create_db.process_dats_parallel(self.dats, budgeted_dir, 2, memory_budget=0.001, max_tasks_per_child=1)
+            self.assertEqual(read_tables(budgeted_dir), read_tables(expected_dir))
+            with open(scheduling.get_history_path(budgeted_dir)) as history_file:
+                history = json.load(history_file)
+            self.assertEqual(sorted(history), sorted(os.path.basename(dat) for dat in self.dats))
+
+
+if __name__ == "__main__":
+    unittest.main()
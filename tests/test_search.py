@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+from lxml import etree as ET
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from arcade_db import create_db, queries, search
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "create_db")
+
+
+class TestSearchGames(unittest.TestCase):
+    stages: tuple[str, ...] = ("search",)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        dat_data = create_db.get_empty_dat_data()
+        for fixture, emulator in (
+            ("games_with_disks.xml", "MAME 0.100"),
+            ("games_with_cloneof_romof_unordered.xml", "MAME 0.200"),
+            ("one_game_with_features_driver.xml", "FBA 029523"),
+        ):
+            root = ET.parse(os.path.join(FIXTURES_PATH, fixture)).getroot()
+            create_db.merge_dat_data(dat_data, create_db.process_games(root, create_db.get_emulator_attrs(emulator)))
+        create_db.write(dat_data, cls.temp_dir.name, stages=cls.stages)
+        cls.engine = create_engine(f"sqlite:///{os.path.join(cls.temp_dir.name, 'arcade.db')}")  # noqa: E231
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
+        cls.temp_dir.cleanup()
+
+    def setUp(self):
+        self.session = sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.session.close()
+
+    def search(self, query, **filters):
+        return sorted(game.name for game in queries.search_games(self.session, query, **filters))
+
+    def test_index_presence(self):
+        self.assertEqual(search.has_search_index(self.session), bool(self.stages))
+
+    def test_word_prefixes(self):
+        self.assertEqual(self.search("after burn"), ["abclimax"])
+        self.assertEqual(self.search("colu japan"), ["columnsj", "columnsxyz"])
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.search("columns world"), ["columns"])
+        self.assertEqual(self.search("columns burner"), [])
+
+    def test_punctuation_is_ignored(self):
+        self.assertEqual(self.search('area "51 NOT'), [])
+        self.assertEqual(self.search("area-51"), ["a51mxr3k"])
+        self.assertEqual(queries.search_games(self.session, "()"), [])
+
+    def test_filters(self):
+        self.assertEqual(self.search("sega", year="2006"), ["abclimax"])
+        self.assertEqual(self.search("japan", manufacturer="tec"), ["1on1gov"])
+        self.assertEqual(self.search("japan", emulator="fba"), ["1on1gov"])
+        self.assertEqual(self.search("sega", emulator="MAME", version="0.100"), ["2spicy", "abclimax"])
+
+    def test_like_wildcards_are_literal(self):
+        self.assertEqual(self.search("s_ga"), [])
+        self.assertEqual(self.search("japan", manufacturer="te_"), [])
+        self.assertEqual(self.search("japan", manufacturer="%"), [])
+        self.assertEqual(queries.escape_like("100%_a\\b"), "100\\%\\_a\\\\b")
+
+    def test_limit(self):
+        self.assertEqual(len(queries.search_games(self.session, "sega", limit=2)), 2)
+
+
+class TestSearchGamesWithoutIndex(TestSearchGames):
+    stages = ()
+
+
+class TestMatchExpression(unittest.TestCase):
+    def test_words_are_quoted_prefixes(self):
+        words = search.get_words('Street "Fighter II')
+        self.assertEqual(search.get_match_expression(words), '"street"* AND "fighter"* AND "ii"*')
+
+
+if __name__ == "__main__":
+    unittest.main()
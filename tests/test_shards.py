@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree as ET
+
+from arcade_db import create_db, shards
+from tests.helpers import read_dat_tables, read_tables
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "create_db")
+FIXTURES = (
+    ("games_with_cloneof_romof_rels.xml", "MAME 0.100"),
+    ("games_with_overlapping_roms.xml", "MAME 0.101"),
+    ("one_game_diff_rom_crc.xml", "MAME 0.102"),
+    ("one_game_diff_rom_crc_2.xml", "MAME 0.103"),
+    ("games_with_disks.xml", "MAME 0.104"),
+)
+
+
+def get_dat_data(fixtures) -> create_db.DatData:
+    dat_data = create_db.get_empty_dat_data()
+    for fixture, emulator in fixtures:
+        root = ET.parse(os.path.join(FIXTURES_PATH, fixture)).getroot()
+        create_db.merge_dat_data(dat_data, create_db.process_games(root, create_db.get_emulator_attrs(emulator)))
+    return dat_data
+
+
+class TestShards(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_shards(self, name, splits) -> list[str]:
+        shard_dirs = []
+        for i, (start, end) in enumerate(splits):
+            shard_dir = os.path.join(self.temp_dir.name, name, f"shard-{i:03d}")
+            shards.write_shard(get_dat_data(FIXTURES[start:end]), shard_dir, [fixture for fixture, _ in FIXTURES])
+            shard_dirs.append(shard_dir)
+        return shard_dirs
+
+    def test_merge_matches_unsharded_build(self):
+        merged = shards.merge_shards(self.write_shards("sharded", [(0, 2), (2, 3), (3, 5)]))
+        unsharded = get_dat_data(FIXTURES)
+        self.assertEqual(list(merged), list(unsharded))
+        for key in unsharded:
+            self.assertEqual(merged[key], unsharded[key], key)
+
+    def test_merged_tables_are_in_hash_order(self):
+        merged = shards.merge_shards(self.write_shards("sharded", [(0, 3), (3, 5)]))
+        for key, records in merged.items():
+            self.assertEqual(list(records), sorted(records), key)
+
+    def test_database_is_independent_of_sharding(self):
+        databases = []
+        for name, splits in (("one", [(0, 5)]), ("two", [(0, 1), (1, 5)]), ("five", [(i, i + 1) for i in range(5)])):
+            out_dir = os.path.join(self.temp_dir.name, f"{name}-out")
+            create_db.write(shards.merge_shards(self.write_shards(name, splits)), out_dir)
+            databases.append(read_tables(out_dir))
+        self.assertEqual(databases[0], databases[1])
+        self.assertEqual(databases[0], databases[2])
+
+    def test_last_shard_wins(self):
+        first = os.path.join(self.temp_dir.name, "first")
+        second = os.path.join(self.temp_dir.name, "second")
+        shards.write_shard({"games": {"a": {"name": "old"}, "b": {"name": "b"}}}, first, [])
+        shards.write_shard({"games": {"a": {"name": "new"}}}, second, [])
+        self.assertEqual(shards.merge_shards([first, second]), {"games": {"a": {"name": "new"}, "b": {"name": "b"}}})
+
+
+class TestWriteFromShards(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_runs(self) -> list[str]:
+        run_dirs = []
+        for i, fixture in enumerate(FIXTURES):
+            run_dirs.append(os.path.join(self.temp_dir.name, "runs", str(i)))
+            shards.write_shard(get_dat_data([fixture]), run_dirs[-1], [fixture[0]])
+        return run_dirs
+
+    def test_matches_in_memory_build(self):
+        for hash_format in ("hex", "binary"):
+            in_memory_dir = os.path.join(self.temp_dir.name, f"in-memory-{hash_format}")
+            streamed_dir = os.path.join(self.temp_dir.name, f"streamed-{hash_format}")
+            create_db.write(get_dat_data(FIXTURES), in_memory_dir, hash_format=hash_format)
+            create_db.write_from_shards(self.write_runs(), streamed_dir, hash_format, batch_size=2)
+            self.assertEqual(read_dat_tables(streamed_dir), read_dat_tables(in_memory_dir), hash_format)
+
+    def test_id_collisions_are_detected(self):
+        first = os.path.join(self.temp_dir.name, "first")
+        shards.write_shard({"games": {"a": {"id": 1, "name": "a"}, "b": {"id": 1, "name": "b"}}}, first, [])
+        with self.assertRaisesRegex(ValueError, "share id 1"):
+            create_db.write_from_shards([first], os.path.join(self.temp_dir.name, "out"))
+
+    def test_tables_without_records_are_not_created(self):
+        # None of the first three fixtures has disks or features
+        out_dir = os.path.join(self.temp_dir.name, "out")
+        create_db.write_from_shards(self.write_runs()[:3], out_dir)
+        self.assertNotIn("disks", read_tables(out_dir))
+        self.assertNotIn("features", read_tables(out_dir))
+
+    def test_spilled_build_from_dat_files(self):
+        for name, fixtures in (("all", FIXTURES), ("without-disks", FIXTURES[:3])):
+            dats = []
+            for fixture, emulator in fixtures:
+                dats.append(os.path.join(self.temp_dir.name, name, f"{emulator}.xml"))
+                os.makedirs(os.path.dirname(dats[-1]), exist_ok=True)
+                shutil.copy(os.path.join(FIXTURES_PATH, fixture), dats[-1])
+            in_memory_dir = os.path.join(self.temp_dir.name, name, "in-memory")
+            spilled_dir = os.path.join(self.temp_dir.name, name, "spilled")
+            create_db.process_dats_consecutively(dats, in_memory_dir)
+            create_db.process_dats_spilled(dats, spilled_dir)
+            self.assertEqual(read_tables(spilled_dir).keys(), read_tables(in_memory_dir).keys(), name)
+            self.assertEqual(read_dat_tables(spilled_dir), read_dat_tables(in_memory_dir), name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+
+from lxml import etree as ET
+
+from arcade_db import create_db, snapshot
+from arcade_db.shared import indexing
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "create_db")
+FIXTURES = ("games_with_overlapping_roms.xml", "one_game_with_features_driver.xml", "games_with_disks.xml")
+
+
+def get_index_hash(fixture: str, name: str) -> str:
+    root = ET.parse(os.path.join(FIXTURES_PATH, fixture)).getroot()
+    game = root.find(f"machine[@name='{name}']")
+    return indexing.get_game_index_from_elements(name, game.findall("rom"))
+
+
+class TestSnapshot(unittest.TestCase):
+    hash_format = "hex"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        dat_data = create_db.get_empty_dat_data()
+        for fixture in FIXTURES:
+            root = ET.parse(os.path.join(FIXTURES_PATH, fixture)).getroot()
+            create_db.merge_dat_data(dat_data, create_db.process_games(root, create_db.get_emulator_attrs("MAME 0.1")))
+        create_db.write(dat_data, cls.temp_dir.name, hash_format=cls.hash_format, stages=("snapshot",))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
+
+    def setUp(self):
+        self.snapshot = snapshot.Snapshot(os.path.join(self.temp_dir.name, snapshot.SNAPSHOT_NAME))
+
+    def tearDown(self):
+        self.snapshot.close()
+
+    def test_find_game(self):
+        game = self.snapshot.find_game(get_index_hash("one_game_with_features_driver.xml", "1on1gov"))
+        self.assertEqual(game.name, "1on1gov")
+        self.assertEqual(game.description, "1 on 1 Government (Japan)")
+
+    def test_find_game_by_digest(self):
+        index_hash = get_index_hash("games_with_overlapping_roms.xml", "columnsj")
+        self.assertEqual(self.snapshot.find_game(bytes.fromhex(index_hash)).name, "columnsj")
+
+    def test_missing_game(self):
+        self.assertIsNone(self.snapshot.find_game("0" * 64))
+        self.assertIsNone(self.snapshot.find_game("f" * 64))
+
+    def test_rom_games(self):
+        game = self.snapshot.find_game(get_index_hash("games_with_overlapping_roms.xml", "columns"))
+        roms = list(self.snapshot.get_game_roms(game))
+        self.assertTrue(roms)
+        shared = [rom for rom in roms if len(list(self.snapshot.get_rom_games(rom))) > 1]
+        self.assertTrue(shared)
+        self.assertEqual(sorted(game.name for game in self.snapshot.get_rom_games(shared[0])), ["columns", "columnsj"])
+
+    def test_find_roms(self):
+        root = ET.parse(os.path.join(FIXTURES_PATH, "one_game_with_features_driver.xml")).getroot()
+        rom = root.find("machine/rom[@crc]")
+        matches = self.snapshot.find_roms(rom.get("crc"), int(rom.get("size")))
+        self.assertEqual([match.name for match in matches], [rom.get("name")])
+        self.assertEqual(self.snapshot.find_roms(int(rom.get("crc"), 16), int(rom.get("size")) + 1), [])
+        self.assertEqual(self.snapshot.find_roms("", 0), [])
+
+
+class TestBinaryHashSnapshot(TestSnapshot):
+    hash_format = "binary"
+
+
+class TestSnapshotFormat(unittest.TestCase):
+    def test_rejects_other_files(self):
+        with tempfile.NamedTemporaryFile() as other_file:
+            other_file.write(b"\0" * snapshot.HEADER.size)
+            other_file.flush()
+            with self.assertRaises(ValueError):
+                snapshot.Snapshot(other_file.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+import os
+import bz2
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from lxml import etree as ET
+
+from arcade_db import create_db
+from arcade_db.shared import sources
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures", "sources")
+CLRMAMEPRO_PATH = os.path.join(FIXTURES_PATH, "clrmamepro.dat")
+LOGIQX_PATH = os.path.join(FIXTURES_PATH, "logiqx.xml")
+MAME_PATH = os.path.join(FIXTURES_PATH, "mame.xml")
+
+
+class TestGetDatReader(unittest.TestCase):
+    def test_xml_dats_use_xml_reader(self):
+        self.assertIsInstance(sources.get_dat_reader(LOGIQX_PATH), sources.XmlDatReader)
+        self.assertIsInstance(sources.get_dat_reader(MAME_PATH), sources.XmlDatReader)
+
+    def test_parenthetical_dats_use_clrmamepro_reader(self):
+        self.assertIsInstance(sources.get_dat_reader(CLRMAMEPRO_PATH), sources.ClrMameProDatReader)
+
+    def test_compressed_dats_are_detected(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            compressed_path = os.path.join(temp_dir, "FBA 029523.dat.bz2")
+            with open(CLRMAMEPRO_PATH, "rb") as source, bz2.open(compressed_path, "wb") as target:
+                shutil.copyfileobj(source, target)
+            reader = sources.get_dat_reader(compressed_path)
+            self.assertIsInstance(reader, sources.ClrMameProDatReader)
+            self.assertEqual(len(list(reader.iter_games())), 3)
+
+    def test_readers_must_implement_iter_games(self):
+        with self.assertRaises(TypeError):
+            sources.DatReader(MAME_PATH)  # type: ignore[abstract]
+
+
+class TestXmlDatReader(unittest.TestCase):
+    def test_header_is_skipped(self):
+        tags = [element.tag for element in sources.get_dat_reader(LOGIQX_PATH).iter_games()]
+        self.assertEqual(tags, ["game", "game", "resource"])
+
+    def test_mame_machines_are_read(self):
+        names = [element.get("name") for element in sources.get_dat_reader(MAME_PATH).iter_games()]
+        self.assertEqual(names, ["kof2001"])
+
+    def test_games_match_parsed_tree(self):
+        with mock.patch.object(sources, "CHUNK_SIZE", 16):
+            games = [ET.tostring(element) for element in sources.XmlDatReader(LOGIQX_PATH).iter_games()]
+        root = sources.get_dat_root(LOGIQX_PATH)
+        self.assertEqual(games, [ET.tostring(element) for element in root if element.tag in sources.GAME_TAGS])
+
+
+class TestIterChunks(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_multi_stream_bz2_is_read_in_small_chunks(self):
+        path = os.path.join(self.temp_dir.name, "MAME 0.1.xml.bz2")
+        with open(MAME_PATH, "rb") as source:
+            contents = source.read()
+        with open(path, "wb") as target:
+            target.write(bz2.compress(contents[:100]) + bz2.compress(contents[100:]))
+        chunks = list(sources.iter_chunks(path, chunk_size=64))
+        self.assertEqual(b"".join(chunks), contents)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), 64)
+
+    def test_truncated_bz2_raises(self):
+        path = os.path.join(self.temp_dir.name, "MAME 0.1.xml.bz2")
+        with open(MAME_PATH, "rb") as source, open(path, "wb") as target:
+            target.write(bz2.compress(source.read())[:-10])
+        with self.assertRaises(EOFError):
+            list(sources.iter_chunks(path))
+
+    def test_reader_stops_when_abandoned(self):
+        chunks = sources.iter_chunks(MAME_PATH, chunk_size=16, queue_size=1)
+        next(chunks)
+        chunks.close()
+        self.assertEqual([thread for thread in threading.enumerate() if thread.name.startswith("read ")], [])
+
+
+class TestXmlRecordDatReader(unittest.TestCase):
+    def tearDown(self):
+        sources.set_parse_engine("tree")
+
+    def test_same_records_as_tree(self):
+        fixtures_path = os.path.join(SCRIPT_PATH, "fixtures", "create_db")
+        emulator_attrs = create_db.get_emulator_attrs("MAME 0.1")
+        for fixture in sorted(name for name in os.listdir(fixtures_path) if name.endswith(".xml")):
+            path = os.path.join(fixtures_path, fixture)
+            from_tree = create_db.process_games(sources.XmlDatReader(path).iter_games(), emulator_attrs)
+            from_records = create_db.process_games(sources.XmlRecordDatReader(path).iter_games(), emulator_attrs)
+            self.assertEqual(from_records, from_tree, fixture)
+
+    def test_dtd_defaults_are_included(self):
+        contents = (
+            b'<!DOCTYPE mame [<!ATTLIST machine runnable (yes|no) "yes">]>'
+            b'<mame><machine name="a"><rom name="r"/></machine><machine name="b" runnable="no"/></mame>'
+        )
+        tree_games = list(sources.XmlDatReader.iter_parsed([contents]))
+        record_games = list(sources.XmlRecordDatReader.iter_parsed([contents]))
+        self.assertEqual([game.get("runnable") for game in record_games], ["yes", "no"])
+        self.assertEqual([game.get("runnable") for game in tree_games], ["yes", "no"])
+
+    def test_records_keep_children_which_are_read(self):
+        (game,) = sources.XmlRecordDatReader(MAME_PATH).iter_games()
+        self.assertIsInstance(game, sources.GameRecord)
+        self.assertEqual(game.find("description").text, "The King of Fighters 2001")
+        self.assertEqual([rom.get("crc") for rom in game.findall("rom")], ["9381750d", "99cc785a"])
+        self.assertIsNone(game.find("input"))
+
+    def test_engine_is_selectable(self):
+        sources.set_parse_engine("records")
+        self.assertIsInstance(sources.get_dat_reader(MAME_PATH), sources.XmlRecordDatReader)
+        self.assertIsInstance(sources.get_dat_reader(CLRMAMEPRO_PATH), sources.ClrMameProDatReader)
+
+
+class TestSplitXmlDat(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(SCRIPT_PATH, "fixtures", "create_db", "games_with_disks.xml"), "rb") as dat_file:
+            self.contents = dat_file.read()
+        self.names = [element.get("name") for element in ET.fromstring(self.contents)]
+
+    def test_parts_hold_every_game_once(self):
+        for parts in (1, 2, 3, 4, 10):
+            documents = sources.split_xml_dat(self.contents, parts)
+            self.assertLessEqual(len(documents), parts)
+            names = [element.get("name") for document in documents for element in ET.fromstring(document)]
+            self.assertEqual(names, self.names, parts)
+
+    def test_parts_keep_prolog_and_root(self):
+        documents = sources.split_xml_dat(self.contents, 2)
+        self.assertEqual(len(documents), 2)
+        for document in documents:
+            root = ET.fromstring(document)
+            self.assertEqual(root.tag, "datafile")
+            self.assertTrue(document.startswith(self.contents[: self.contents.index(b"<machine")]))
+
+    def test_contents_without_games_are_not_split(self):
+        self.assertEqual(sources.split_xml_dat(b"<datafile></datafile>", 4), [b"<datafile></datafile>"])
+
+
+class TestClrMameProDatReader(unittest.TestCase):
+    def setUp(self):
+        self.games = list(sources.ClrMameProDatReader(CLRMAMEPRO_PATH).iter_games())
+
+    def test_game_attributes_and_children(self):
+        game = self.games[1]
+        self.assertEqual(game.tag, "game")
+        self.assertEqual(game.get("name"), "cthd2003")
+        self.assertEqual(game.get("cloneof"), "kof2001")
+        self.assertEqual(game.findtext("manufacturer"), "Phenixsoft")
+
+    def test_quoted_values_containing_quotes(self):
+        self.assertEqual(
+            self.games[1].findtext("description"),
+            'Crouching Tiger Hidden Dragon 2003 [Bootleg, Hack of "The King of Fighters 2001"]',
+        )
+
+    def test_rom_names_with_spaces(self):
+        rom = self.games[1].findall("rom")[1]
+        self.assertEqual(dict(rom.attrib), {"name": "uc07 p12", "size": "524288", "crc": "3d299954"})
+
+    def test_roms_without_names_are_skipped(self):
+        self.assertEqual(len(self.games[0].findall("rom")), 2)
+
+    def test_biosset_flags(self):
+        biosset = self.games[2].find("biosset")
+        self.assertEqual(dict(biosset.attrib), {"name": "0", "description": "asia-s3.rom", "default": "yes"})
+
+    def test_parse_block_flag_without_value(self):
+        self.assertEqual(
+            sources.ClrMameProDatReader.parse_block("biosset ( name 1 default )"), {"name": "1", "default": ""}
+        )
+
+    def test_same_records_as_equivalent_xml(self):
+        emulator_attrs = create_db.get_emulator_attrs("FBA 029523.xml.bz2")
+        from_clrmamepro = create_db.process_games(self.games, dict(emulator_attrs))
+        from_xml = create_db.process_games(sources.get_dat_reader(LOGIQX_PATH).iter_games(), dict(emulator_attrs))
+        self.assertEqual(from_clrmamepro, from_xml)
+
+
+class TestOriginalDatEmulatorAttrs(unittest.TestCase):
+    def test_original_fba_dat_matches_converted_dat(self):
+        self.assertDictEqual(
+            create_db.get_emulator_attrs("fba_029523.xml"), create_db.get_emulator_attrs("FBA 029523.xml.bz2")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
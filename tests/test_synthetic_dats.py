@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from arcade_db import create_db
+from arcade_db.shared import sources
+from tests_db import synthetic_dats
+
+
+def read_games(path: str) -> dict[str, dict]:
+    root = sources.get_dat_root(path)
+    assert root is not None, path
+    games = {}
+    for element in root:
+        if element.tag in sources.GAME_TAGS:
+            games[element.get("name")] = {
+                "attrib": dict(element.attrib),
+                "roms": [dict(rom.attrib) for rom in element.findall("rom")],
+                "disks": element.findall("disk"),
+                "features": element.findall("feature"),
+                "driver": element.find("driver"),
+            }
+    return games
+
+
+class TestSyntheticDats(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def generate(self, name: str, **options) -> list[str]:
+        with redirect_stdout(StringIO()):
+            self.dats, self.corpus = synthetic_dats.generate_dats(os.path.join(self.temp_dir.name, name), **options)
+        return self.dats
+
+    def test_dats_are_seeded(self):
+        dats = [self.generate(name, versions=2, games=300, seed=seed) for name, seed in (("a", 1), ("b", 1), ("c", 2))]
+        contents = [[open(dat_file, "rb").read() for dat_file in version_dats] for version_dats in dats]
+        self.assertEqual(contents[0], contents[1])
+        self.assertNotEqual(contents[0], contents[2])
+        self.assertEqual([os.path.basename(dat_file) for dat_file in dats[0]], ["MAME 0.1.xml", "MAME 0.2.xml"])
+
+    def test_game_mix(self):
+        (dat_file,) = self.generate("mame", versions=1, games=2000, disk_ratio=0.1, feature_ratio=0.3)
+        games = read_games(dat_file)
+        self.assertEqual(len(games), 2000)
+        clones = [game for game in games.values() if "cloneof" in game["attrib"]]
+        self.assertAlmostEqual(len(clones) / len(games), synthetic_dats.DEFAULT_CLONE_RATIO, delta=0.05)
+        self.assertAlmostEqual(sum(bool(game["disks"]) for game in games.values()) / len(games), 0.1, delta=0.03)
+        self.assertAlmostEqual(sum(bool(game["features"]) for game in games.values()) / len(games), 0.3, delta=0.04)
+        self.assertTrue(all(game["driver"] is not None for game in games.values()))
+        for name, game in games.items():
+            romof = game["attrib"].get("romof")
+            if romof is None:
+                continue
+            # As validate_sources requires, romof parents aren't clones, so chains are at most three long
+            parent = games[romof]
+            self.assertNotIn("cloneof", parent["attrib"])
+            self.assertNotIn("romof", games.get(parent["attrib"].get("romof"), {"attrib": {}})["attrib"])
+            parent_roms = {rom["name"]: rom for rom in parent["roms"]}
+            for rom in game["roms"]:
+                if "merge" in rom:
+                    self.assertEqual(rom.get("crc"), parent_roms[rom["merge"]].get("crc"), name)
+
+    def test_versions_share_most_games(self):
+        dats = self.generate("mame", versions=2, games=2000, churn=0.1)
+        with redirect_stdout(StringIO()):
+            hashes = [
+                set(
+                    create_db.process_games(
+                        sources.get_dat_reader(path).iter_games(), create_db.get_emulator_attrs(path)
+                    )["games"]
+                )
+                for path in dats
+            ]
+        self.assertAlmostEqual(len(hashes[0] & hashes[1]) / len(hashes[0]), 0.93, delta=0.02)
+        self.assertAlmostEqual(len(hashes[1]) / len(hashes[0]), 1.01, delta=0.01)
+
+    def test_logiqx_dats_are_read(self):
+        (dat_file,) = self.generate("logiqx", versions=1, games=100, dat_format="logiqx", compress=True)
+        self.assertEqual(os.path.basename(dat_file), "FBA 0.1.xml.bz2")
+        root = sources.get_dat_root(dat_file)
+        assert root is not None
+        self.assertEqual((root.tag, root[0].tag, root[1].tag), ("datafile", "header", "game"))
+        with redirect_stdout(StringIO()):
+            self.assertEqual(len(list(sources.get_dat_reader(dat_file).iter_games())), 100)
+
+    def test_builds_identify_every_game(self):
+        dats = self.generate("mame", versions=3, games=300, churn=0.2)
+        out_dir = os.path.join(self.temp_dir.name, "out")
+        with redirect_stdout(StringIO()):
+            create_db.process_dats_consecutively(dats, out_dir)
+        zip_specs = self.corpus.get_zip_specs()
+        self.assertEqual(len(zip_specs), len(read_games(dats[-1])))
+        self.assertEqual(synthetic_dats.find_unidentified(os.path.join(out_dir, "arcade.db"), zip_specs), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Compare the tree and records parse engines (see sources.PARSE_ENGINES) by parsing and processing DATs with each,
+and check that they give the same records.
+
+    python -m tests_db.benchmark_parsing [--type mame] [--start N] [--end N]
+"""
+
+import os
+import time
+import argparse
+import resource
+import multiprocessing
+
+from arcade_db import create_db
+from arcade_db.shared import sources
+
+
+def process_dat(job: tuple[str, str]) -> tuple[float, int, create_db.DatData]:
+    """Parse and process a DAT with an engine, in a fresh process so peak memory is the DAT's alone."""
+    dat_file, engine = job
+    sources.set_parse_engine(engine)
+    chunks = list(sources.iter_decompressed(dat_file))
+    reader = sources.PARSE_ENGINES[engine]
+    start = time.perf_counter()
+    dat_data = create_db.process_games(reader.iter_parsed(chunks), create_db.get_emulator_attrs(dat_file))
+    elapsed = time.perf_counter() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024, dat_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--type", "-t", dest="dat_type", default="mame", help="Dat type")
+    parser.add_argument("--start", "-s", default=0, type=int, help="Start DAT index")
+    parser.add_argument("--end", "-e", default=None, type=int, help="End DAT index")
+    args = parser.parse_args()
+
+    dats = [
+        dat for dat in sources.BUILD_DATS[args.dat_type][args.start : args.end] if sources.get_dat_format(dat) == "xml"
+    ]
+    totals = {engine: 0.0 for engine in sources.PARSE_ENGINES}
+    print(f"{'DAT':<32}" + "".join(f"{engine:>20}" for engine in sources.PARSE_ENGINES))
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        for dat_file in dats:
+            results = {engine: pool.apply(process_dat, ((dat_file, engine),)) for engine in sources.PARSE_ENGINES}
+            for engine, (elapsed, _, _) in results.items():
+                totals[engine] += elapsed
+            columns = "".join(f"{elapsed:>10.2f}s {peak:>6}MB" for elapsed, peak, _ in results.values())
+            dat_datas = [dat_data for _, _, dat_data in results.values()]
+            matches = all(dat_data == dat_datas[0] for dat_data in dat_datas)
+            print(f"{os.path.basename(dat_file):<32}{columns}{'' if matches else '  DIFFERENT RECORDS'}")
+    print(f"{'Total':<32}" + "".join(f"{total:>19.2f}s" for total in totals.values()))
+
+
+if __name__ == "__main__":
+    main()
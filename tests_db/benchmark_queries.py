@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Compare the per-object query helpers with the bulk queries against a full arcade.db, and per-lookup engines with
+the shared read-only engine.
+
+    python -m tests_db.benchmark_queries [--games N] [--repeat N]
+"""
+
+import os
+import argparse
+import timeit
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from arcade_db import queries
+from arcade_db.shared import db
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(SCRIPT_PATH, "..", "arcade-out", "arcade.db")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--db", default=DB_PATH, help="Database to query")
+    parser.add_argument("--games", type=int, default=2000, help="Number of games to look up")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs")
+    args = parser.parse_args()
+
+    session = db.get_read_session(args.db)
+    emulator = session.scalars(select(db.Emulator).where(db.Emulator.name == "MAME").order_by(db.Emulator.id.desc()))
+    emulator = emulator.first()
+    games = session.scalars(select(db.Game).order_by(db.Game.id).limit(args.games)).all()
+    game_ids = [game.id for game in games]
+    parent_names = list({game.cloneof for game in games if game.cloneof})
+    parents = session.scalars(select(db.Game).where(db.Game.name.in_(parent_names[: queries.IN_BATCH_SIZE]))).all()
+    lookup_hashes = [game.hash for game in games[:100]]
+
+    def lookup_with_new_engines():
+        for index_hash in lookup_hashes:
+            engine = create_engine(f"sqlite:///{args.db}")  # noqa: E231
+            with sessionmaker(bind=engine)() as lookup_session:
+                lookup_session.query(db.Game).filter(db.Game.hash == index_hash).one_or_none()
+            engine.dispose()
+
+    def lookup_with_read_sessions():
+        for index_hash in lookup_hashes:
+            db.get_read_session(args.db).query(db.Game).filter(db.Game.hash == index_hash).one_or_none()
+
+    print(f"{len(games)} games, {len(parents)} parents, emulator {emulator.name} {emulator.version}")
+
+    benchmarks = {
+        "100 lookups (new engines)": lookup_with_new_engines,
+        "100 lookups (read session)": lookup_with_read_sessions,
+        "emulators per game (loop)": lambda: [queries.get_compatible_emulators(session, game) for game in games],
+        "emulators per game (bulk)": lambda: queries.get_emulators_for_games(session, game_ids),
+        "clones (loop)": lambda: [queries.get_clones(session, parent, emulator) for parent in parents],
+        "clones (bulk)": lambda: queries.get_clones_for_parents(
+            session, [parent.name for parent in parents], emulator.id
+        ),
+        "game list (ORM)": lambda: queries.get_compatible_games(session, emulator),
+        "game list (rows)": lambda: queries.get_game_list(session, emulator.id),
+        "games with roms (lazy)": lambda: [len(game.roms) for game in queries.get_games(session, game_ids)],
+        "games with roms (eager)": lambda: [
+            len(game.roms) for game in queries.get_games(session, game_ids, eager=True)
+        ],
+    }
+    for name, benchmark in benchmarks.items():
+        times = []
+        for _ in range(args.repeat):
+            # Start each run with an empty identity map, so ORM objects are loaded rather than reused
+            session.expunge_all()
+            times.append(timeit.timeit(benchmark, number=1))
+        print(f"{name:<28}{min(times):>10.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Generate seeded synthetic DATs, MAME (listxml) or logiqx style, for testing builds, validation and identification
+at scales beyond the checked-in DATs.
+
+    python -m tests_db.synthetic_dats OUT_DIR [--versions 3] [--games 10000] [--format mame] [--build] [...]
+
+Each version of the emulator is the one before with some games removed, changed (a rom redumped or added, or the
+driver's status or the description changed) and added, so most games are identical across versions, as in the
+real DATs. Clones list the roms they share with their parent, and parents those they share with their BIOS, with
+merge attributes, so roms are shared between games too. The same seed and options always give the same DATs.
+
+The DATs keep to the rules validate_sources checks: clones' parents are never clones, nor are romof parents, and
+romof chains (clone, parent, BIOS) are at most three long.
+
+With --build, a database is built from the DATs (in OUT_DIR/arcade-out) and every game of the last version is
+looked up in it by its zip's roms, as `rominfo.py file` would.
+"""
+
+from typing import Any, Optional
+import os
+import bz2
+import json
+import time
+import random
+import hashlib
+import argparse
+import resource
+from xml.sax.saxutils import escape, quoteattr
+
+from sqlalchemy import select
+
+from arcade_db import create_db
+from arcade_db.shared import db, indexing
+
+Game = dict[str, Any]
+ZipSpecs = dict[str, list[dict[str, Any]]]
+
+DAT_FORMATS = ("mame", "logiqx")
+EMULATORS = {"mame": "MAME", "logiqx": "FBA"}
+
+DEFAULT_VERSIONS = 3
+DEFAULT_GAMES = 10_000
+DEFAULT_ROMS_PER_GAME = 8
+DEFAULT_CLONE_RATIO = 0.4
+DEFAULT_ROMOF_RATIO = 0.3
+DEFAULT_DISK_RATIO = 0.02
+DEFAULT_FEATURE_RATIO = 0.2
+DEFAULT_DRIVER_RATIO = 1.0
+DEFAULT_NODUMP_RATIO = 0.01
+DEFAULT_CHURN = 0.05
+
+# How a version's churn is made up
+REMOVED_SHARE = 0.2
+CHANGED_SHARE = 0.5
+ADDED_SHARE = 0.3
+
+GAMES_PER_BIOS = 500
+# Chance of a clone sharing each of its parent's roms
+SHARED_ROM_RATIO = 0.7
+
+SYLLABLES = ("ka", "to", "ri", "zen", "mo", "ga", "shi", "ra", "bo", "ne", "tu", "xe", "dra", "qu", "lo", "vi")
+MANUFACTURERS = ("Sega", "Namco", "Capcom", "Konami", "Taito", "SNK", "Atari", "Williams", "Irem", "Data East")
+CLONE_REGIONS = {"j": "Japan", "u": "US", "a": "Asia", "e": "Europe", "b": "bootleg", "h": "hack"}
+ROM_REGIONS = ("p", "c", "s", "m", "v", "ic")
+ROM_SIZE_POWERS = (10, 22)
+DRIVER_STATUSES = ("good", "imperfect", "preliminary")
+FEATURE_TYPES = ("graphics", "sound", "controls", "protection", "timing")
+FEATURE_STATUSES = ("imperfect", "unemulated")
+CHANGES = ("redump", "add_rom", "driver", "description")
+
+
+class SyntheticCorpus:
+    """
+    The games of a synthetic emulator, evolving from version to version with evolve. Roms are held as
+    [name, size, content, merge], where content is None for a rom not dumped and otherwise numbers the rom's data,
+    from which its CRC and sha1 are derived.
+    """
+
+    def __init__(
+        self,
+        games: int = DEFAULT_GAMES,
+        roms_per_game: int = DEFAULT_ROMS_PER_GAME,
+        clone_ratio: float = DEFAULT_CLONE_RATIO,
+        romof_ratio: float = DEFAULT_ROMOF_RATIO,
+        disk_ratio: float = DEFAULT_DISK_RATIO,
+        feature_ratio: float = DEFAULT_FEATURE_RATIO,
+        driver_ratio: float = DEFAULT_DRIVER_RATIO,
+        nodump_ratio: float = DEFAULT_NODUMP_RATIO,
+        churn: float = DEFAULT_CHURN,
+        seed: int = 0,
+    ):
+        self.roms_per_game = roms_per_game
+        self.clone_ratio = clone_ratio
+        self.romof_ratio = romof_ratio
+        self.disk_ratio = disk_ratio
+        self.feature_ratio = feature_ratio
+        self.driver_ratio = driver_ratio
+        self.nodump_ratio = nodump_ratio
+        self.churn = churn
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.games: dict[str, Game] = {}
+        # Each parent's clones
+        self.clones: dict[str, list[str]] = {}
+        self.names = 0
+        self.contents = 0
+        self.bioses = [self.add_bios() for _ in range(max(1, games // GAMES_PER_BIOS))]
+        parents: list[str] = []
+        while len(self.games) < games:
+            self.add_game(parents)
+
+    def get_name(self) -> str:
+        self.names += 1
+        return f"{self.rng.choice(SYLLABLES)}{self.rng.choice(SYLLABLES)}{self.names:x}"
+
+    def get_description(self) -> str:
+        words = ("".join(self.rng.choices(SYLLABLES, k=self.rng.randint(2, 4))) for _ in range(self.rng.randint(1, 3)))
+        return " ".join(word.capitalize() for word in words)
+
+    def get_content(self) -> Optional[int]:
+        if self.rng.random() < self.nodump_ratio:
+            return None
+        self.contents += 1
+        return self.contents
+
+    def get_rom(self, game_name: str, index: int) -> list[Any]:
+        region = ROM_REGIONS[index % len(ROM_REGIONS)]
+        return [f"{game_name}.{region}{index}", 2 ** self.rng.randint(*ROM_SIZE_POWERS), self.get_content(), None]
+
+    def get_rom_hashes(self, content: int) -> tuple[str, str]:
+        """Return a rom's CRC and sha1, which are the same wherever its content is."""
+        sha1 = hashlib.sha1(f"{self.seed}/{content}".encode()).hexdigest()
+        return sha1[:8], sha1
+
+    def get_empty_game(self, name: str) -> Game:
+        return {
+            "name": name,
+            "description": self.get_description(),
+            "year": str(self.rng.randint(1975, 2015)),
+            "manufacturer": self.rng.choice(MANUFACTURERS),
+            "cloneof": None,
+            "romof": None,
+            "isbios": False,
+            "roms": [],
+            "disks": [],
+            "features": [],
+            "driver": None,
+        }
+
+    def add_own_roms(self, game: Game, count: int) -> None:
+        start = len(game["roms"])
+        game["roms"].extend(self.get_rom(game["name"], index) for index in range(start, start + count))
+
+    def add_extras(self, game: Game) -> None:
+        if self.rng.random() < self.disk_ratio:
+            game["disks"].append([f"{game['name']}-hdd", self.get_content()])
+        if self.rng.random() < self.feature_ratio:
+            feature_types = self.rng.sample(FEATURE_TYPES, self.rng.randint(1, 2))
+            game["features"] = [[feature_type, self.rng.choice(FEATURE_STATUSES)] for feature_type in feature_types]
+        if self.rng.random() < self.driver_ratio:
+            game["driver"] = self.get_driver()
+
+    def get_driver(self) -> list[str]:
+        status = self.rng.choices(DRIVER_STATUSES, weights=(6, 3, 1))[0]
+        return [status, status, self.rng.choice(("supported", "unsupported"))]
+
+    def add_bios(self) -> str:
+        game = self.get_empty_game(f"{self.get_name()}bios")
+        game["isbios"] = True
+        self.add_own_roms(game, self.rng.randint(1, 4))
+        if self.rng.random() < self.driver_ratio:
+            game["driver"] = self.get_driver()
+        self.games[game["name"]] = game
+        return game["name"]
+
+    def add_game(self, parents: list[str]) -> None:
+        """Add a parent, or a clone of one of parents."""
+        if parents and self.rng.random() < self.clone_ratio:
+            self.add_clone(self.rng.choice(parents))
+            return
+        game = self.get_empty_game(self.get_name())
+        if self.rng.random() < self.romof_ratio:
+            game["romof"] = self.rng.choice(self.bioses)
+            game["roms"] = [[rom[0], rom[1], rom[2], rom[0]] for rom in self.games[game["romof"]]["roms"]]
+        self.add_own_roms(game, self.rng.randint(1, 2 * self.roms_per_game - 1))
+        self.add_extras(game)
+        self.games[game["name"]] = game
+        parents.append(game["name"])
+
+    def add_clone(self, parent_name: str) -> None:
+        parent = self.games[parent_name]
+        suffix = self.rng.choice(list(CLONE_REGIONS))
+        name = f"{parent_name}{suffix}"
+        while name in self.games:
+            name = f"{parent_name}{suffix}{self.get_name()[-3:]}"
+        game = self.get_empty_game(name)
+        game.update(
+            description=f"{parent['description']} ({CLONE_REGIONS[suffix]})",
+            year=parent["year"],
+            manufacturer=parent["manufacturer"],
+            cloneof=parent_name,
+            romof=parent_name,
+        )
+        game["roms"] = [
+            [rom[0], rom[1], rom[2], rom[0]] for rom in parent["roms"] if self.rng.random() < SHARED_ROM_RATIO
+        ]
+        self.add_own_roms(game, self.rng.randint(1, max(1, self.roms_per_game // 2)))
+        self.add_extras(game)
+        self.games[name] = game
+        self.clones.setdefault(parent_name, []).append(name)
+
+    def remove_game(self, name: str) -> None:
+        game = self.games.pop(name)
+        if game["cloneof"] is not None:
+            self.clones[game["cloneof"]].remove(name)
+
+    def change_game(self, name: str) -> None:
+        game = self.games[name]
+        change = self.rng.choice(CHANGES)
+        own_roms = [rom for rom in game["roms"] if rom[3] is None and rom[2] is not None]
+        if change == "redump" and own_roms:
+            rom = self.rng.choice(own_roms)
+            self.contents += 1
+            rom[2] = self.contents
+            # Clones which share the rom share the redump
+            for clone_name in self.clones.get(name, []):
+                for clone_rom in self.games[clone_name]["roms"]:
+                    if clone_rom[3] == rom[0]:
+                        clone_rom[2] = rom[2]
+        elif change in ("redump", "add_rom"):
+            self.add_own_roms(game, 1)
+        elif change == "driver":
+            game["driver"] = self.get_driver()
+        else:
+            game["description"] = self.get_description()
+
+    def evolve(self) -> dict[str, int]:
+        """Make the next version, returning how many games were removed, changed and added."""
+        num_games = len(self.games)
+        counts = {
+            "removed": round(num_games * self.churn * REMOVED_SHARE),
+            "changed": round(num_games * self.churn * CHANGED_SHARE),
+            "added": round(num_games * self.churn * ADDED_SHARE),
+        }
+        # Parents are only removed once they have no clones
+        removable = [name for name, game in self.games.items() if not game["isbios"] and not self.clones.get(name)]
+        for name in self.rng.sample(removable, min(counts["removed"], len(removable))):
+            self.remove_game(name)
+        changeable = [name for name, game in self.games.items() if not game["isbios"]]
+        for name in self.rng.sample(changeable, min(counts["changed"], len(changeable))):
+            self.change_game(name)
+        parents = [name for name, game in self.games.items() if not game["isbios"] and game["cloneof"] is None]
+        for _ in range(counts["added"]):
+            self.add_game(parents)
+        return counts
+
+    def get_rom_xml(self, rom: list[Any]) -> str:
+        name, size, content, merge = rom
+        attrs = f"name={quoteattr(name)}" + (f" merge={quoteattr(merge)}" if merge is not None else "")
+        if content is None:
+            return f'<rom {attrs} size="{size}" status="nodump"/>'
+        crc, sha1 = self.get_rom_hashes(content)
+        return f'<rom {attrs} size="{size}" crc="{crc}" sha1="{sha1}"/>'
+
+    def get_game_xml(self, game: Game, tag: str) -> str:
+        attrs = f"name={quoteattr(game['name'])}"
+        if game["isbios"]:
+            attrs += ' isbios="yes"'
+        for key in ("cloneof", "romof"):
+            if game[key] is not None:
+                attrs += f" {key}={quoteattr(game[key])}"
+        lines = [
+            f"\t<{tag} {attrs}>",
+            f"\t\t<description>{escape(game['description'])}</description>",
+            f"\t\t<year>{game['year']}</year>",
+            f"\t\t<manufacturer>{escape(game['manufacturer'])}</manufacturer>",
+        ]
+        lines.extend(f"\t\t{self.get_rom_xml(rom)}" for rom in game["roms"])
+        for name, content in game["disks"]:
+            if content is None:
+                lines.append(f'\t\t<disk name={quoteattr(name)} status="nodump" region="ide:0:hdd:image" index="0"/>')
+            else:
+                sha1 = self.get_rom_hashes(content)[1]
+                lines.append(f'\t\t<disk name={quoteattr(name)} sha1="{sha1}" region="ide:0:hdd:image" index="0"/>')
+        if game["driver"] is not None:
+            status, emulation, savestate = game["driver"]
+            lines.append(f'\t\t<driver status="{status}" emulation="{emulation}" savestate="{savestate}"/>')
+        lines.extend(f'\t\t<feature type="{kind}" status="{status}"/>' for kind, status in game["features"])
+        lines.append(f"\t</{tag}>\n")
+        return "\n".join(lines)
+
+    def write_dat(self, path: str, dat_format: str = "mame", version: str = "0.1") -> None:
+        """Write the current version as a DAT, compressed with bzip2 if path ends with .bz2."""
+        open_dat = bz2.open if path.endswith(".bz2") else open
+        with open_dat(path, "wt", encoding="utf-8") as dat_file:
+            dat_file.write('<?xml version="1.0"?>\n')
+            if dat_format == "mame":
+                dat_file.write(f'<mame build="{version} (synthetic)" debug="no" mameconfig="10">\n')
+            else:
+                dat_file.write(f"<datafile>\n\t<header>\n\t\t<name>{EMULATORS[dat_format]}</name>\n")
+                dat_file.write(f"\t\t<version>{version}</version>\n\t</header>\n")
+            tag = "machine" if dat_format == "mame" else "game"
+            for name in sorted(self.games):
+                dat_file.write(self.get_game_xml(self.games[name], tag))
+            dat_file.write("</mame>\n" if dat_format == "mame" else "</datafile>\n")
+
+    def get_zip_specs(self) -> ZipSpecs:
+        """Return the files of each game's zip (non-merged, so with its parent's and BIOS's roms too)."""
+        return {
+            f"{name}.zip": [
+                {"name": rom[0], "size": rom[1], "crc": int(self.get_rom_hashes(rom[2])[0], 16)}
+                for rom in game["roms"]
+                if rom[2] is not None
+            ]
+            for name, game in self.games.items()
+        }
+
+
+def get_dat_name(emulator: str, version: str, compress: bool = False) -> str:
+    return f"{emulator} {version}.xml" + (".bz2" if compress else "")
+
+
+def generate_dats(
+    out_dir: str,
+    versions: int = DEFAULT_VERSIONS,
+    dat_format: str = "mame",
+    compress: bool = False,
+    **options: Any,
+) -> tuple[list[str], SyntheticCorpus]:
+    """
+    Write `versions` DATs to out_dir, with the SyntheticCorpus options, returning their paths (in order) and the
+    corpus as of the last.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    corpus = SyntheticCorpus(**options)
+    paths = []
+    for index in range(versions):
+        if index:
+            counts = corpus.evolve()
+            print(f"Version {index + 1}: {', '.join(f'{count} {change}' for change, count in counts.items())}")
+        version = f"0.{index + 1}"
+        paths.append(os.path.join(out_dir, get_dat_name(EMULATORS[dat_format], version, compress)))
+        corpus.write_dat(paths[-1], dat_format, version)
+    return paths, corpus
+
+
+def find_unidentified(db_path: str, zip_specs: ZipSpecs) -> list[str]:
+    """Return the zips whose games aren't in the database at db_path."""
+    session = db.get_read_session(db_path)
+    hash_format = db.get_hash_format(session)
+    known: set[Any] = set(session.scalars(select(db.Game.hash)))
+    session.close()
+    unidentified = []
+    for zip_name, file_specs in zip_specs.items():
+        signature = indexing.get_roms_signature([dict(spec, crc=format(spec["crc"], "08x")) for spec in file_specs])
+        index_hash = indexing.get_game_index_hash(zip_name.split(".")[0], signature)
+        if indexing.encode_hash(index_hash, hash_format) not in known:
+            unidentified.append(zip_name)
+    return unidentified
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("out_dir", help="Directory to write the DATs to")
+    parser.add_argument("--versions", "-v", default=DEFAULT_VERSIONS, type=int, help="Number of versions (DATs)")
+    parser.add_argument("--games", "-g", default=DEFAULT_GAMES, type=int, help="Games in the first version")
+    parser.add_argument("--roms-per-game", default=DEFAULT_ROMS_PER_GAME, type=int, help="Mean roms of a parent")
+    parser.add_argument(
+        "--clone-ratio", default=DEFAULT_CLONE_RATIO, type=float, help="Share of games which are clones"
+    )
+    parser.add_argument("--romof-ratio", default=DEFAULT_ROMOF_RATIO, type=float, help="Share of parents with a BIOS")
+    parser.add_argument("--disk-ratio", default=DEFAULT_DISK_RATIO, type=float, help="Share of games with a disk")
+    parser.add_argument("--feature-ratio", default=DEFAULT_FEATURE_RATIO, type=float, help="Share with features")
+    parser.add_argument("--driver-ratio", default=DEFAULT_DRIVER_RATIO, type=float, help="Share with a driver")
+    parser.add_argument("--nodump-ratio", default=DEFAULT_NODUMP_RATIO, type=float, help="Share of roms not dumped")
+    parser.add_argument("--churn", default=DEFAULT_CHURN, type=float, help="Share of games changed per version")
+    parser.add_argument("--format", "-f", dest="dat_format", default="mame", choices=DAT_FORMATS, help="DAT format")
+    parser.add_argument("--compress", action="store_true", help="Compress DATs with bzip2, as the real DATs are")
+    parser.add_argument("--seed", default=0, type=int, help="Random seed")
+    parser.add_argument("--zip-specs", default=None, help="Write the last version's zip specs to this JSON file")
+    parser.add_argument("--build", action="store_true", help="Build a database from the DATs and identify games")
+    parser.add_argument("--processes", "-p", default=1, type=int, help="With --build, processes to build with")
+    args = parser.parse_args()
+
+    options = {
+        key: getattr(args, key)
+        for key in (
+            "games",
+            "roms_per_game",
+            "clone_ratio",
+            "romof_ratio",
+            "disk_ratio",
+            "feature_ratio",
+            "driver_ratio",
+            "nodump_ratio",
+            "churn",
+            "seed",
+        )
+    }
+    start = time.perf_counter()
+    dats, corpus = generate_dats(args.out_dir, args.versions, args.dat_format, args.compress, **options)
+    size = sum(os.path.getsize(dat_file) for dat_file in dats) / (1024 * 1024)
+    print(f"Wrote {len(dats)} DATs ({size:,.1f}MB) in {time.perf_counter() - start:.1f}s")
+    zip_specs = corpus.get_zip_specs()
+    if args.zip_specs is not None:
+        with open(args.zip_specs, "w") as json_file:
+            json.dump(zip_specs, json_file)
+
+    if args.build:
+        build_dir = os.path.join(args.out_dir, "arcade-out")
+        start = time.perf_counter()
+        if args.processes > 1:
+            create_db.process_dats_parallel(dats, build_dir, args.processes)
+        else:
+            create_db.process_dats_consecutively(dats, build_dir)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+        print(f"Built {len(dats)} DATs in {time.perf_counter() - start:.1f}s, the build process peaking at {peak}MB")
+        unidentified = find_unidentified(os.path.join(build_dir, "arcade.db"), zip_specs)
+        print(f"Identified {len(zip_specs) - len(unidentified)} of {len(zip_specs)} games in the last version")
+        if unidentified:
+            print(f"Not identified: {unidentified[:20]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,7 @@ import json
 import logging
 import glob
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from arcade_db import snapshot
 from arcade_db.shared import db, indexing
 
 logging.basicConfig(level=logging.INFO)
@@ -13,14 +12,12 @@ logging.basicConfig(level=logging.INFO)
 SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
 FIXTURES_PATH = os.path.join(SCRIPT_PATH, "fixtures")
 DB_PATH = os.path.join(SCRIPT_PATH, "..", "arcade-out", "arcade.db")
+SNAPSHOT_PATH = os.path.join(SCRIPT_PATH, "..", "arcade-out", snapshot.SNAPSHOT_NAME)
 
 
 class TestDb(unittest.TestCase):
     def setUp(self):
-        engine = create_engine(f"sqlite:///{DB_PATH}")  # noqa: E231
-        db.Base.metadata.create_all(engine)
-        Session = sessionmaker(bind=engine)
-        self.session = Session()
+        self.session = db.get_read_session(DB_PATH)
         self.fixtures = {}
         json_files = glob.glob(os.path.join(FIXTURES_PATH, "*.json"))
 
@@ -56,5 +53,22 @@ class TestDb(unittest.TestCase):
                     )  # noqa: E713
                 logging.info(f"Successfully tested {len(zip_specs)} zips from {fixture_name}")
 
+    @unittest.skipUnless(os.path.exists(SNAPSHOT_PATH), "built without the snapshot stage")
+    def test_game_matching_all_fixtures_snapshot(self):
+        """Test that games from all fixtures can be found in the snapshot."""
+        with snapshot.Snapshot(SNAPSHOT_PATH) as game_snapshot:
+            for fixture_name, zip_specs in self.fixtures.items():
+                with self.subTest(fixture=fixture_name):
+                    not_found = []
+                    for name, file_specs in zip_specs.items():
+                        signature = indexing.get_roms_signature(file_specs)
+                        index_hash = indexing.get_game_index_hash(name.split(".")[0], signature)
+                        if game_snapshot.find_game(index_hash) is None:
+                            not_found.append(name)
+                    if not_found:
+                        self.fail(
+                            f"The following games from {fixture_name} were not found in the snapshot: {not_found}"
+                        )
+
     def tearDown(self):
         self.session.rollback()